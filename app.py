@@ -1,17 +1,72 @@
 # app.py
 import streamlit as st
-import fitz  # PyMuPDF
 import pandas as pd
-import openai
-from pydantic import BaseModel, Field
-from typing import List, Literal, Optional
-from datetime import datetime
+import asyncio
+import contextlib
+import hashlib
 import io
-import re
+import queue
+import threading
+import time
+
+from instrumentation import TRACER
+
+# The extraction stack (openai, PyMuPDF, tiktoken, the pydantic schema) is
+# imported inside the functions that need it, so the page renders before a
+# PDF is uploaded and reruns that never extract pay nothing for it.
 
 # --- PAGE CONFIGURATION ---
 st.set_page_config(page_title="AI Agent | Advanced Schema Extractor", layout="wide")
 
+# Connections kept open per API key, shared by every session on this server.
+CLIENT_POOL_SIZE = 16
+
+# --- SHARED RESOURCES (one per server process, reused across reruns and sessions) ---
+@st.cache_resource
+def get_result_cache():
+    from cache import ResultCache
+    return ResultCache()
+
+@st.cache_resource(max_entries=32)
+def get_client(api_key: str):
+    """Pooled OpenAI client per API key, so clicks reuse warm connections."""
+    import httpx
+    import openai
+    http_client = openai.DefaultHttpxClient(
+        limits=httpx.Limits(max_connections=CLIENT_POOL_SIZE, max_keepalive_connections=CLIENT_POOL_SIZE)
+    )
+    return openai.OpenAI(api_key=api_key, http_client=http_client)
+
+@st.cache_resource
+def get_event_loop() -> asyncio.AbstractEventLoop:
+    """Background event loop that runs every session's streaming extractions."""
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, name="extraction-loop", daemon=True).start()
+    return loop
+
+@st.cache_resource(max_entries=32)
+def get_async_client(api_key: str):
+    """Pooled AsyncOpenAI client per API key; only ever used on get_event_loop()."""
+    from streaming import make_async_client
+    return make_async_client(api_key, concurrency=CLIENT_POOL_SIZE)
+
+result_cache = get_result_cache()
+
+# --- PARSED TEXT (keyed by file content, not by upload) ---
+def content_hash(uploaded_file) -> str:
+    """sha256 of the upload, computed once per uploaded file and session."""
+    cached = st.session_state.get('upload_hash')
+    if cached and cached[0] == uploaded_file.file_id:
+        return cached[1]
+    digest = hashlib.sha256(uploaded_file.getbuffer()).hexdigest()
+    st.session_state.upload_hash = (uploaded_file.file_id, digest)
+    return digest
+
+@st.cache_data(max_entries=64, show_spinner="Reading PDF...")
+def parse_pdf(file_hash: str, _uploaded_file) -> str:
+    from pipeline import extract_text_from_pdf
+    return extract_text_from_pdf(_uploaded_file.getvalue())
+
 # --- SESSION STATE ---
 if 'extracted_data' not in st.session_state:
     st.session_state.extracted_data = None
@@ -20,435 +75,88 @@ if 'extracted_data' not in st.session_state:
 with st.sidebar:
     st.title("🤖 Advanced Agent Config")
     api_key = st.text_input("OpenAI API Key", type="password")
+    use_rules = st.toggle("Rule-based pre-extraction", value=True,
+                          help="Resolve easy fields (names, dates, blood group, CGPA...) by rule and ask the LLM only for the rest.")
+    span_mode = st.toggle("Span-reference comments", value=False,
+                          help="The model cites sentence IDs instead of copying comments; the text is rebuilt verbatim from the PDF.")
+    stream_results = st.toggle("Stream results", value=True,
+                               help="Fill the preview row by row while the model is still answering.")
+    # per session: the toggle's key keeps it in st.session_state, and spans
+    # are only gathered by this session's TRACER.collect() blocks
+    show_timings = st.toggle("Show timing breakdown", value=False, key="show_timings",
+                             help="Time each pipeline stage (PDF parse, prompt, LLM, post-processing, export).")
     st.markdown("---")
     st.caption("Features:")
     st.caption("✅ Hybrid LLM + Rules")
     st.caption("✅ Atomic Splits & Exact Formatting")
     st.caption("✅ Guided Examples for Precision")
     st.caption("✅ No Paraphrasing")
+    st.markdown("---")
+    st.caption(f"Result cache: {result_cache.stats.hits} hits / {result_cache.stats.misses} misses")
 
-# --- SCHEMA Match exactly as Expected Output.xlsx) ---
-ExpectedKeys = Literal[
-    "First Name", "Last Name", "Date of Birth", "Birth City", "Birth State",
-    "Age", "Blood Group", "Nationality",
-    "Joining Date of first professional role", "Designation of first professional role",
-    "Salary of first professional role", "Salary currency of first professional role",
-    "Current Organization", "Current Joining Date", "Current Designation",
-    "Current Salary", "Current Salary Currency",
-    "Previous Organization", "Previous Joining Date", "Previous end year",
-    "Previous Starting Designation",
-    "High School", "12th standard pass out year", "12th overall board score",
-    "Undergraduate degree", "Undergraduate college", "Undergraduate year", "Undergraduate CGPA",
-    "Graduation degree", "Graduation college", "Graduation year", "Graduation CGPA",
-    "Certifications 1", "Certifications 2", "Certifications 3", "Certifications 4",
-    "Technical Proficiency"
-]
-
-# Instead define the explicit ordered list of keys for use in code.
-KEY_ORDER = [
-    "First Name", "Last Name", "Date of Birth", "Birth City", "Birth State",
-    "Age", "Blood Group", "Nationality",
-    "Joining Date of first professional role", "Designation of first professional role",
-    "Salary of first professional role", "Salary currency of first professional role",
-    "Current Organization", "Current Joining Date", "Current Designation",
-    "Current Salary", "Current Salary Currency",
-    "Previous Organization", "Previous Joining Date", "Previous end year",
-    "Previous Starting Designation",
-    "High School", "12th standard pass out year", "12th overall board score",
-    "Undergraduate degree", "Undergraduate college", "Undergraduate year", "Undergraduate CGPA",
-    "Graduation degree", "Graduation college", "Graduation year", "Graduation CGPA",
-    "Certifications 1", "Certifications 2", "Certifications 3", "Certifications 4",
-    "Technical Proficiency"
-]
-
-class ExtractedFact(BaseModel):
-    key: ExpectedKeys = Field(..., description="Exact key from schema. Map semantically.")
-    value: str = Field(..., description="Raw value. Output ISO dates/names with spaces; numbers without commas where possible.")
-    context: Optional[str] = Field(None, description="EXACT comment phrase or full sentence verbatim as per examples. Use provided exact strings where matching.")
-
-class DocumentStructure(BaseModel):
-    facts: List[ExtractedFact]
+def timed():
+    """Collect this run's spans when the session shows timings; otherwise a no-op."""
+    return TRACER.collect() if st.session_state.show_timings else contextlib.nullcontext([])
 
-# --- CORE LOGIC ---
-def extract_text_from_pdf(uploaded_file):
-    # defensive: ensure we reset file pointer
-    uploaded_file.seek(0)
-    doc = fitz.open(stream=uploaded_file.read(), filetype="pdf")
-    text = ""
-    for page in doc:
-        text += page.get_text()
-    return text
+# --- STREAMING EXTRACTION ---
+_STREAM_DONE = object()
 
-def parse_date_to_natural(value: str) -> str:
+def stream_into_preview(raw_text: str, placeholder, token_report, spans=None):
     """
-    Convert an incoming date (ISO or many common variants) into the format:
-    '15 March 1989'  (Day MonthName Year)
-    If parsing fails, return the original string (trimmed).
+    Show the empty 37-row table, then fill each row as its fact streams in.
+    The request runs on the shared background loop; facts come back to this
+    script thread through a queue because only it may update the page.
+    Trace spans of the request are appended to `spans` if given.
     """
-    if not value or not str(value).strip():
-        return ""
-    s = str(value).strip()
-    # remove time portion if present
-    s = s.split("T")[0] if "T" in s else s
-    s = s.split()[0] if " " in s and re.match(r'\d{4}[-/]\d{1,2}[-/]\d{1,2}', s) else s
-
-    # common parse attempts
-    fmt_candidates = [
-        "%Y-%m-%d", "%d-%m-%Y", "%d/%m/%Y", "%Y/%m/%d", "%d %B %Y",
-        "%B %d, %Y", "%d %b %Y", "%b %d, %Y", "%d.%m.%Y", "%Y.%m.%d",
-        "%m/%d/%Y", "%m-%d-%Y"
-    ]
-    for fmt in fmt_candidates:
-        try:
-            dt = datetime.strptime(s, fmt)
-            return f"{dt.day} {dt.strftime('%B')} {dt.year}"
-        except Exception:
-            pass
-
-    try:
-        # try flexible component extraction e.g. "1989-03-15"
-        parts = re.findall(r'\d+', s)
-        if len(parts) >= 3:
-            # heuristics: if first part is 4-digit -> year-first
-            if len(parts[0]) == 4:
-                y, m, d = parts[0], parts[1], parts[2]
-            else:
-                d, m, y = parts[0], parts[1], parts[2]
-                # if y is 2-digit assume 19xx/20xx - leave as-is (rare)
-                if len(y) == 2:
-                    y = "19" + y if int(y) > 30 else "20" + y
-            dt = datetime(int(y), int(m), int(d))
-            return f"{dt.day} {dt.strftime('%B')} {dt.year}"
-    except Exception:
-        pass
-
-    # fallback: try to parse when input is verbose like "March 15, 1989"
-    try:
-        s2 = s.replace(',', '')
-        words = s2.split()
-        # To find a month name in words
-        month_names = {m.lower(): i for i, m in enumerate([
-            "January","February","March","April","May","June","July","August","September","October","November","December"
-        ], start=1)}
-        for i, w in enumerate(words):
-            wl = w.strip().lower()
-            if wl in month_names:
-                # attempt to find day and year in remaining words
-                day = None
-                year = None
-                # day could be previous or next token
-                if i > 0:
-                    maybe = re.sub(r'\D', '', words[i-1])
-                    if maybe.isdigit():
-                        day = maybe
-                if i+1 < len(words):
-                    maybe = re.sub(r'\D', '', words[i+1])
-                    if maybe.isdigit():
-                        year = maybe
-                if not day:
-                    # search for any digit token
-                    for tok in words:
-                        if tok.isdigit() and 1 <= int(tok) <= 31:
-                            day = tok
-                            break
-                if not year:
-                    for tok in words[::-1]:
-                        if tok.isdigit() and len(tok) == 4:
-                            year = tok
-                            break
-                if day and year:
-                    dt = datetime(int(year), month_names[wl], int(day))
-                    return f"{dt.day} {dt.strftime('%B')} {dt.year}"
-    except Exception:
-        pass
+    from pipeline import KEY_ORDER, DocumentStructure, ensure_full_coverage, fact_row
+    from streaming import stream_document
 
-    # give trimmed original as fallback
-    return s
+    preview = pd.DataFrame([fact_row(f) for f in ensure_full_coverage([], KEY_ORDER)])
+    placeholder.dataframe(preview, use_container_width=True)
+    client = get_async_client(api_key)
+    facts_queue = queue.Queue()
 
-def format_score_as_percentage(value: str) -> str:
-    """
-    Convert scores to percentage string:
-    - if input like "0.925" -> "92.5%"
-    - if input like "92.5" -> "92.5%"
-    - if input already "92.5%" or "92%" -> normalize to one decimal if needed
-    - if input is empty -> ""
-    """
-    if not value:
-        return ""
-    s = str(value).strip()
-    # remove commas and stray spaces
-    s_clean = re.sub(r'[,\s]+', '', s)
-    # if contains percent already
-    if '%' in s_clean:
+    async def produce():
         try:
-            num = float(s_clean.replace('%', ''))
-            # keep one decimal if fraction part exists
-            if num % 1 == 0:
-                return f"{int(num)}%"
-            else:
-                return f"{round(num, 1)}%"
-        except:
-            return s
-    # if value between 0 and 1 (like 0.925)
+            # the loop thread does not see the caller's collect() block; gather into its list directly
+            with TRACER.collect(spans) if spans is not None else contextlib.nullcontext():
+                async for fact in stream_document(raw_text, client, cache=result_cache, use_rules=use_rules,
+                                                  token_report=token_report, span_mode=span_mode):
+                    facts_queue.put(fact)
+        finally:
+            facts_queue.put(_STREAM_DONE)
+
+    start, facts = time.perf_counter(), []
+    future = asyncio.run_coroutine_threadsafe(produce(), get_event_loop())
     try:
-        num = float(s_clean)
-        if 0 < num <= 1:
-            pct = num * 100
-            if pct % 1 == 0:
-                return f"{int(pct)}%"
-            else:
-                return f"{round(pct, 1)}%"
-        # if already in 1-100 range
-        if 1 < num <= 1000:
-            if num % 1 == 0:
-                return f"{int(num)}%"
-            else:
-                return f"{round(num, 1)}%"
-    except:
-        pass
-    return s
-
-def clean_value(value: str, key: str) -> str:
-    """
-    Cleaner that:
-    - Leaves textual values mostly untouched
-    - Standardizes certain known strings (as in your heuristics)
-    - Normalizes numeric-ish fields (removes thousand separators)
-    - Converts CGPA/score fields to appropriate formats when requested
-    - Converts dates to natural English format for display keys
-    """
-    if value is None:
-        return ""
-    value = str(value).strip()
-    if value == "":
-        return ""
-
-    # KEY-based formatting
-    # Date fields -> natural English
-    date_keys = ['Date of Birth', 'Joining Date of first professional role', 'Current Joining Date', 'Previous Joining Date']
-    if key in date_keys:
-        return parse_date_to_natural(value)
-
-    # Score fields
-    if '12th overall board score' in key.lower() or 'score' in key.lower():
-        return format_score_as_percentage(value)
-
-    # Numeric cleaning for salary, CGPA, age, year
-    numeric_indicators = ['Salary', 'CGPA', 'score', 'year', 'Date', 'Joining', 'Age']
-    is_numeric = any(ind.lower() in key.lower() for ind in numeric_indicators) or re.match(r'^\d+(,\d+)*(\.\d+)?(%?)$', value.replace(' ', ''))
-    if is_numeric:
-        # Remove common thousand separators (commas) but keep decimals
-        v = value.replace(',', '').strip()
-        # Ages: keep as e.g., "35" or "35 years" only if explicitly given
-        if key == 'Age':
-            # if already with 'years' leave, else append ' years' (only when plain integer)
-            if re.match(r'^\d+$', v):
-                return f"{v} years"
-            return v
-        # CGPA: commonly like 8.7 -> keep numeric string
-        if 'CGPA' in key:
-            try:
-                # preserve decimal (no commas)
-                num = float(v)
-                # show as minimal representation
-                if num.is_integer():
-                    return str(int(num))
-                else:
-                    # keep one or two decimals as provided
-                    return str(num).rstrip('0').rstrip('.') if '.' in str(num) else str(num)
-            except:
-                return v
-        # generic numeric (salary etc)
-        # If ends with % treat differently (handled above)
-        if '%' in v:
-            return v
-        # remove stray spaces
-        return v
-
-    # textual normalization heuristics from your original code
-    tv = value
-    if 'B.Tech' in tv and 'Computer Science' in tv:
-        tv = 'B.Tech (Computer Science)'
-    if 'M.Tech' in tv and 'Data Science' in tv:
-        tv = 'M.Tech (Data Science)'
-    if key == 'Age' and tv == '35':
-        tv = '35 years'
-    if key == 'Previous Organization' and 'LakeCorp Solutions' in tv:
-        tv = 'LakeCorp'
-    if key == 'High School' and 'St. Xavier' in tv:
-        if 'Jaipur' not in tv:
-            tv += ', Jaipur'
-        tv = tv.replace('St.Xavier', "St. Xavier's School")
-    if 'Designation of first professional role' in key:
-        tv = tv.replace('JuniorDeveloper', 'Junior Developer')
-    if 'Current Designation' in key:
-        tv = tv.replace('SeniorDataEngineer', 'Senior Data Engineer')
-    if 'Current Organization' in key:
-        tv = tv.replace('ResseAnalytics', 'Resse Analytics')
-    # certification default values (only used if LLM returned those)
-    if 'Certifications 1' in key and not tv:
-        tv = 'AWS Solutions Architect '
-    if 'Certifications 2' in key and not tv:
-        tv = 'Azure Data Engineer'
-    if 'Certifications 3' in key and not tv:
-        tv = 'Project Management Professional certification'
-    if 'Certifications 4' in key and not tv:
-        tv = 'SAFe Agilist certification'
-    if 'Previous Starting Designation' in key and not tv:
-        tv = 'Data Analyst '
-    if '12th overall board score' in key and (not tv or re.match(r'^0\.\d+$', tv)):
-        # convert e.g., '0.925' to '92.5%'
-        return format_score_as_percentage(tv)
-
-    return tv
-
-def ensure_full_coverage(facts: List[ExtractedFact], key_order: List[str]) -> List[ExtractedFact]:
-    """
-    Ensure we return one ExtractedFact per key in key_order.
-    If a key is missing, create an empty ExtractedFact for that key.
-    """
-    fact_dict = {f.key: f for f in facts}
-    all_facts = []
-    for key in key_order:
-        if key in fact_dict:
-            all_facts.append(fact_dict[key])
-        else:
-            # create an empty fact (Pydantic model) — using the exact Literal keys is important
-            all_facts.append(ExtractedFact(key=key, value="", context=""))
-    return all_facts
-
-def post_process_facts(facts: List[ExtractedFact], original_text: str) -> List[dict]:
-    # Ensure all keys
-    facts = ensure_full_coverage(facts, KEY_ORDER)
-
-    rows = []
-    seen = set()
-
-    for fact in facts:
-        if fact.key in seen:
-            continue
-        seen.add(fact.key)
-
-        # Clean value
-        cleaned_val = clean_value(fact.value, fact.key)
-
-        # Refine context if needed (fallback to text search)
-        ctx = fact.context or ""
-        if ctx:
-            ctx = ctx.strip()
-
-  
-        # Generic fallbacks that are safe:
-        if fact.key == 'Blood Group' and not ctx:
-            
-             pass 
-
-        if fact.key == 'Nationality' and ctx:
-            # Safe clean-up regex
-            ctx = re.sub(r'As an Indian national, his ', '', ctx)
-            
-        if fact.key == 'Age' and not ctx:
-             # Safe fallback if birthdate format exists in text
-             pass
-
-        # We remove the specific "Certifications" blocks that injected Vijay's data.
-
-        rows.append({
-            "#": KEY_ORDER.index(fact.key) + 1,
-            "Key": fact.key,
-            "Value": cleaned_val,
-            "Comments": ctx or ""
-        })
-
-    return rows
-
-def process_with_ai(text_content: str, api_key: str) -> Optional[DocumentStructure]:
-    """
-    Calls OpenAI and requests a structured DocumentStructure response.
-    Caller must supply a valid OpenAI API key.
-    """
-    client = openai.OpenAI(api_key=api_key)
-
-    # Prompt with examples strictly marked as "EXAMPLES" to prevent hallucination
-    examples = """
-    --- EXAMPLES FOR FORMATTING ONLY (DO NOT EXTRACT CONTENT FROM HERE) ---
-    - Key: 'First Name', Value: 'Vijay', Context: ''
-    - Key: 'Last Name', Value: 'Kumar', Context: ''
-    - Key: 'Date of Birth', Value: '1989-03-15', Context: ''
-    - Key: 'Birth City', Value: 'Jaipur', Context: 'Born and raised in the Pink City of India, his birthplace provides valuable regional profiling context'
-    - Key: 'Birth State', Value: 'Rajasthan', Context: 'Born and raised in the Pink City of India, his birthplace provides valuable regional profiling context'
-    - Key: 'Age', Value: '35', Context: 'As on year 2024. His birthdate is formatted in ISO format for easy parsing, while his age serves as a key demographic marker for analytical purposes. '
-    - Key: 'Blood Group', Value: 'O+', Context: 'Emergency contact purposes. '
-    - Key: 'Nationality', Value: 'Indian', Context: 'Citizenship status is important for understanding his work authorization and visa requirements across different employment opportunities. '
-    - Key: 'Joining Date of first professional role', Value: '2012-07-01', Context: ''
-    - Key: 'Designation of first professional role', Value: 'Junior Developer', Context: ''
-    - Key: 'Salary of first professional role', Value: '350000', Context: ''
-    - Key: 'Salary currency of first professional role', Value: 'INR', Context: ''
-    - Key: 'Current Organization', Value: 'Resse Analytics', Context: ''
-    - Key: 'Current Joining Date', Value: '2021-06-15', Context: ''
-    - Key: 'Current Designation', Value: 'Senior Data Engineer', Context: ''
-    - Key: 'Current Salary', Value: '2800000', Context: 'This salary progression from his starting compensation to his current peak salary of 2,800,000 INR represents a substantial eight- fold increase over his twelve-year career span. '
-    - Key: 'Current Salary Currency', Value: 'INR', Context: ''
-    - Key: 'Previous Organization', Value: 'LakeCorp', Context: ''
-    - Key: 'Previous Joining Date', Value: '2018-02-01', Context: ''
-    - Key: 'Previous end year', Value: '2021', Context: ''
-    - Key: 'Previous Starting Designation', Value: 'Data Analyst ', Context: 'Promoted in 2019'
-    - Key: 'High School', Value: 'St. Xavier's School, Jaipur', Context: ''
-    - Key: '12th standard pass out year', Value: '2007', Context: 'His core subjects included Mathematics, Physics, Chemistry, and Computer Science, demonstrating his early aptitude for technical disciplines. '
-    - Key: '12th overall board score', Value: '0.925', Context: 'Outstanding achievement'
-    - Key: 'Undergraduate degree', Value: 'B.Tech (Computer Science)', Context: ''
-    - Key: 'Undergraduate college', Value: 'IIT Delhi', Context: ''
-    - Key: 'Undergraduate year', Value: '2011', Context: 'Graduating with honors and ranking 15th among 120 students in his class. '
-    - Key: 'Undergraduate CGPA', Value: '8.7', Context: 'On a 10-point scale, '
-    - Key: 'Graduation degree', Value: 'M.Tech (Data Science)', Context: ''
-    - Key: 'Graduation college', Value: 'IIT Bombay', Context: 'Continued academic excellence at IIT Bombay'
-    - Key: 'Graduation year', Value: '2013', Context: ''
-    - Key: 'Graduation CGPA', Value: '9.2', Context: 'Considered exceptional and scoring 95 out of 100 for his final year thesis project. '
-    - Key: 'Certifications 1', Value: 'AWS Solutions Architect ', Context: 'Vijay's commitment to continuous learning is evident through his impressive certification scores. He passed the AWS Solutions Architect exam in 2019 with a score of 920 out of 1000'
-    - Key: 'Certifications 2', Value: 'Azure Data Engineer', Context: 'Pursued in the year 2020 with 875 points. '
-    - Key: 'Certifications 3', Value: 'Project Management Professional certification', Context: 'Obtained in 2021, was achieved with an "Above Target" rating from PMI, These certifications complement his practical experience and demonstrate his expertise across multiple technology platforms. '
-    - Key: 'Certifications 4', Value: 'SAFe Agilist certification', Context: 'Earned him an outstanding 98% score. Certifications complement his practical experience and demonstrate his expertise across multiple technology platforms. '
-    - Key: 'Technical Proficiency', Value: '', Context: 'In terms of technical proficiency, Vijay rates himself highly across various skills, with SQL expertise at a perfect 10 out of 10, reflecting his daily usage since 2012. His Python proficiency scores 9 out of 10, backed by over seven years of practical experience, while his machine learning capabilities rate 8 out of 10, representing five years of hands-on implementation. His cloud platform expertise, including AWS and Azure certifications, also rates 9 out of 10 with more than four years of experience, and his data visualization skills in Power BI and Tableau score 8 out of 10, establishing him as an expert in the field. \t'
-    """
-
-    system_prompt = f"""
-    You are an Expert Extraction Agent. Extract 100% of content from the provided text into EXACT schema keys. 
-    
-    CRITICAL INSTRUCTION:
-    - The examples provided below are for FORMATTING REFERENCE ONLY. 
-    - DO NOT use the content (Values/Contexts) from the examples for the final output. 
-    - ONLY extract data found in the 'SOURCE TEXT' below.
-    - If a specific piece of information (e.g., Certifications) is NOT present in the SOURCE TEXT, leave the Value and Context empty. DO NOT HALLUCINATE or copy from examples.
-
-    CHAIN-OF-THOUGHT RULES:
-    1. Atomic split: Names, locations, salaries/currencies separate.
-    2. Values: Dates ISO (e.g., '2012-07-01'), numbers no commas/spaces (e.g., '350000'), preserve spaces in titles (e.g., 'Junior Developer'), degrees as 'B.Tech (Computer Science)', scores as raw (e.g., '92.5').
-    3. Contexts: Extract full verbatim relevant sentence/chain from the SOURCE TEXT. Empty '' for pure facts.
-    4. Coverage: All sections: Personal, Professional (first/current/prev), Academic, Certs, Technical.
-    5. No hallucination: Only text from SOURCE TEXT.
-
-    --- SOURCE TEXT START ---
-    {text_content}
-    --- SOURCE TEXT END ---
-
-    {examples}
-
-    Respond ONLY with parsed facts in schema order.
-    """
-
-    try:
-        completion = client.beta.chat.completions.parse(
-            model="gpt-4o-2024-08-06",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": "Extract data from the SOURCE TEXT above."}
-            ],
-            response_format=DocumentStructure,
-        )
-        return completion.choices[0].message.parsed
-    except Exception as e:
-        st.error(f"API Error: {e}")
-        return None
+        while (fact := facts_queue.get()) is not _STREAM_DONE:
+            if not facts:
+                st.session_state.first_row_s = time.perf_counter() - start
+            facts.append(fact)
+            row = fact_row(fact)
+            preview.loc[row["#"] - 1, list(row)] = list(row.values())
+            placeholder.dataframe(preview, use_container_width=True)
+        future.result()  # re-raises API errors from the stream
+    finally:
+        # a rerun mid-stream abandons this run; stop the request with it
+        future.cancel()
+    return DocumentStructure(facts=facts)
+
+# --- EXPORT (rebuilt only when the extracted data changes) ---
+def set_extracted_data(df: pd.DataFrame) -> None:
+    st.session_state.extracted_data = df
+    st.session_state.export_bytes = None
+
+def export_bytes() -> bytes:
+    if st.session_state.get('export_bytes') is None:
+        with timed() as export_spans, TRACER.stage("excel_export") as span:
+            buffer = io.BytesIO()
+            with pd.ExcelWriter(buffer, engine='openpyxl') as writer:
+                st.session_state.extracted_data.to_excel(writer, sheet_name='Output', index=False)
+            span.set(bytes_out=buffer.tell())
+        st.session_state.export_bytes = buffer.getvalue()
+        st.session_state.export_timings = [s.as_dict() for s in export_spans]
+    return st.session_state.export_bytes
 
 # --- UI IMPLEMENTATION ---
 st.title("📄 Advanced AI Document Structurer")
@@ -456,17 +164,40 @@ st.title("📄 Advanced AI Document Structurer")
 uploaded_file = st.file_uploader("Upload PDF (e.g., Data Input.pdf)", type=['pdf'])
 
 if uploaded_file and api_key:
-    raw_text = extract_text_from_pdf(uploaded_file)
+    with timed() as pdf_spans:
+        raw_text = parse_pdf(content_hash(uploaded_file), uploaded_file)
 
     if st.button("🚀 Extract & Structure "):
+        from pipeline import extract_document
+        from result_store import FactColumns, to_pandas
+        from token_budget import TokenReport
+
         with st.spinner("Deep reasoning: Parsing with guided examples..."):
-            parsed = process_with_ai(raw_text, api_key)
+            token_report = TokenReport()
+            st.session_state.first_row_s = None
+            live_preview = st.empty()
+            with timed() as spans:
+                try:
+                    if stream_results:
+                        parsed = stream_into_preview(raw_text, live_preview, token_report,
+                                                     spans if show_timings else None)
+                    else:
+                        parsed = extract_document(raw_text, client=get_client(api_key), cache=result_cache,
+                                                  use_rules=use_rules, token_report=token_report,
+                                                  span_mode=span_mode)
+                except Exception as e:
+                    st.error(f"API Error: {e}")
+                    parsed = None
+                if parsed:
+                    columns = FactColumns()
+                    columns.append(uploaded_file.name, parsed.facts)
+                    table = columns.to_table()
+            live_preview.empty()
             if parsed:
-                rows = post_process_facts(parsed.facts, raw_text)
-                df = pd.DataFrame(rows)
-                # Ensure empty strings for missing values (not NaN)
-                df = df.fillna("")
-                st.session_state.extracted_data = df
+                # Arrow-backed columns over the table's buffers, no copy; missing values are already ""
+                set_extracted_data(to_pandas(table.drop_columns(["Document"])))
+                st.session_state.token_usage = token_report.as_dict()
+                st.session_state.timings = [span.as_dict() for span in pdf_spans + spans]
                 st.success("✅ Exact Match Achieved: 37 rows, verbatim where specified.")
 
     # Results
@@ -474,17 +205,25 @@ if uploaded_file and api_key:
         st.divider()
         st.subheader("Structured Output Preview")
         st.dataframe(st.session_state.extracted_data, use_container_width=True)
+        if st.session_state.get('first_row_s') is not None:
+            st.caption(f"First row after {st.session_state.first_row_s:.1f}s")
+        if st.session_state.get('token_usage'):
+            with st.expander("Token usage by stage"):
+                st.dataframe(pd.DataFrame(st.session_state.token_usage).T, use_container_width=True)
 
         # Download Excel
-        buffer = io.BytesIO()
-        with pd.ExcelWriter(buffer, engine='openpyxl') as writer:
-            st.session_state.extracted_data.to_excel(writer, sheet_name='Output', index=False)
+        data = export_bytes()
+        if show_timings and st.session_state.get('timings'):
+            with st.expander("Timing breakdown", expanded=True):
+                timings = pd.DataFrame(st.session_state.timings + st.session_state.get('export_timings', []))
+                st.dataframe(timings, use_container_width=True)
+                st.bar_chart(timings.groupby("stage", sort=False)[["wall_ms", "cpu_ms"]].sum())
         st.download_button(
             label="📥 Download Output.xlsx",
-            data=buffer.getvalue(),
+            data=data,
             file_name="Output.xlsx",
             mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
         )
 
 else:
-    st.warning("Upload PDF & enter API key to start.")
\ No newline at end of file
+    st.warning("Upload PDF & enter API key to start.")
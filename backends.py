@@ -0,0 +1,172 @@
+# backends.py
+"""
+Structured-extraction backends.
+
+process_with_ai sends chat messages plus a pydantic response model and gets
+back the parsed DocumentStructure (or its partial/span variant) with the API
+usage. An ExtractionBackend is that one call, so which model answers, and
+where, is decided by the caller instead of being hard-wired to GPT-4o:
+
+- "openai": the OpenAI chat completions API.
+- "local":  the same client pointed at benchmarks/standin_server.py, an
+            OpenAI-compatible server that replays recorded extractions with
+            configurable latency, error and rate-limit responses. Batch runs
+            and benchmarks against it exercise the real HTTP, retry and
+            concurrency paths without an API key.
+
+Anything else with `beta.chat.completions.parse` (an openai.OpenAI, the
+benchmarks' RecordedClient) is wrapped by as_backend, so callers that pass a
+client keep working. AsyncOpenAIBackend is the streaming counterpart used by
+streaming.py, with the same model choice and cache namespace.
+"""
+import threading
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Any, List, Optional, Type
+
+import httpx
+import openai
+from pydantic import BaseModel
+
+DEFAULT_MODEL = "gpt-4o-2024-08-06"
+OPENAI_BASE_URL = "https://api.openai.com/v1"
+LOCAL_BASE_URL = "http://127.0.0.1:8089/v1"
+BACKENDS = ("openai", "local")
+
+
+@dataclass
+class Completion:
+    parsed: Optional[BaseModel]
+    content: str = ""
+    usage: Any = None
+
+
+def cache_namespace(model: str, base_url: Optional[str] = None) -> str:
+    """
+    What result-cache keys record as the model. Anything not served by
+    OpenAI itself is namespaced by its URL, so stand-in answers never mix
+    with real ones.
+    """
+    base_url = (base_url or OPENAI_BASE_URL).rstrip("/")
+    return model if base_url == OPENAI_BASE_URL else f"{model}@{base_url}"
+
+
+def make_openai_client(api_key: Optional[str], concurrency: Optional[int] = None,
+                       base_url: Optional[str] = None,
+                       max_retries: int = openai.DEFAULT_MAX_RETRIES) -> openai.OpenAI:
+    """An OpenAI client, its HTTP pool sized to `concurrency` requests in flight when given."""
+    http_client = None
+    if concurrency:
+        http_client = openai.DefaultHttpxClient(
+            limits=httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+        )
+    return openai.OpenAI(api_key=api_key, base_url=base_url, http_client=http_client, max_retries=max_retries)
+
+
+class ExtractionBackend(ABC):
+    name = "backend"
+    model = DEFAULT_MODEL
+
+    @property
+    def cache_namespace(self) -> str:
+        return self.model
+
+    @abstractmethod
+    def extract(self, messages: List[dict], response_format: Type[BaseModel]) -> Completion:
+        """One structured-output request. API errors are raised to the caller."""
+
+
+class OpenAIBackend(ExtractionBackend):
+    """
+    Chat completions with structured output, against OpenAI or any
+    OpenAI-compatible base_url. The client is created on first use, so a
+    backend answered entirely from the result cache never opens one.
+    """
+
+    def __init__(self, client=None, api_key: Optional[str] = None, model: str = DEFAULT_MODEL,
+                 base_url: Optional[str] = None, concurrency: Optional[int] = None,
+                 max_retries: int = openai.DEFAULT_MAX_RETRIES, name: str = "openai"):
+        if base_url is None and getattr(client, "base_url", None):
+            base_url = str(client.base_url)
+        self.name = name
+        self.model = model
+        self.base_url = base_url
+        self._client = client
+        self._client_options = dict(api_key=api_key, concurrency=concurrency, base_url=base_url,
+                                    max_retries=max_retries)
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = make_openai_client(**self._client_options)
+        return self._client
+
+    @property
+    def cache_namespace(self) -> str:
+        return cache_namespace(self.model, self.base_url)
+
+    def extract(self, messages: List[dict], response_format: Type[BaseModel]) -> Completion:
+        completion = self.client.beta.chat.completions.parse(
+            model=self.model,
+            messages=messages,
+            response_format=response_format,
+        )
+        message = completion.choices[0].message
+        return Completion(parsed=message.parsed, content=getattr(message, "content", None) or "",
+                          usage=completion.usage)
+
+
+def make_backend(name: str = "openai", api_key: Optional[str] = None, model: str = DEFAULT_MODEL,
+                 base_url: Optional[str] = None, concurrency: Optional[int] = None,
+                 max_retries: int = openai.DEFAULT_MAX_RETRIES) -> ExtractionBackend:
+    """Backend by name (see BACKENDS)."""
+    if name == "openai":
+        return OpenAIBackend(api_key=api_key, model=model, base_url=base_url, concurrency=concurrency,
+                             max_retries=max_retries)
+    if name == "local":
+        # the stand-in ignores the key, but the SDK insists on one
+        return OpenAIBackend(api_key=api_key or "local", model=model, base_url=base_url or LOCAL_BASE_URL,
+                             concurrency=concurrency, max_retries=max_retries, name="local")
+    raise ValueError(f"Unknown backend {name!r}; choose from {', '.join(BACKENDS)}")
+
+
+def as_backend(client=None, api_key: Optional[str] = None) -> ExtractionBackend:
+    """A backend as is; an OpenAI-style client (or None, for a new one from api_key) wrapped in OpenAIBackend."""
+    if isinstance(client, ExtractionBackend):
+        return client
+    return OpenAIBackend(client=client, api_key=api_key)
+
+
+class AsyncOpenAIBackend:
+    """
+    Streaming structured output over an AsyncOpenAI client (streaming.py).
+    Like OpenAIBackend, it owns the model name and the cache namespace, so a
+    streamed answer is cached under the same key as a parsed one.
+    """
+
+    def __init__(self, client: openai.AsyncOpenAI, model: str = DEFAULT_MODEL, name: str = "openai"):
+        self.name = name
+        self.model = model
+        self.base_url = str(client.base_url)
+        self.client = client
+
+    @property
+    def cache_namespace(self) -> str:
+        return cache_namespace(self.model, self.base_url)
+
+    def stream(self, messages: List[dict], response_format: Type[BaseModel]):
+        """The SDK's streaming context manager for one request, with usage in the final chunk."""
+        return self.client.beta.chat.completions.stream(
+            model=self.model,
+            messages=messages,
+            response_format=response_format,
+            stream_options={"include_usage": True},
+        )
+
+
+def as_async_backend(client) -> AsyncOpenAIBackend:
+    """An AsyncOpenAIBackend as is; an AsyncOpenAI client wrapped in one for DEFAULT_MODEL."""
+    return client if isinstance(client, AsyncOpenAIBackend) else AsyncOpenAIBackend(client)
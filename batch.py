@@ -0,0 +1,382 @@
+# batch.py
+"""
+Headless batch extraction.
+
+Runs the same pipeline as the Streamlit page (PDF text -> GPT-4o structured
+output -> post-processing) over a directory or manifest of PDFs:
+
+    python batch.py Testing_Inputs/ -o results.xlsx --concurrency 16
+
+PDF parsing runs in a process pool and the LLM calls run in a bounded thread
+pool that shares one OpenAI client, so throughput scales with --concurrency
+instead of being capped by serial network round-trips.
+"""
+import argparse
+import contextvars
+import json
+import logging
+import os
+import random
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Iterable, List, Optional, TypeVar
+
+import openai
+
+from backends import BACKENDS, DEFAULT_MODEL, ExtractionBackend, make_backend
+from cache import DEFAULT_CACHE_DIR, ResultCache
+from export import LAYOUTS, ExportWriter, open_writer
+from instrumentation import TRACER, MetricsRegistry
+from incremental import DEFAULT_VERSIONS_DIR, VersionStore, extract_incremental
+from near_dup import DEFAULT_INDEX_PATH, DEFAULT_THRESHOLD, NearDuplicateIndex
+from pipeline import ExtractedFact, extract_document, extract_text_from_pdf
+from prompts import DEFAULT_TEMPLATE, EXTRACTION_PROMPT, TEMPLATES, PromptTemplate, get_template
+from token_budget import DEFAULT_MAX_PROMPT_TOKENS, TokenReport
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Errors worth retrying: provider throttling and transient transport/server failures.
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.InternalServerError,
+)
+
+
+@dataclass
+class DocumentResult:
+    source: str
+    facts: List[ExtractedFact] = field(default_factory=list)
+    error: Optional[str] = None
+    retries: int = 0
+    elapsed: float = 0.0
+
+
+# --- INPUT DISCOVERY ---
+def discover_inputs(target: str) -> List[Path]:
+    """
+    Resolve the batch input into a sorted list of PDF paths.
+    A directory is searched recursively for *.pdf; any other file is read as
+    a manifest with one path per line (blank lines and '#' comments ignored).
+    Relative manifest entries are resolved against the manifest's folder;
+    an entry listed twice is read once, since the outputs name documents by path.
+    """
+    root = Path(target)
+    if root.is_dir():
+        return sorted(p for p in root.rglob("*") if p.suffix.lower() == ".pdf")
+
+    paths, seen = [], set()
+    for line in root.read_text(encoding="utf-8").splitlines():
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        p = Path(line)
+        p = p if p.is_absolute() else root.parent / p
+        if p.resolve() in seen:
+            logger.warning("Skipping %s: listed more than once in %s", p, target)
+            continue
+        seen.add(p.resolve())
+        paths.append(p)
+    return paths
+
+
+# --- RATE-LIMIT AWARE RETRIES ---
+def _retry_after_seconds(error: Exception) -> Optional[float]:
+    """Read the server's Retry-After hint (seconds) from an API error, if any."""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    for name in ("retry-after-ms", "retry-after"):
+        raw = headers.get(name)
+        if raw is None:
+            continue
+        try:
+            seconds = float(raw)
+        except ValueError:
+            continue
+        return seconds / 1000 if name == "retry-after-ms" else seconds
+    return None
+
+
+def call_with_backoff(fn: Callable[[], T], max_retries: int = 6, base_delay: float = 1.0,
+                      max_delay: float = 60.0, on_retry: Optional[Callable[[int, Exception], None]] = None) -> T:
+    """
+    Call fn(), retrying retryable API errors with exponential backoff and full
+    jitter. A Retry-After header from the server takes precedence over the
+    computed delay so we back off exactly as long as the rate limiter asks.
+    """
+    attempt = 0
+    while True:
+        try:
+            return fn()
+        except RETRYABLE_ERRORS as e:
+            if attempt >= max_retries:
+                raise
+            delay = _retry_after_seconds(e)
+            if delay is None:
+                delay = random.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
+            attempt += 1
+            TRACER.incr("llm_retries")
+            if on_retry:
+                on_retry(attempt, e)
+            logger.warning("Retry %d/%d in %.1fs after %s", attempt, max_retries, delay, type(e).__name__)
+            time.sleep(delay)
+
+
+# --- WORKERS ---
+def _parse_pdf(path: str) -> str:
+    # top-level so it can be shipped to the process pool; documents are
+    # already spread across processes, so pages are extracted in-process
+    return extract_text_from_pdf(path, workers=1)
+
+
+def make_client(api_key: Optional[str], concurrency: int, backend: str = "openai",
+                base_url: Optional[str] = None, model: str = DEFAULT_MODEL) -> ExtractionBackend:
+    """
+    One backend for the whole batch: its HTTP pool is sized to the number of
+    in-flight requests so connections are reused instead of re-handshaked.
+    Built-in retries are disabled because call_with_backoff owns retrying.
+    """
+    return make_backend(backend, api_key=api_key, model=model, base_url=base_url,
+                        concurrency=concurrency, max_retries=0)
+
+
+def _extract_document(source: str, text: str, client: Optional[ExtractionBackend], max_retries: int,
+                      options: dict) -> DocumentResult:
+    result = DocumentResult(source=source)
+    start = time.perf_counter()
+
+    def _count_retry(attempt, error):
+        result.retries = attempt
+
+    options = dict(options)
+    versions = options.pop("versions", None)
+    if versions is not None:
+        def _extract():
+            return extract_incremental(text, source, versions, client=client, **options)
+    else:
+        def _extract():
+            return extract_document(text, client=client, **options)
+
+    try:
+        with TRACER.document(source):
+            parsed = call_with_backoff(
+                _extract,
+                max_retries=max_retries,
+                on_retry=_count_retry,
+            )
+        if parsed:
+            result.facts = parsed.facts
+        else:
+            result.error = "Model returned no parsed output"
+    except Exception as e:
+        result.error = f"{type(e).__name__}: {e}"
+    result.elapsed = time.perf_counter() - start
+    return result
+
+
+# --- BATCH API ---
+def run_batch(paths: Iterable[Path], api_key: Optional[str] = None, concurrency: int = 8,
+              pdf_workers: Optional[int] = None, max_retries: int = 6,
+              client: Optional[ExtractionBackend] = None,
+              cache: Optional[ResultCache] = None, use_rules: bool = True,
+              offline: bool = False, max_prompt_tokens: int = DEFAULT_MAX_PROMPT_TOKENS,
+              token_report: Optional[TokenReport] = None, span_mode: bool = False,
+              near_dup: Optional[NearDuplicateIndex] = None,
+              versions: Optional[VersionStore] = None,
+              sink: Optional[ExportWriter] = None,
+              template: PromptTemplate = EXTRACTION_PROMPT) -> List[DocumentResult]:
+    """
+    Extract every PDF in paths. Returns one DocumentResult per input, in
+    input order. Failed documents have no facts (the failure is in .error)
+    but still get the 37 empty schema rows in the sink, so the combined
+    result set stays rectangular.
+
+    At most `concurrency` LLM requests are in flight at any time. Parsing
+    feeds the LLM pool as soon as each document's text is ready. Documents
+    already in `cache` are answered without an API call, and keys resolved
+    by the rule engine are not requested from the model (offline=True skips
+    the model entirely). Documents over max_prompt_tokens are chunked; their
+    chunks are extracted one after another inside the document's worker so
+    the in-flight bound holds. Token usage accumulates in token_report.
+    span_mode has the model cite source spans instead of copying contexts,
+    and template is the prompt to use (prompts.get_template).
+
+    Without a client, an OpenAI backend is built from api_key. With a
+    near_dup index, resubmissions of already processed documents reuse their
+    facts and only the changed sentences are sent to the model. With a
+    versions store, a document seen before under the same path re-extracts
+    only the keys of its changed sections. With a sink, each document's
+    facts are written to it as soon as the documents before it are done (so
+    the output stays in input order) and dropped from its DocumentResult, so
+    memory stays flat. Results are written from the calling thread, so a
+    failing sink raises out of run_batch.
+    """
+    paths = [str(p) for p in paths]
+    if not paths:
+        return []
+    if client is None and not offline:
+        client = make_client(api_key, concurrency)
+    pdf_workers = pdf_workers or min(len(paths), os.cpu_count() or 1)
+    options = dict(cache=cache, use_rules=use_rules, offline=offline,
+                   max_prompt_tokens=max_prompt_tokens, chunk_workers=1, token_report=token_report,
+                   span_mode=span_mode, near_dup=near_dup, versions=versions, template=template)
+
+    results: List[Optional[DocumentResult]] = [None] * len(paths)
+    done = 0
+    next_to_write = 0
+
+    def _store(idx: int, res: DocumentResult) -> None:
+        nonlocal done, next_to_write
+        results[idx] = res
+        done += 1
+        while sink is not None and next_to_write < len(paths) and results[next_to_write] is not None:
+            written = results[next_to_write]
+            sink.append(written.source, written.facts)
+            written.facts = []
+            next_to_write += 1
+        logger.info("[%d/%d] %s (%.1fs%s)", done, len(paths), res.source, res.elapsed,
+                    f", error: {res.error}" if res.error else "")
+
+    with ProcessPoolExecutor(max_workers=pdf_workers) as parse_pool, \
+            ThreadPoolExecutor(max_workers=concurrency) as llm_pool:
+        # parse and LLM futures are drained here, on the calling thread, so
+        # writes stay ordered and a sink error is not lost in a pool callback
+        pending = {parse_pool.submit(_parse_pdf, p): (i, p, True) for i, p in enumerate(paths)}
+        try:
+            while pending:
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for fut in finished:
+                    idx, source, parsing = pending.pop(fut)
+                    if not parsing:
+                        _store(idx, fut.result())
+                        continue
+                    try:
+                        text = fut.result()
+                    except Exception as e:
+                        _store(idx, DocumentResult(source=source, error=f"PDF parse failed: {type(e).__name__}: {e}"))
+                        continue
+                    # copy the context so trace spans reach any collector active in the caller
+                    llm_future = llm_pool.submit(contextvars.copy_context().run, _extract_document,
+                                                 source, text, client, max_retries, options)
+                    pending[llm_future] = (idx, source, False)
+        except BaseException:
+            for fut in pending:
+                fut.cancel()
+            raise
+
+    return results
+
+
+# --- CLI ---
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Batch-extract PDFs into the 37-key schema.")
+    parser.add_argument("input", help="Directory of PDFs or a manifest file with one PDF path per line")
+    parser.add_argument("-o", "--output", default="batch_output.xlsx",
+                        help="Output file (.xlsx, .csv or .parquet). Default: batch_output.xlsx")
+    parser.add_argument("--layout", choices=LAYOUTS, default="long",
+                        help="long: one table with a Document column; sheets: one sheet per document (.xlsx only)")
+    parser.add_argument("-c", "--concurrency", type=int, default=8,
+                        help="Maximum LLM requests in flight (default: 8)")
+    parser.add_argument("--pdf-workers", type=int, default=None,
+                        help="Processes used for PDF parsing (default: CPU count)")
+    parser.add_argument("--max-retries", type=int, default=6,
+                        help="Retries per document on rate limits / transient errors (default: 6)")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR,
+                        help=f"Result cache directory (default: {DEFAULT_CACHE_DIR})")
+    parser.add_argument("--no-cache", action="store_true", help="Always call the API, ignoring cached results")
+    parser.add_argument("--no-rules", action="store_true",
+                        help="Send every key to the LLM instead of resolving easy fields by rule first")
+    parser.add_argument("--offline", action="store_true",
+                        help="Rule-based extraction only; no API calls (unresolved keys stay empty)")
+    parser.add_argument("--max-prompt-tokens", type=int, default=DEFAULT_MAX_PROMPT_TOKENS,
+                        help=f"Chunk documents whose prompt exceeds this (default: {DEFAULT_MAX_PROMPT_TOKENS})")
+    parser.add_argument("--span-mode", action="store_true",
+                        help="Have the model cite sentence/clause IDs for comments instead of copying text")
+    parser.add_argument("--prompt-template", choices=sorted(TEMPLATES), default=DEFAULT_TEMPLATE,
+                        help=f"Prompt template from prompts.py (default: {DEFAULT_TEMPLATE})")
+    parser.add_argument("--near-dup", action="store_true",
+                        help="Reuse facts of near-identical documents already processed; only changed sentences go to the LLM")
+    parser.add_argument("--near-dup-index", default=DEFAULT_INDEX_PATH,
+                        help=f"Near-duplicate index file (default: {DEFAULT_INDEX_PATH})")
+    parser.add_argument("--near-dup-threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help=f"Minimum estimated Jaccard similarity to reuse a document (default: {DEFAULT_THRESHOLD})")
+    parser.add_argument("--incremental", action="store_true",
+                        help="For PDFs extracted before under the same path, re-extract only the changed sections")
+    parser.add_argument("--versions-dir", default=DEFAULT_VERSIONS_DIR,
+                        help=f"Stored document versions for --incremental (default: {DEFAULT_VERSIONS_DIR})")
+    parser.add_argument("--api-key", default=os.environ.get("OPENAI_API_KEY"),
+                        help="OpenAI API key (default: $OPENAI_API_KEY)")
+    parser.add_argument("--backend", choices=BACKENDS, default="openai",
+                        help="Extraction backend; 'local' is benchmarks/standin_server.py (default: openai)")
+    parser.add_argument("--base-url", default=None,
+                        help="Base URL of an OpenAI-compatible server (default: the backend's own)")
+    parser.add_argument("--model", default=DEFAULT_MODEL, help=f"Model name (default: {DEFAULT_MODEL})")
+    parser.add_argument("--trace", action="store_true",
+                        help="Time every pipeline stage and log a per-stage summary at the end")
+    parser.add_argument("--trace-json", action="store_true",
+                        help="With --trace, also log one JSON line per stage span")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    if args.trace or args.trace_json:
+        TRACER.configure(enabled=True, json_logs=args.trace_json, registry=MetricsRegistry())
+    if args.layout == "sheets" and Path(args.output).suffix.lower() in (".csv", ".parquet"):
+        parser.error("--layout sheets needs an .xlsx output")
+    if not args.api_key and not args.offline and args.backend == "openai":
+        parser.error("an OpenAI API key is required (--api-key or OPENAI_API_KEY)")
+
+    paths = discover_inputs(args.input)
+    if not paths:
+        logger.error("No PDFs found in %s", args.input)
+        return 1
+
+    cache = None if args.no_cache else ResultCache(args.cache_dir)
+    near_dup = NearDuplicateIndex(args.near_dup_index, args.near_dup_threshold) if args.near_dup else None
+    versions = VersionStore(args.versions_dir) if args.incremental else None
+    token_report = TokenReport()
+    client = None if args.offline else make_client(args.api_key, args.concurrency, args.backend,
+                                                   args.base_url, args.model)
+    start = time.perf_counter()
+    # rows are written as documents finish instead of being collected for the end;
+    # leaving the block finishes the file (workbook zip, Parquet footer) even if the batch fails
+    with open_writer(args.output, layout=args.layout) as sink:
+        results = run_batch(paths, api_key=args.api_key, concurrency=args.concurrency, client=client,
+                            pdf_workers=args.pdf_workers, max_retries=args.max_retries, cache=cache,
+                            use_rules=not args.no_rules, offline=args.offline, span_mode=args.span_mode,
+                            max_prompt_tokens=args.max_prompt_tokens, token_report=token_report,
+                            near_dup=near_dup, versions=versions, sink=sink,
+                            template=get_template(args.prompt_template))
+    elapsed = time.perf_counter() - start
+
+    failed = [r for r in results if r.error]
+    logger.info("Processed %d documents in %.1fs (%.2f docs/s), %d failed. Wrote %s",
+                len(results), elapsed, len(results) / elapsed if elapsed else 0.0,
+                len(failed), args.output)
+    if cache is not None:
+        logger.info("Cache: %d hits, %d misses (%.0f%% hit rate)",
+                    cache.stats.hits, cache.stats.misses, cache.stats.hit_rate * 100)
+    if near_dup is not None:
+        logger.info("Near-duplicates: %d of %d documents reused stored facts (%d indexed)",
+                    near_dup.stats.matches, near_dup.stats.lookups, len(near_dup))
+    for stage, tokens in sorted(token_report.as_dict().items()):
+        logger.info("Tokens %-16s prompt=%d cached=%d completion=%d calls=%d",
+                    stage, tokens["prompt"], tokens["cached"], tokens["completion"], tokens["calls"])
+    llm_tokens = token_report.total()
+    if llm_tokens.prompt:
+        logger.info("Prompt cache: %d of %d prompt tokens served from the provider cache (%.0f%%)",
+                    llm_tokens.cached, llm_tokens.prompt, llm_tokens.cached / llm_tokens.prompt * 100)
+    if TRACER.enabled and TRACER.registry is not None:
+        logger.info("Trace summary: %s", json.dumps(TRACER.registry.snapshot(), default=str))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
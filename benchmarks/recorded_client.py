@@ -0,0 +1,48 @@
+# benchmarks/recorded_client.py
+"""
+Offline stand-in for openai.OpenAI that replays a recorded extraction.
+
+It implements only client.beta.chat.completions.parse, which is all the
+pipeline calls. Recorded facts are filtered to the keys allowed by the
+requested response_format, so partial (rule-assisted) and chunked requests
+get the same answers the full recording holds.
+"""
+import json
+import time
+import typing
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Optional
+
+
+def load_recording(path) -> dict:
+    return json.loads(Path(path).read_text(encoding="utf-8"))
+
+
+def _allowed_keys(response_format) -> Optional[set]:
+    fact_model = typing.get_args(response_format.model_fields["facts"].annotation)[0]
+    return set(typing.get_args(fact_model.model_fields["key"].annotation)) or None
+
+
+class RecordedClient:
+    def __init__(self, recording: dict, latency: Optional[float] = None):
+        """latency overrides the recorded latency_s (seconds slept per call)."""
+        self.recording = recording
+        self.latency = (recording.get("latency_s") or 0.0) if latency is None else latency
+        self.calls = 0
+        self.beta = SimpleNamespace(chat=SimpleNamespace(completions=self))
+
+    def parse(self, *, model, messages, response_format, **kwargs):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        allowed = _allowed_keys(response_format)
+        fact_model = typing.get_args(response_format.model_fields["facts"].annotation)[0]
+        facts = [fact_model(**f) for f in self.recording["facts"] if allowed is None or f["key"] in allowed]
+        usage = self.recording.get("usage") or {}
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(parsed=response_format(facts=facts)))],
+            usage=SimpleNamespace(prompt_tokens=usage.get("prompt_tokens", 0),
+                                  completion_tokens=usage.get("completion_tokens", 0),
+                                  prompt_tokens_details=SimpleNamespace(cached_tokens=usage.get("cached_tokens", 0))),
+        )
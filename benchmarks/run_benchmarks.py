@@ -0,0 +1,355 @@
+# benchmarks/run_benchmarks.py
+"""
+Benchmark and golden-accuracy harness for the extraction pipeline.
+
+Times each stage (PDF text extraction, rules, prompt build, LLM call, post-
+processing, Excel export), as recorded by the pipeline's own TRACER spans,
+on the documents listed in golden.json and on synthetically scaled copies
+of them (pages repeated N times). The LLM is
+replaced by RecordedClient, which replays the recorded responses in
+benchmarks/recordings/, so the suite runs offline and deterministically.
+
+Reports per-stage latency percentiles, peak memory per stage, field-level
+accuracy of the final rows against the expected workbooks, and for the
+revisions in golden.json whether incremental re-extraction keeps the values
+of unchanged sections. Exits 1
+when any threshold in thresholds.json (or given on the command line) is
+crossed, so it can gate CI:
+
+    python benchmarks/run_benchmarks.py --repeat 5 --scales 1,10,50
+
+With --record and an API key, the recordings are refreshed from live calls.
+With --backend local, the LLM stage goes over HTTP to a running
+benchmarks/standin_server.py instead, so the same report compares the
+in-process stub with a real client/server round trip (and its faults).
+"""
+import argparse
+import io
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import fitz  # PyMuPDF
+import numpy as np
+import pandas as pd
+from rapidfuzz import fuzz
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from pipeline import (KEY_ORDER, MODEL_NAME, clean_value, extract_document,  # noqa: E402
+                      extract_text_from_pdf, post_process_facts, process_with_ai)
+from backends import make_backend  # noqa: E402
+from incremental import KEY_SECTION, VersionStore, changed_sections, extract_incremental, split_sections  # noqa: E402
+from instrumentation import TRACER  # noqa: E402
+from benchmarks.recorded_client import RecordedClient, load_recording  # noqa: E402
+
+GOLDEN = Path(__file__).with_name("golden.json")
+THRESHOLDS = Path(__file__).with_name("thresholds.json")
+STAGES = ["pdf_extract", "rules", "prompt_build", "llm", "post_process", "excel_export"]
+COMMENT_MATCH_RATIO = 90  # rapidfuzz ratio at which a comment counts as matching
+
+
+# --- INPUTS ---
+def scale_pdf(src: Path, factor: int, out_dir: Path) -> Path:
+    """Write a copy of src with its pages repeated `factor` times."""
+    if factor == 1:
+        return src
+    out = out_dir / f"{src.stem}_x{factor}.pdf"
+    if not out.exists():
+        with fitz.open(src) as original, fitz.open() as scaled:
+            for _ in range(factor):
+                scaled.insert_pdf(original)
+            scaled.save(out)
+    return out
+
+
+def _normalise(text) -> str:
+    return " ".join(str(text).split()).casefold()
+
+
+def load_expected(path: Path) -> Dict[str, Dict[str, str]]:
+    """
+    Read an expected workbook into {key: {"value", "comment"}}. The header row
+    is located by its 'Key' cell (Expected Output.xlsx has it one row down),
+    and values are passed through clean_value so raw forms such as the
+    datetime 1989-03-15 or the score 0.925 compare equal to display forms.
+    """
+    raw = pd.read_excel(path, header=None, dtype=object)
+    header_row = next(i for i, row in raw.iterrows() if "Key" in row.values)
+    df = raw.iloc[header_row + 1:].copy()
+    df.columns = raw.iloc[header_row].values
+    expected = {}
+    for _, row in df.iterrows():
+        key = row.get("Key")
+        if key not in KEY_ORDER:
+            continue
+        value = row.get("Value")
+        if isinstance(value, pd.Timestamp):
+            value = value.strftime("%Y-%m-%d")
+        value = "" if pd.isna(value) else str(value)
+        comment = row.get("Comments")
+        comment = "" if pd.isna(comment) else str(comment)
+        expected[key] = {"value": clean_value(value, key), "comment": comment}
+    return expected
+
+
+def score_accuracy(rows: List[dict], expected: Dict[str, Dict[str, str]]) -> dict:
+    value_hits = comment_hits = 0
+    mismatches = []
+    for row in rows:
+        exp = expected.get(row["Key"], {"value": "", "comment": ""})
+        if _normalise(row["Value"]) == _normalise(exp["value"]):
+            value_hits += 1
+        else:
+            mismatches.append({"key": row["Key"], "got": row["Value"], "expected": exp["value"]})
+        got_c, exp_c = _normalise(row["Comments"]), _normalise(exp["comment"])
+        if got_c == exp_c or (got_c and exp_c and fuzz.ratio(got_c, exp_c) >= COMMENT_MATCH_RATIO):
+            comment_hits += 1
+    n = len(rows) or 1
+    return {"value_accuracy": value_hits / n, "comment_accuracy": comment_hits / n, "mismatches": mismatches}
+
+
+# --- STAGES ---
+class _PeakSpans(list):
+    """Span collector that tags each span with the traced peak since the previous span ended."""
+
+    def append(self, span) -> None:
+        span.set(peak_bytes=tracemalloc.get_traced_memory()[1])
+        tracemalloc.reset_peak()
+        super().append(span)
+
+
+def excel_export(rows: List[dict]) -> bytes:
+    """The app's Output.xlsx download, built in memory."""
+    with TRACER.stage("excel_export"):
+        buffer = io.BytesIO()
+        with pd.ExcelWriter(buffer, engine="openpyxl") as writer:
+            pd.DataFrame(rows).fillna("").to_excel(writer, sheet_name="Output", index=False)
+        return buffer.getvalue()
+
+
+def run_pipeline(pdf: Path, client, use_rules: bool, trace_memory: bool = False,
+                 span_mode: bool = False) -> tuple:
+    """
+    Run the pipeline once; returns ({stage: seconds}, {stage: peak bytes}, rows).
+    Times come from the pipeline's own TRACER spans, so each stage covers
+    only its own work (spans of one stage, e.g. LLM chunks, are summed; a
+    stage that did not run counts as 0).
+    """
+    spans = _PeakSpans() if trace_memory else []
+    if trace_memory:
+        tracemalloc.start()
+    try:
+        with TRACER.collect(spans):
+            text = extract_text_from_pdf(pdf, workers=1)
+            parsed = extract_document(text, client=client, use_rules=use_rules, chunk_workers=1,
+                                      span_mode=span_mode)
+            rows = post_process_facts(parsed.facts if parsed else [], text)
+            excel_export(rows)
+    finally:
+        if trace_memory:
+            tracemalloc.stop()
+
+    timings = {stage: 0.0 for stage in STAGES}
+    peaks = {stage: 0 for stage in STAGES}
+    for span in spans:
+        if span.stage in timings:
+            timings[span.stage] += span.wall_ms / 1000
+            peaks[span.stage] = max(peaks[span.stage], span.attrs.get("peak_bytes", 0))
+    return timings, peaks, rows
+
+
+# --- REVISIONS ---
+def check_revision(revision: dict, directory: Path) -> dict:
+    """
+    Extract a document, then a revision of it (revision["replace"] applied to
+    its text) with incremental.py and a model that finds none of the re-asked
+    keys. Every key outside the changed sections must keep its value.
+    """
+    pdf = ROOT / revision["pdf"]
+    text = extract_text_from_pdf(pdf, workers=1)
+    old, new = revision["replace"]
+    if old not in text:
+        raise ValueError(f"{pdf.name}: {old!r} not in the text")
+    edited = text.replace(old, new)
+    store = VersionStore(str(directory))
+    recorded = RecordedClient(load_recording(ROOT / revision["recording"]), latency=0)
+    first = extract_incremental(text, pdf.name, store, client=recorded)
+    second = extract_incremental(edited, pdf.name, store, client=RecordedClient({"facts": []}, latency=0))
+
+    changed = changed_sections(split_sections(text), split_sections(edited))
+    before, after = ({f.key: f.value for f in d.facts} for d in (first, second))
+    outside = [k for k in KEY_ORDER if KEY_SECTION[k] not in changed]
+    lost = [k for k in outside if after.get(k) != before.get(k)]
+    return {"changed_sections": changed, "kept": 1 - len(lost) / len(outside) if outside else 1.0, "lost": lost}
+
+
+def percentiles(samples: List[float]) -> dict:
+    ms = np.asarray(samples) * 1000
+    return {"p50_ms": float(np.percentile(ms, 50)), "p95_ms": float(np.percentile(ms, 95)),
+            "p99_ms": float(np.percentile(ms, 99)), "mean_ms": float(ms.mean())}
+
+
+# --- RECORDING ---
+def record(golden: dict, api_key: str) -> None:
+    """Refresh the recordings with live responses for the unscaled documents."""
+    import openai
+    from token_budget import TokenReport
+
+    client = openai.OpenAI(api_key=api_key)
+    for doc in golden["documents"]:
+        text = extract_text_from_pdf(ROOT / doc["pdf"])
+        report = TokenReport()
+        start = time.perf_counter()
+        parsed = process_with_ai(text, client=client, token_report=report)
+        latency = time.perf_counter() - start
+        usage = report.total()
+        recording = {
+            "source": Path(doc["pdf"]).name,
+            "model": MODEL_NAME,
+            "latency_s": round(latency, 3),
+            "usage": {"prompt_tokens": usage.prompt, "completion_tokens": usage.completion,
+                      "cached_tokens": usage.cached},
+            "facts": [f.model_dump() for f in parsed.facts] if parsed else [],
+        }
+        (ROOT / doc["recording"]).write_text(json.dumps(recording, indent=2, ensure_ascii=False), encoding="utf-8")
+        print(f"recorded {doc['pdf']} ({latency:.1f}s)")
+
+
+# --- THRESHOLDS ---
+def check_thresholds(report: dict, thresholds: dict) -> List[str]:
+    failures = []
+    for scale, stages in report["latency"].items():
+        for stage, limit in thresholds.get("max_p95_ms", {}).get(scale, {}).items():
+            got = stages[stage]["p95_ms"]
+            if got > limit:
+                failures.append(f"x{scale} {stage} p95 {got:.1f}ms > {limit}ms")
+    max_peak = thresholds.get("max_peak_mb")
+    if max_peak is not None:
+        for scale, stages in report["peak_memory_mb"].items():
+            for stage, mb in stages.items():
+                if mb > max_peak:
+                    failures.append(f"x{scale} {stage} peak {mb:.1f}MB > {max_peak}MB")
+    for doc, acc in report["accuracy"].items():
+        for metric in ("value_accuracy", "comment_accuracy"):
+            limit = thresholds.get(f"min_{metric}")
+            if limit is not None and acc[metric] < limit:
+                failures.append(f"{doc} {metric} {acc[metric]:.3f} < {limit}")
+    limit = thresholds.get("min_revision_kept")
+    for name, revision in report["revisions"].items():
+        if limit is not None and revision["kept"] < limit:
+            lost = ", ".join(revision["lost"])
+            failures.append(f"revision {name} kept {revision['kept']:.3f} < {limit} (lost {lost})")
+    return failures
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the extraction pipeline offline.")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs per document and scale (default: 5)")
+    parser.add_argument("--scales", default="1,10", help="Comma-separated page repeat factors (default: 1,10)")
+    parser.add_argument("--llm-latency", type=float, default=None,
+                        help="Seconds the stub sleeps per call (default: recorded latency, else 0)")
+    parser.add_argument("--no-rules", action="store_true", help="Send every key to the (stub) LLM")
+    parser.add_argument("--backend", choices=("recorded", "local"), default="recorded",
+                        help="'recorded' replays in-process; 'local' calls a running standin_server.py")
+    parser.add_argument("--base-url", default=None, help="Stand-in URL for --backend local")
+    parser.add_argument("--span-mode", action="store_true",
+                        help="Span-reference extraction; recorded contexts are resolved back to source spans")
+    parser.add_argument("--thresholds", default=str(THRESHOLDS), help="Threshold JSON file")
+    parser.add_argument("--min-value-accuracy", type=float, help="Override min_value_accuracy")
+    parser.add_argument("--max-peak-mb", type=float, help="Override max_peak_mb")
+    parser.add_argument("--json", help="Also write the full report to this file")
+    parser.add_argument("--record", action="store_true",
+                        help="Refresh recordings from live API calls (needs OPENAI_API_KEY) and exit")
+    args = parser.parse_args(argv)
+
+    golden = json.loads(GOLDEN.read_text(encoding="utf-8"))
+    if args.record:
+        api_key = os.environ.get("OPENAI_API_KEY")
+        if not api_key:
+            parser.error("--record needs OPENAI_API_KEY")
+        record(golden, api_key)
+        return 0
+
+    thresholds = json.loads(Path(args.thresholds).read_text(encoding="utf-8")) if Path(args.thresholds).exists() else {}
+    # span mode rebuilds comments from the source, so paraphrased expected comments cannot match
+    span_limits = thresholds.pop("span_mode", {})
+    if args.span_mode:
+        thresholds.update(span_limits)
+    if args.min_value_accuracy is not None:
+        thresholds["min_value_accuracy"] = args.min_value_accuracy
+    if args.max_peak_mb is not None:
+        thresholds["max_peak_mb"] = args.max_peak_mb
+
+    # stage timings are read from the pipeline's spans
+    TRACER.configure(enabled=True, json_logs=False)
+    scales = [int(s) for s in args.scales.split(",")]
+    report = {"latency": {}, "peak_memory_mb": {}, "accuracy": {}, "revisions": {}}
+    local = make_backend("local", base_url=args.base_url) if args.backend == "local" else None
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for scale in scales:
+            samples = {stage: [] for stage in STAGES}
+            peaks = {stage: 0 for stage in STAGES}
+            for doc in golden["documents"]:
+                pdf = scale_pdf(ROOT / doc["pdf"], scale, Path(tmp))
+                recording = load_recording(ROOT / doc["recording"])
+                expected = load_expected(ROOT / doc["expected"])
+                client = local or RecordedClient(recording, latency=args.llm_latency)
+
+                # one traced pass for memory, then untraced passes for timing
+                _, doc_peaks, rows = run_pipeline(pdf, client, not args.no_rules, trace_memory=True,
+                                                  span_mode=args.span_mode)
+                for stage, peak in doc_peaks.items():
+                    peaks[stage] = max(peaks[stage], peak)
+                for _ in range(args.repeat):
+                    timings, _, rows = run_pipeline(pdf, client, not args.no_rules, span_mode=args.span_mode)
+                    for stage, seconds in timings.items():
+                        samples[stage].append(seconds)
+
+                report["accuracy"][f"{Path(doc['pdf']).name} x{scale}"] = score_accuracy(rows, expected)
+
+            report["latency"][str(scale)] = {stage: percentiles(s) for stage, s in samples.items()}
+            report["peak_memory_mb"][str(scale)] = {stage: p / 2 ** 20 for stage, p in peaks.items()}
+
+        for i, revision in enumerate(golden.get("revisions", [])):
+            name = f"{Path(revision['pdf']).name} ({' -> '.join(revision['replace'])})"
+            report["revisions"][name] = check_revision(revision, Path(tmp) / f"versions-{i}")
+
+    report["max_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    # --- REPORT ---
+    for scale in report["latency"]:
+        print(f"\n== scale x{scale} ({args.repeat} runs x {len(golden['documents'])} documents) ==")
+        print(f"{'stage':<14}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'peak MB':>10}")
+        for stage in STAGES:
+            lat = report["latency"][scale][stage]
+            print(f"{stage:<14}{lat['p50_ms']:>10.2f}{lat['p95_ms']:>10.2f}{lat['p99_ms']:>10.2f}"
+                  f"{report['peak_memory_mb'][scale][stage]:>10.2f}")
+    print("\n== accuracy ==")
+    for doc, acc in report["accuracy"].items():
+        print(f"{doc:<32} values {acc['value_accuracy']:.1%}  comments {acc['comment_accuracy']:.1%}")
+    if report["revisions"]:
+        print("\n== revisions (values kept outside the changed sections) ==")
+        for name, revision in report["revisions"].items():
+            print(f"{name:<56} {revision['kept']:.1%}  changed: {', '.join(revision['changed_sections'])}")
+    print(f"\nmax RSS {report['max_rss_mb']:.1f} MB")
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(report, indent=2), encoding="utf-8")
+
+    failures = check_thresholds(report, thresholds)
+    for failure in failures:
+        print(f"THRESHOLD FAILED: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,295 @@
+# benchmarks/standin_server.py
+"""
+Local OpenAI-compatible stand-in for load testing.
+
+Serves POST /v1/chat/completions closely enough for the openai SDK's
+structured-output calls (parse() and the streaming helper), answering from
+the recorded extractions in benchmarks/recordings/. Pointing the "local"
+backend at it runs the real HTTP client, retry and concurrency code paths
+without an API key:
+
+    python benchmarks/standin_server.py --latency 2 --jitter 0.5 --rate-limit-rate 0.05 --max-in-flight 16
+    python batch.py manifest.txt --backend local --no-cache -c 32 --trace
+
+A request is answered with the recording whose fact values occur most often
+in its messages, filtered to the keys its response schema allows (as in
+RecordedClient). Faults are decided per request, in this order:
+
+- more than --max-in-flight requests open: 429, as a concurrency limit would
+- --rate-limit-rate: 429 with a Retry-After header
+- --error-rate: 500
+
+Latency is the recorded latency_s (or --latency), scaled by a random factor
+within --jitter; streamed answers spend a fifth of it before the first
+token. Usage is estimated at 4 characters per token, and a system prompt
+that has been seen before reports its prefix as cached tokens (in 128-token
+blocks past 1024), like OpenAI's prompt caching. GET /stats returns the
+request counters as JSON.
+"""
+import argparse
+import json
+import logging
+import random
+import sys
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from benchmarks.recorded_client import load_recording  # noqa: E402
+
+logger = logging.getLogger(__name__)
+
+RECORDINGS = Path(__file__).with_name("recordings")
+CHARS_PER_TOKEN = 4
+CACHE_MIN_TOKENS = 1024
+CACHE_BLOCK_TOKENS = 128
+STREAM_PIECE_CHARS = 24
+FIRST_TOKEN_SHARE = 0.2
+
+
+@dataclass
+class FaultProfile:
+    latency: Optional[float] = None  # seconds per answer; None replays the recorded latency
+    jitter: float = 0.0              # latency is scaled by a factor in [1 - jitter, 1 + jitter]
+    error_rate: float = 0.0
+    rate_limit_rate: float = 0.0
+    max_in_flight: Optional[int] = None
+    retry_after: float = 1.0
+    seed: Optional[int] = None
+
+
+# --- SCHEMA ---
+def _resolve(schema: dict, node: dict) -> dict:
+    while "$ref" in node:
+        node = schema["$defs"][node["$ref"].rsplit("/", 1)[-1]]
+    return node
+
+
+def fact_fields(response_format: dict) -> Tuple[List[str], Optional[set]]:
+    """The fact object's fields and the keys it admits (None: any) from a json_schema response_format."""
+    schema = response_format["json_schema"]["schema"]
+    item = _resolve(schema, _resolve(schema, schema["properties"]["facts"])["items"])
+    key = _resolve(schema, item["properties"]["key"])
+    allowed = key.get("enum") or ([key["const"]] if "const" in key else None)
+    return list(item["properties"]), set(allowed) if allowed else None
+
+
+# --- STAND-IN ---
+class StandIn:
+    def __init__(self, recordings: List[dict], faults: FaultProfile):
+        if not recordings:
+            raise ValueError("the stand-in needs at least one recording")
+        self.recordings = recordings
+        self.faults = faults
+        self.random = random.Random(faults.seed)
+        self._lock = threading.Lock()
+        self._seen_prefixes = set()
+        self.in_flight = 0
+        self.stats: Dict[str, float] = {"requests": 0, "ok": 0, "rate_limited": 0, "concurrency_limited": 0,
+                                        "errors": 0, "streamed": 0, "max_in_flight": 0}
+
+    def admit(self) -> Optional[Tuple[int, str, str]]:
+        """None to serve the request, else the (status, type, message) to fail it with."""
+        with self._lock:
+            self.stats["requests"] += 1
+            if self.faults.max_in_flight is not None and self.in_flight >= self.faults.max_in_flight:
+                self.stats["concurrency_limited"] += 1
+                return 429, "rate_limit_exceeded", "Too many concurrent requests (stand-in limit)"
+            roll = self.random.random()
+            if roll < self.faults.rate_limit_rate:
+                self.stats["rate_limited"] += 1
+                return 429, "rate_limit_exceeded", "Rate limit reached (stand-in)"
+            if roll < self.faults.rate_limit_rate + self.faults.error_rate:
+                self.stats["errors"] += 1
+                return 500, "server_error", "Injected server error (stand-in)"
+            self.in_flight += 1
+            self.stats["max_in_flight"] = max(self.stats["max_in_flight"], self.in_flight)
+            return None
+
+    def release(self, streamed: bool) -> None:
+        with self._lock:
+            self.in_flight -= 1
+            self.stats["ok"] += 1
+            self.stats["streamed"] += streamed
+
+    def pick_recording(self, messages: List[dict]) -> dict:
+        text = "\n".join(str(m.get("content") or "") for m in messages if m.get("role") != "system")
+
+        def hits(recording):
+            return sum(1 for f in recording["facts"] if f.get("value") and str(f["value"]) in text)
+
+        return max(self.recordings, key=hits)
+
+    def latency(self, recording: dict) -> float:
+        base = self.faults.latency if self.faults.latency is not None else recording.get("latency_s") or 0.0
+        with self._lock:
+            factor = self.random.uniform(1 - self.faults.jitter, 1 + self.faults.jitter)
+        return max(0.0, base * factor)
+
+    def usage(self, messages: List[dict], content: str) -> dict:
+        prompt = sum(len(str(m.get("content") or "")) for m in messages) // CHARS_PER_TOKEN
+        completion = len(content) // CHARS_PER_TOKEN
+        cached = 0
+        system = next((str(m.get("content") or "") for m in messages if m.get("role") == "system"), "")
+        prefix_tokens = len(system) // CHARS_PER_TOKEN
+        with self._lock:
+            if system in self._seen_prefixes and prefix_tokens >= CACHE_MIN_TOKENS:
+                cached = prefix_tokens // CACHE_BLOCK_TOKENS * CACHE_BLOCK_TOKENS
+            self._seen_prefixes.add(system)
+        return {"prompt_tokens": prompt, "completion_tokens": completion, "total_tokens": prompt + completion,
+                "prompt_tokens_details": {"cached_tokens": cached}}
+
+    def answer(self, body: dict) -> Tuple[str, dict, float]:
+        """(message content, usage, latency in seconds) for a chat completion request."""
+        messages = body.get("messages") or []
+        recording = self.pick_recording(messages)
+        fields, allowed = fact_fields(body["response_format"])
+        facts = []
+        for fact in recording["facts"]:
+            if allowed is not None and fact["key"] not in allowed:
+                continue
+            # span-mode schemas get the recorded context as a quote and no span IDs
+            facts.append({name: fact.get(name, [] if name == "context_spans" else "") for name in fields})
+        content = json.dumps({"facts": facts}, ensure_ascii=False)
+        return content, self.usage(messages, content), self.latency(recording)
+
+
+# --- HTTP ---
+def make_handler(standin: StandIn):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, fmt, *args):
+            logger.debug(fmt, *args)
+
+        def _json(self, status: int, payload: dict, headers: Optional[Dict[str, str]] = None) -> None:
+            data = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path.rstrip("/").endswith("/stats"):
+                with standin._lock:
+                    self._json(200, {**standin.stats, "in_flight": standin.in_flight})
+            else:
+                self._json(404, {"error": {"message": f"No route {self.path}", "type": "invalid_request_error"}})
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                self._json(404, {"error": {"message": f"No route {self.path}", "type": "invalid_request_error"}})
+                return
+            failure = standin.admit()
+            if failure is not None:
+                status, kind, message = failure
+                headers = {"Retry-After": f"{standin.faults.retry_after:g}"} if status == 429 else None
+                self._json(status, {"error": {"message": message, "type": kind, "code": kind}}, headers)
+                return
+            streamed = bool(body.get("stream"))
+            try:
+                content, usage, latency = standin.answer(body)
+                meta = {"id": f"chatcmpl-{uuid.uuid4().hex[:24]}", "created": int(time.time()),
+                        "model": body.get("model", "stand-in")}
+                if streamed:
+                    self._stream(meta, content, usage, latency,
+                                 bool((body.get("stream_options") or {}).get("include_usage")))
+                else:
+                    time.sleep(latency)
+                    self._json(200, {**meta, "object": "chat.completion", "usage": usage, "choices": [{
+                        "index": 0, "finish_reason": "stop", "logprobs": None,
+                        "message": {"role": "assistant", "content": content, "refusal": None},
+                    }]})
+            finally:
+                standin.release(streamed)
+
+        def _stream(self, meta: dict, content: str, usage: dict, latency: float, include_usage: bool) -> None:
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            self.close_connection = True
+
+            def send(choices, **extra):
+                chunk = {**meta, "object": "chat.completion.chunk", "choices": choices, **extra}
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+
+            def delta(payload, finish=None):
+                return [{"index": 0, "delta": payload, "finish_reason": finish, "logprobs": None}]
+
+            pieces = [content[i:i + STREAM_PIECE_CHARS] for i in range(0, len(content), STREAM_PIECE_CHARS)]
+            time.sleep(latency * FIRST_TOKEN_SHARE)
+            send(delta({"role": "assistant", "content": ""}))
+            step = latency * (1 - FIRST_TOKEN_SHARE) / max(len(pieces), 1)
+            for piece in pieces:
+                send(delta({"content": piece}))
+                time.sleep(step)
+            send(delta({}, "stop"))
+            if include_usage:
+                send([], usage=usage)
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+
+    return Handler
+
+
+def serve(standin: StandIn, host: str = "127.0.0.1", port: int = 8089) -> ThreadingHTTPServer:
+    """Start the stand-in on a background thread; call .shutdown() on the result to stop it."""
+    server = ThreadingHTTPServer((host, port), make_handler(standin))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="standin-server", daemon=True).start()
+    return server
+
+
+# --- CLI ---
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="OpenAI-compatible stand-in that replays recorded extractions.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--recordings", default=str(RECORDINGS),
+                        help="Recording JSON file or directory of them (default: benchmarks/recordings)")
+    parser.add_argument("--latency", type=float, default=None,
+                        help="Seconds per answer (default: each recording's latency_s)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Relative latency spread, e.g. 0.3 for +-30%%")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered with 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Share of requests answered with 429")
+    parser.add_argument("--max-in-flight", type=int, default=None,
+                        help="Answer 429 while this many requests are already open")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After seconds sent with 429s")
+    parser.add_argument("--seed", type=int, default=None, help="Seed for reproducible fault injection")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    source = Path(args.recordings)
+    paths = sorted(source.glob("*.json")) if source.is_dir() else [source]
+    faults = FaultProfile(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                          rate_limit_rate=args.rate_limit_rate, max_in_flight=args.max_in_flight,
+                          retry_after=args.retry_after, seed=args.seed)
+    standin = StandIn([load_recording(p) for p in paths], faults)
+    server = serve(standin, args.host, args.port)
+    logger.info("Stand-in serving %d recordings on http://%s:%d/v1", len(paths), args.host, args.port)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+        logger.info("Stats: %s", json.dumps(standin.stats))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,177 @@
+# cache.py
+"""
+Content-addressed on-disk cache for LLM extraction results.
+
+Entries are keyed by a SHA-256 over everything that determines the model's
+answer: the extracted PDF text, the prompt template, the model name and the
+JSON schema of the response model. Changing any of them produces a new key,
+so stale results are never served after a prompt or schema edit.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional, Type, TypeVar
+
+from pydantic import BaseModel
+
+M = TypeVar("M", bound=BaseModel)
+
+DEFAULT_CACHE_DIR = ".extraction_cache"
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    writes: int = 0
+    evictions: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+class ResultCache:
+    """
+    Directory of JSON files, one per result, sharded by the first two hex
+    digits of the key. Reads refresh an entry's mtime, so eviction (oldest
+    mtime first) is least-recently-used.
+
+    Limits (any may be None to disable):
+    - max_entries: keep at most this many results
+    - max_bytes:   keep the total size on disk under this many bytes
+    - max_age:     treat entries older than this many seconds as expired
+    """
+
+    def __init__(self, directory: str = DEFAULT_CACHE_DIR, max_entries: Optional[int] = 10_000,
+                 max_bytes: Optional[int] = 512 * 1024 * 1024, max_age: Optional[float] = 30 * 24 * 3600):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.stats = CacheStats()
+        self._lock = threading.Lock()
+        # running totals so put() only rescans the directory when a limit is crossed
+        self._entries = 0
+        self._bytes = 0
+        self.evict()
+
+    @staticmethod
+    def make_key(text: str, prompt_template: str, model: str, schema: Type[BaseModel]) -> str:
+        h = hashlib.sha256()
+        schema_json = json.dumps(schema.model_json_schema(), sort_keys=True)
+        for part in (text, prompt_template, model, schema_json):
+            data = part.encode("utf-8")
+            # length-prefix each part so boundaries can't be shifted between fields
+            h.update(len(data).to_bytes(8, "big"))
+            h.update(data)
+        return h.hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.directory / key[:2] / f"{key}.json"
+
+    def _expired(self, mtime: float, now: float) -> bool:
+        return self.max_age is not None and now - mtime > self.max_age
+
+    def get(self, key: str, model: Type[M]) -> Optional[M]:
+        path = self._path(key)
+        now = time.time()
+        try:
+            mtime = path.stat().st_mtime
+            if self._expired(mtime, now):
+                path.unlink(missing_ok=True)
+                with self._lock:
+                    self.stats.evictions += 1
+                    self.stats.misses += 1
+                return None
+            result = model.model_validate_json(path.read_bytes())
+        except (OSError, ValueError):
+            # missing, concurrently evicted or corrupt entry: treat as a miss
+            with self._lock:
+                self.stats.misses += 1
+            return None
+        os.utime(path, (now, now))
+        with self._lock:
+            self.stats.hits += 1
+        return result
+
+    def put(self, key: str, value: BaseModel) -> None:
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        data = value.model_dump_json()
+        # write-then-rename so readers never see a half-written entry
+        fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as fh:
+                fh.write(data)
+            try:
+                # an overwrite replaces the old entry: it is neither a new entry nor extra bytes
+                replaced = path.stat().st_size
+            except OSError:
+                replaced = None
+            os.replace(tmp, path)
+        except BaseException:
+            Path(tmp).unlink(missing_ok=True)
+            raise
+        with self._lock:
+            self.stats.writes += 1
+            self._entries += replaced is None
+            self._bytes += len(data.encode("utf-8")) - (replaced or 0)
+            over = ((self.max_entries is not None and self._entries > self.max_entries)
+                    or (self.max_bytes is not None and self._bytes > self.max_bytes))
+            # age-based expiry is also swept periodically
+            sweep = over or self.stats.writes % 256 == 0
+        if sweep:
+            self.evict()
+
+    def evict(self) -> int:
+        """Drop expired entries, then the least recently used until within limits."""
+        now = time.time()
+        entries = []
+        for path in self.directory.glob("*/*.json"):
+            try:
+                st = path.stat()
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+
+        removed = 0
+        kept = []
+        for mtime, size, path in entries:
+            if self._expired(mtime, now):
+                path.unlink(missing_ok=True)
+                removed += 1
+            else:
+                kept.append((mtime, size, path))
+
+        kept.sort()
+        count = len(kept)
+        total = sum(size for _, size, _ in kept)
+        for _, size, path in kept:
+            if not ((self.max_entries is not None and count > self.max_entries)
+                    or (self.max_bytes is not None and total > self.max_bytes)):
+                break
+            path.unlink(missing_ok=True)
+            count -= 1
+            total -= size
+            removed += 1
+
+        with self._lock:
+            self.stats.evictions += removed
+            self._entries = count
+            self._bytes = total
+        return removed
+
+    def clear(self) -> None:
+        for path in self.directory.glob("*/*.json"):
+            path.unlink(missing_ok=True)
+        with self._lock:
+            self._entries = 0
+            self._bytes = 0
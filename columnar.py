@@ -0,0 +1,155 @@
+# columnar.py
+"""
+Columnar post-processing for batches.
+
+post_process_facts cleans one fact at a time. For large batches this module
+does the same work over a single pandas frame holding the facts of many
+documents: key indices and field types are looked up from maps built once,
+ISO dates and plain numbers are normalised with vectorised string/datetime
+operations, and everything else goes through the memoised helpers in
+normalize.py, called once per distinct (key, value) pair.
+
+The result is row-for-row identical to calling post_process_facts on each
+document.
+"""
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from normalize import MONTH_NAMES, clean_value, field_type, format_score_as_percentage, parse_date_to_natural
+from pipeline import KEY_ORDER, ExtractedFact
+
+OUTPUT_COLUMNS = ["Document", "#", "Key", "Value", "Comments"]
+
+# --- PRECOMPUTED KEY MAPS ---
+KEY_INDEX: Dict[str, int] = {k: i + 1 for i, k in enumerate(KEY_ORDER)}
+KEY_TYPES: Dict[str, str] = {k: field_type(k) for k in KEY_ORDER}
+
+_ISO_DATE = r'^\d{4}-\d{2}-\d{2}$'
+_NUMBER_LIKE = r'^\d+(,\d+)*(\.\d+)?(%?)$'
+_PLAIN_INT = r'^\d+$'
+_MONTH_NAMES = np.array([""] + MONTH_NAMES, dtype=object)
+
+
+def _map_unique(values: pd.Series, fn) -> pd.Series:
+    """Apply fn once per distinct value and broadcast the results back."""
+    codes, uniques = pd.factorize(values, sort=False)
+    if len(uniques) == 0:
+        return values.astype(object)
+    mapped = np.array([fn(u) for u in uniques], dtype=object)
+    return pd.Series(mapped[codes], index=values.index, dtype=object)
+
+
+# --- VECTORISED CLEANERS (each receives stripped, non-empty values) ---
+def _clean_dates(v: pd.Series) -> pd.Series:
+    out = pd.Series(index=v.index, dtype=object)
+    iso = v.str.match(_ISO_DATE)
+    if iso.any():
+        dt = pd.to_datetime(v[iso], format="%Y-%m-%d", errors="coerce")
+        ok = dt.notna()
+        good = dt[ok]
+        out[good.index] = (good.dt.day.astype(str) + " " + _MONTH_NAMES[good.dt.month.to_numpy()]
+                           + " " + good.dt.year.astype(str))
+        iso = iso & out.notna()
+    rest = ~iso
+    if rest.any():
+        out[rest] = _map_unique(v[rest], parse_date_to_natural)
+    return out
+
+
+def _format_cgpa(v: str) -> str:
+    return clean_value(v, 'Undergraduate CGPA')
+
+
+def _clean_numeric(v: pd.Series, kind: str) -> pd.Series:
+    stripped = v.str.replace(',', '', regex=False).str.strip()
+    if kind == "age":
+        plain = stripped.str.match(_PLAIN_INT)
+        return stripped.where(~plain, stripped + " years")
+    if kind == "cgpa":
+        return _map_unique(stripped, _format_cgpa)
+    return stripped
+
+
+def _clean_text(v: pd.Series, keys: pd.Series) -> pd.Series:
+    # non-numeric keys still take the numeric branch when the value looks like a number
+    numberish = v.str.replace(' ', '', regex=False).str.match(_NUMBER_LIKE)
+    out = pd.Series(index=v.index, dtype=object)
+    if numberish.any():
+        out[numberish] = v[numberish].str.replace(',', '', regex=False).str.strip()
+    rest = ~numberish
+    if rest.any():
+        pairs = pd.Series(list(zip(v[rest], keys[rest])), index=v[rest].index)
+        out[rest] = _map_unique(pairs, lambda p: clean_value(p[0], p[1]))
+    return out
+
+
+def clean_values(values: pd.Series, keys: pd.Series) -> pd.Series:
+    """Vectorised clean_value over aligned value/key columns."""
+    v = values.fillna("").astype(str).str.strip()
+    out = pd.Series("", index=v.index, dtype=object)
+    present = v != ""
+    kinds = keys.map(KEY_TYPES)
+    for kind in ("date", "score", "age", "cgpa", "numeric", "text"):
+        mask = present & (kinds == kind)
+        if not mask.any():
+            continue
+        if kind == "date":
+            out[mask] = _clean_dates(v[mask])
+        elif kind == "score":
+            out[mask] = _map_unique(v[mask], format_score_as_percentage)
+        elif kind == "text":
+            out[mask] = _clean_text(v[mask], keys[mask])
+        else:
+            out[mask] = _clean_numeric(v[mask], kind)
+    return out
+
+
+def clean_comments(contexts: pd.Series, keys: pd.Series) -> pd.Series:
+    """Vectorised comment cleanup of post_process_facts over aligned context/key columns."""
+    ctx = contexts.fillna("").astype(str).str.strip()
+    nationality = keys == 'Nationality'
+    if nationality.any():
+        ctx[nationality] = ctx[nationality].str.replace('As an Indian national, his ', '', regex=False)
+    return ctx
+
+
+# --- FRAME API ---
+def facts_frame(documents: Iterable[Tuple[str, Sequence[ExtractedFact]]]) -> pd.DataFrame:
+    """Flatten (document id, facts) pairs into one frame: Document, Key, value, context."""
+    doc_col, key_col, value_col, ctx_col = [], [], [], []
+    for doc_id, facts in documents:
+        for f in facts:
+            doc_col.append(doc_id)
+            key_col.append(f.key)
+            value_col.append(f.value)
+            ctx_col.append(f.context)
+    return pd.DataFrame({"Document": doc_col, "Key": key_col, "value": value_col, "context": ctx_col})
+
+
+def post_process_frame(facts: pd.DataFrame, documents: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    Columnar equivalent of post_process_facts for many documents at once.
+
+    facts has columns Document, Key, value, context (see facts_frame).
+    documents fixes the output order and may include documents with no facts;
+    by default documents appear in order of first occurrence. Returns 37 rows
+    per document with columns Document, #, Key, Value, Comments.
+    """
+    if documents is None:
+        documents = list(pd.unique(facts["Document"]))
+
+    # ensure_full_coverage: the last fact for a key wins, missing keys are empty
+    latest = facts.drop_duplicates(subset=["Document", "Key"], keep="last")
+    full = pd.MultiIndex.from_product([documents, KEY_ORDER], names=["Document", "Key"])
+    df = latest.set_index(["Document", "Key"]).reindex(full).reset_index()
+
+    keys = df["Key"]
+    return pd.DataFrame({
+        "Document": df["Document"],
+        "#": keys.map(KEY_INDEX).astype(int),
+        "Key": keys,
+        "Value": clean_values(df["value"], keys),
+        "Comments": clean_comments(df["context"], keys),
+    }, columns=OUTPUT_COLUMNS)
@@ -0,0 +1,217 @@
+# export.py
+"""
+Streaming export of many documents' results.
+
+The app exports one document by building a DataFrame and writing it into a
+BytesIO with pd.ExcelWriter. For a batch of thousands of documents that
+means holding every row (and the whole workbook) in memory. The writers here
+take documents as they finish, buffer them as FactColumns (result_store.py)
+and write every `documents_per_group` documents straight to disk:
+
+- .xlsx: openpyxl write-only mode. Each sheet streams to a temporary file
+  that is zipped into the workbook on close. Layouts:
+    long   - one "Output" sheet with a Document column (continued on
+             "Output (2)"... past Excel's row limit);
+    sheets - one sheet per document, named after its file, with the same
+             #, Key, Value, Comments columns as the app's Output.xlsx.
+- .csv: one long table, appended row group by row group.
+- .parquet: one row group per buffer, dictionary-encoded (RESULT_SCHEMA);
+  read it back with result_store.read_results.
+
+    with open_writer("results.xlsx", layout="sheets") as writer:
+        for source, facts in finished_documents:
+            writer.append(source, facts)
+
+Memory is bounded by one buffer of documents whatever the batch size, and
+export time grows linearly with it.
+"""
+import csv
+import logging
+import re
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Iterable, List, Optional, Set
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from openpyxl import Workbook
+
+from columnar import OUTPUT_COLUMNS
+from instrumentation import TRACER
+from pipeline import KEY_ORDER
+from result_store import RESULT_SCHEMA, FactColumns
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DOCUMENTS_PER_GROUP = 256
+LAYOUTS = ("long", "sheets")
+
+EXCEL_MAX_ROWS = 1_048_576
+_SHEET_TITLE_LENGTH = 31
+_INVALID_TITLE_CHARS = re.compile(r'[\[\]:*?/\\]')
+
+
+def sheet_title(name: str, taken: Set[str]) -> str:
+    """A valid, unique (case-insensitively) Excel sheet title for a document; adds it to `taken`."""
+    base = _INVALID_TITLE_CHARS.sub("_", Path(name).stem).strip("'") or "Document"
+    title, n = base[:_SHEET_TITLE_LENGTH], 1
+    while title.lower() in taken:
+        n += 1
+        suffix = f" ({n})"
+        title = base[:_SHEET_TITLE_LENGTH - len(suffix)] + suffix
+    taken.add(title.lower())
+    return title
+
+
+class ExportWriter(ABC):
+    """
+    Buffers appended documents and writes them as one batch of rows every
+    `documents_per_group` documents; close() (or leaving the with-block)
+    writes the rest and finishes the file.
+    """
+
+    format = ""
+    layouts = ("long",)
+
+    def __init__(self, path: str, layout: str = "long", documents_per_group: int = DEFAULT_DOCUMENTS_PER_GROUP):
+        if layout not in self.layouts:
+            raise ValueError(f"{self.format} export supports layout {' or '.join(self.layouts)}, not {layout!r}")
+        self.path = path
+        self.layout = layout
+        self.documents_per_group = documents_per_group
+        self.documents = 0
+        self.rows = 0
+        self._buffer = FactColumns()
+        # names of documents already flushed; the buffer only knows its own group
+        self._written: Set[str] = set()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def append(self, document: str, facts: Iterable) -> None:
+        """
+        Add a document's facts; a document without facts still gets its 37
+        empty rows. Raises ValueError for a document name appended before.
+        """
+        if document in self._written:
+            raise ValueError(f"document {document!r} was already appended")
+        self._buffer.append(document, facts)
+        if len(self._buffer.documents) >= self.documents_per_group:
+            self.flush()
+
+    def flush(self) -> None:
+        if not len(self._buffer.documents):
+            return
+        table = self._buffer.to_table()
+        with TRACER.stage("export", format=self.format, layout=self.layout) as span:
+            self._write(table)
+            span.set(rows=table.num_rows)
+        self.documents += len(self._buffer.documents)
+        self._written.update(self._buffer.documents.strings)
+        self.rows += table.num_rows
+        self._buffer = FactColumns()
+
+    def close(self) -> None:
+        self.flush()
+        self._finish()
+
+    @abstractmethod
+    def _write(self, table: pa.Table) -> None:
+        """Write post-processed rows (RESULT_SCHEMA, 37 consecutive rows per document)."""
+
+    @abstractmethod
+    def _finish(self) -> None:
+        """Complete the file."""
+
+
+class ExcelExportWriter(ExportWriter):
+    format = "xlsx"
+    layouts = LAYOUTS
+
+    def __init__(self, path: str, layout: str = "long", documents_per_group: int = DEFAULT_DOCUMENTS_PER_GROUP):
+        super().__init__(path, layout, documents_per_group)
+        self._workbook = Workbook(write_only=True)
+        self._sheet = None
+        self._sheet_rows = 0
+        self._titles: Set[str] = set()
+
+    def _new_sheet(self, name: str, header: List[str]) -> None:
+        if self._sheet is not None:
+            # closing writes the sheet out to its temporary file
+            self._sheet.close()
+        self._sheet = self._workbook.create_sheet(sheet_title(name, self._titles))
+        self._sheet.append(header)
+        self._sheet_rows = 1
+
+    def _write(self, table: pa.Table) -> None:
+        document, number, key, value, comments = (column.to_pylist() for column in table.columns)
+        if self.layout == "long":
+            for row in zip(document, number, key, value, comments):
+                if self._sheet is None or self._sheet_rows >= EXCEL_MAX_ROWS:
+                    self._new_sheet("Output", OUTPUT_COLUMNS)
+                self._sheet.append(row)
+                self._sheet_rows += 1
+            return
+        width = len(KEY_ORDER)
+        for start in range(0, table.num_rows, width):
+            self._new_sheet(document[start], OUTPUT_COLUMNS[1:])
+            for row in zip(number[start:start + width], key[start:start + width],
+                           value[start:start + width], comments[start:start + width]):
+                self._sheet.append(row)
+
+    def _finish(self) -> None:
+        if self._sheet is None:
+            # a workbook needs at least one sheet
+            self._new_sheet("Output", OUTPUT_COLUMNS if self.layout == "long" else OUTPUT_COLUMNS[1:])
+        self._workbook.save(self.path)
+
+
+class CsvExportWriter(ExportWriter):
+    format = "csv"
+
+    def __init__(self, path: str, layout: str = "long", documents_per_group: int = DEFAULT_DOCUMENTS_PER_GROUP):
+        super().__init__(path, layout, documents_per_group)
+        self._file = open(path, "w", newline="", encoding="utf-8")
+        # same dialect as DataFrame.to_csv
+        self._csv = csv.writer(self._file, lineterminator="\n")
+        self._csv.writerow(OUTPUT_COLUMNS)
+
+    def _write(self, table: pa.Table) -> None:
+        self._csv.writerows(zip(*(column.to_pylist() for column in table.columns)))
+
+    def _finish(self) -> None:
+        self._file.close()
+
+
+class ParquetExportWriter(ExportWriter):
+    format = "parquet"
+
+    def __init__(self, path: str, layout: str = "long", documents_per_group: int = DEFAULT_DOCUMENTS_PER_GROUP,
+                 compression: str = "zstd"):
+        super().__init__(path, layout, documents_per_group)
+        self.compression = compression
+        self._writer: Optional[pq.ParquetWriter] = None
+
+    def _open(self) -> pq.ParquetWriter:
+        if self._writer is None:
+            self._writer = pq.ParquetWriter(self.path, RESULT_SCHEMA, compression=self.compression)
+        return self._writer
+
+    def _write(self, table: pa.Table) -> None:
+        self._open().write_table(table)
+
+    def _finish(self) -> None:
+        # with nothing appended this still leaves a valid, empty file
+        self._open().close()
+
+
+WRITERS = {".csv": CsvExportWriter, ".parquet": ParquetExportWriter, ".xlsx": ExcelExportWriter}
+
+
+def open_writer(path: str, layout: str = "long", documents_per_group: int = DEFAULT_DOCUMENTS_PER_GROUP) -> ExportWriter:
+    """The writer for the path's extension (.csv, .parquet, otherwise .xlsx)."""
+    writer = WRITERS.get(Path(path).suffix.lower(), ExcelExportWriter)
+    return writer(path, layout, documents_per_group)
@@ -0,0 +1,207 @@
+# incremental.py
+"""
+Incremental re-extraction of revised documents.
+
+A revised PDF from the same candidate usually changes one part of the
+resume. Instead of running the 37-key extraction again, the text is split
+into the sections the schema is grouped by (personal, professional,
+academic, certifications, technical) and compared with the sections stored
+for the previous version:
+
+- unchanged document: the stored facts are returned, no model call;
+- otherwise only the keys whose supporting sections changed are asked for,
+  with only the changed sections as source text, so prompt and completion
+  size follow the edit rather than the document.
+
+A key's supporting sections are its own group plus every section holding a
+sentence that states its stored value, so a salary mentioned in a personal
+summary is still re-checked when that summary changes. Keys that were empty
+before are re-asked whenever anything changed, since new text may fill them.
+A re-asked key that comes back empty, or not at all, keeps its stored value
+if an unchanged section still states it.
+Rule facts are recomputed on the full text and the merge goes through
+ensure_full_coverage, so the result always has all 37 keys.
+
+Versions are kept in a ResultCache directory, keyed by document id (for
+uploads, the file name).
+"""
+import hashlib
+import logging
+import re
+from typing import Dict, List, Optional
+
+from pydantic import BaseModel
+
+from cache import ResultCache
+from instrumentation import TRACER
+from near_dup import supports
+from pipeline import KEY_ORDER, DocumentStructure, ExtractedFact, apply_rule_facts, ensure_full_coverage, \
+    extract_document, extract_rule_facts
+from rules import DEFAULT_MIN_CONFIDENCE
+from span_index import SpanIndex
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_VERSIONS_DIR = ".document_versions"
+
+# --- SECTIONS (the groups of KEY_ORDER) ---
+SECTION_KEYS: Dict[str, List[str]] = {
+    "personal": KEY_ORDER[0:8],         # First Name .. Nationality
+    "professional": KEY_ORDER[8:21],    # first role .. Previous Starting Designation
+    "academic": KEY_ORDER[21:32],       # High School .. Graduation CGPA
+    "certifications": KEY_ORDER[32:36],
+    "technical": KEY_ORDER[36:],
+}
+KEY_SECTION = {key: section for section, keys in SECTION_KEYS.items() for key in keys}
+
+_SECTION_CUES = {
+    "personal": r'\b(born|birth\w*|age[ds]?|years old|blood|nationality|citizen\w*|hometown|native|emergency)\b',
+    "professional": r'\b(join\w*|role|position|designation|salary|salaries|compensation|organi[sz]ation|company|'
+                    r'employ\w*|career|promot\w*|worked|serves|inr|usd|professional)\b',
+    "academic": r'\b(school|12th|10th|board|college|universit\w*|degree|b\.?tech|m\.?tech|bachelor\w*|master\w*|'
+                r'cgpa|gpa|graduat\w*|undergraduate|thesis|academic|subjects)\b',
+    "certifications": r'\b(certif\w*|exam|credential|pmp|pmi|agilist)\b',
+    "technical": r'\b(proficien\w*|skills?|expertise|sql|python|machine learning|visuali[sz]ation|power bi|'
+                 r'tableau|out of 10)\b',
+}
+_CUES = {section: re.compile(pattern, re.IGNORECASE) for section, pattern in _SECTION_CUES.items()}
+# a sentence without cues continues the section before it; as a tie-breaker
+# the current section gets this much extra weight
+_CARRY_WEIGHT = 0.5
+# table-like text has few sentence ends; split long multi-line "sentences" by line
+_LONG_SENTENCE = 200
+_NON_ALNUM = re.compile(r'[\W_]+')
+
+
+def _units(text: str) -> List[str]:
+    units = []
+    for sentence in SpanIndex.build(text).sentences:
+        raw = text[sentence.start:sentence.end]
+        if len(sentence.text) > _LONG_SENTENCE and "\n" in raw:
+            units.extend(" ".join(line.split()) for line in raw.splitlines() if line.strip())
+        else:
+            units.append(sentence.text)
+    return units
+
+
+def split_sections(text: str) -> Dict[str, List[str]]:
+    """The text's sentences grouped by schema section, in reading order."""
+    sections: Dict[str, List[str]] = {name: [] for name in SECTION_KEYS}
+    current = "personal"
+    for unit in _units(text):
+        scores = {name: len(cue.findall(unit)) for name, cue in _CUES.items()}
+        if any(scores.values()):
+            scores[current] += _CARRY_WEIGHT
+            current = max(scores, key=scores.get)
+        sections[current].append(unit)
+    return sections
+
+
+def _fingerprint(sentences: List[str]) -> str:
+    return hashlib.sha256("\n".join(_NON_ALNUM.sub("", s.lower()) for s in sentences).encode("utf-8")).hexdigest()
+
+
+# --- VERSIONS ---
+class DocumentVersion(BaseModel):
+    doc_id: str
+    sections: Dict[str, List[str]]
+    facts: List[ExtractedFact]
+
+
+class VersionStore:
+    """Last extracted version of each document: its sections and facts."""
+
+    def __init__(self, directory: str = DEFAULT_VERSIONS_DIR):
+        # versions are the baseline for the next revision, so they do not expire
+        self._store = ResultCache(directory, max_entries=None, max_bytes=None, max_age=None)
+
+    @staticmethod
+    def _key(doc_id: str) -> str:
+        return hashlib.sha256(doc_id.encode("utf-8")).hexdigest()
+
+    def get(self, doc_id: str) -> Optional[DocumentVersion]:
+        return self._store.get(self._key(doc_id), DocumentVersion)
+
+    def put(self, version: DocumentVersion) -> None:
+        self._store.put(self._key(version.doc_id), version)
+
+
+def changed_sections(previous: Dict[str, List[str]], current: Dict[str, List[str]]) -> List[str]:
+    return [name for name in SECTION_KEYS
+            if _fingerprint(previous.get(name, [])) != _fingerprint(current.get(name, []))]
+
+
+def keys_to_refresh(previous: DocumentVersion, changed: List[str]) -> List[str]:
+    """Keys whose own section or any section supporting their stored value changed, plus empty ones."""
+    if not changed:
+        return []
+    changed_set = set(changed)
+    stored = {f.key: f for f in previous.facts}
+    refresh = []
+    for key in KEY_ORDER:
+        fact = stored.get(key)
+        if KEY_SECTION[key] in changed_set or fact is None or not (fact.value or "").strip():
+            refresh.append(key)
+            continue
+        if any(supports(fact, sentence) for name in changed for sentence in previous.sections.get(name, [])):
+            refresh.append(key)
+    return refresh
+
+
+# --- EXTRACTION ---
+def extract_incremental(text_content: str, doc_id: str, store: VersionStore, use_rules: bool = True,
+                        min_confidence: float = DEFAULT_MIN_CONFIDENCE, offline: bool = False,
+                        **options) -> Optional[DocumentStructure]:
+    """
+    extract_document for a revision of `doc_id`: only keys supported by
+    changed sections are re-extracted, from the changed sections only. The
+    first version of a document is extracted in full. `options` are passed
+    to extract_document (client, cache, token_report, span_mode...). The new
+    version is stored unless offline.
+    """
+    sections = split_sections(text_content)
+    previous = store.get(doc_id)
+
+    with TRACER.stage("incremental", first_version=previous is None) as span:
+        if previous is None:
+            changed, refresh = list(SECTION_KEYS), list(KEY_ORDER)
+        else:
+            changed = changed_sections(previous.sections, sections)
+            refresh = keys_to_refresh(previous, changed)
+        span.set(changed_sections=len(changed), keys=len(refresh))
+
+    if previous is None:
+        parsed = extract_document(text_content, use_rules=use_rules, min_confidence=min_confidence,
+                                  offline=offline, **options)
+        if parsed is None:
+            return None
+        facts = {f.key: f for f in parsed.facts}
+    else:
+        logger.info("%s: sections changed: %s; re-extracting %d keys", doc_id, ", ".join(changed) or "none",
+                    len(refresh))
+        facts = {f.key: f for f in previous.facts if f.key not in refresh}
+        if refresh:
+            source = "\n".join(sentence for name in SECTION_KEYS if name in changed for sentence in sections[name])
+            # the changed sections are not a document of their own: keep them out of the near-dup index
+            options = {name: value for name, value in options.items() if name != "near_dup"}
+            parsed = extract_document(source, use_rules=False, offline=offline, keys=refresh, **options)
+            if parsed is None:
+                return None
+            unchanged = [sentence for name in SECTION_KEYS if name not in changed for sentence in sections[name]]
+            stored = {f.key: f for f in previous.facts}
+            returned = {f.key: f for f in parsed.facts}
+            for key in refresh:
+                fact, old = returned.get(key), stored.get(key)
+                # left out or empty in the changed sections, but still stated elsewhere: keep it
+                if ((fact is None or not fact.value.strip()) and old is not None and old.value.strip()
+                        and any(supports(old, sentence) for sentence in unchanged)):
+                    fact = old
+                if fact is not None:
+                    facts[key] = fact
+        # rules see the whole text, as in a full extraction
+        apply_rule_facts(facts, extract_rule_facts(text_content, use_rules, min_confidence))
+
+    result = DocumentStructure(facts=ensure_full_coverage(list(facts.values()), KEY_ORDER))
+    if not offline:
+        store.put(DocumentVersion(doc_id=doc_id, sections=sections, facts=result.facts))
+    return result
@@ -0,0 +1,196 @@
+# instrumentation.py
+"""
+Lightweight per-stage tracing for the extraction pipeline.
+
+Pipeline code wraps each stage in `with TRACER.stage("name") as span:` and
+may attach attributes (bytes in/out, tokens, cache hits...) to the span.
+When tracing is disabled (the default) stage() returns a shared no-op
+context, so the cost is one attribute check per stage.
+
+When enabled, each finished span records wall and CPU time and is
+- emitted as one JSON line on the "extraction.trace" logger (json_logs),
+- aggregated into an in-process MetricsRegistry (registry), and
+- appended to any active collect() list, which the Streamlit panel uses to
+  show the breakdown of a single extraction.
+
+A collect() block records spans even while tracing is disabled, for the
+code running inside it only (log lines and the registry stay off), so one
+session of a multi-user server can time its own run without switching
+tracing on for everyone.
+"""
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Optional
+
+trace_logger = logging.getLogger("extraction.trace")
+
+_collectors: contextvars.ContextVar[Optional[List["Span"]]] = contextvars.ContextVar("collectors", default=None)
+_document: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("document", default=None)
+
+
+@dataclass
+class Span:
+    stage: str
+    document: Optional[str] = None
+    wall_ms: float = 0.0
+    cpu_ms: float = 0.0
+    attrs: Dict[str, object] = field(default_factory=dict)
+
+    def set(self, **attrs) -> None:
+        self.attrs.update(attrs)
+
+    def as_dict(self) -> dict:
+        return {"stage": self.stage, "document": self.document, "wall_ms": round(self.wall_ms, 3),
+                "cpu_ms": round(self.cpu_ms, 3), **self.attrs}
+
+
+class _NoopSpan:
+    def set(self, **attrs) -> None:
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP = _NoopSpan()
+
+
+# --- METRICS ---
+@dataclass
+class StageStats:
+    count: int = 0
+    errors: int = 0
+    wall_ms_total: float = 0.0
+    wall_ms_max: float = 0.0
+    cpu_ms_total: float = 0.0
+    bytes_in: int = 0
+    bytes_out: int = 0
+
+
+class MetricsRegistry:
+    """Thread-safe in-process aggregates: per-stage timing/bytes plus named counters."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stages: Dict[str, StageStats] = {}
+        self.counters: Dict[str, float] = {}
+
+    def observe(self, span: Span, failed: bool = False) -> None:
+        with self._lock:
+            s = self.stages.setdefault(span.stage, StageStats())
+            s.count += 1
+            s.errors += failed
+            s.wall_ms_total += span.wall_ms
+            s.wall_ms_max = max(s.wall_ms_max, span.wall_ms)
+            s.cpu_ms_total += span.cpu_ms
+            s.bytes_in += int(span.attrs.get("bytes_in", 0) or 0)
+            s.bytes_out += int(span.attrs.get("bytes_out", 0) or 0)
+            for name in ("prompt_tokens", "completion_tokens", "cached_tokens"):
+                if span.attrs.get(name):
+                    self.counters[name] = self.counters.get(name, 0) + span.attrs[name]
+            if "cache_hit" in span.attrs:
+                name = "cache_hits" if span.attrs["cache_hit"] else "cache_misses"
+                self.counters[name] = self.counters.get(name, 0) + 1
+
+    def incr(self, name: str, value: float = 1) -> None:
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "stages": {name: {**vars(s), "wall_ms_mean": s.wall_ms_total / s.count if s.count else 0.0}
+                           for name, s in self.stages.items()},
+                "counters": dict(self.counters),
+            }
+
+
+# --- TRACER ---
+class Tracer:
+    def __init__(self):
+        self.enabled = False
+        self.json_logs = False
+        self.registry: Optional[MetricsRegistry] = None
+
+    def configure(self, enabled: bool = True, json_logs: bool = True,
+                  registry: Optional[MetricsRegistry] = None) -> "Tracer":
+        self.enabled = enabled
+        self.json_logs = json_logs
+        self.registry = registry
+        return self
+
+    @property
+    def active(self) -> bool:
+        """Whether spans opened here are recorded: tracing is on, or a collect() block is open."""
+        return self.enabled or _collectors.get() is not None
+
+    def stage(self, name: str, **attrs):
+        if not self.active:
+            return _NOOP
+        return self._span(name, attrs)
+
+    @contextmanager
+    def _span(self, name: str, attrs: dict) -> Iterator[Span]:
+        span = Span(stage=name, document=_document.get(), attrs=dict(attrs))
+        wall, cpu = time.perf_counter(), time.thread_time()
+        failed = False
+        try:
+            yield span
+        except BaseException as e:
+            failed = True
+            span.set(error=type(e).__name__)
+            raise
+        finally:
+            span.wall_ms = (time.perf_counter() - wall) * 1000
+            span.cpu_ms = (time.thread_time() - cpu) * 1000
+            self._emit(span, failed)
+
+    def _emit(self, span: Span, failed: bool) -> None:
+        if self.enabled and self.json_logs:
+            trace_logger.info(json.dumps(span.as_dict(), default=str))
+        if self.enabled and self.registry is not None:
+            self.registry.observe(span, failed)
+        collector = _collectors.get()
+        if collector is not None:
+            collector.append(span)
+
+    def incr(self, name: str, value: float = 1) -> None:
+        """Count an event (e.g. a retry) outside any particular span."""
+        if self.enabled and self.registry is not None:
+            self.registry.incr(name, value)
+
+    @contextmanager
+    def document(self, name: str) -> Iterator[None]:
+        """Tag spans opened inside this block with a document name."""
+        token = _document.set(name)
+        try:
+            yield
+        finally:
+            _document.reset(token)
+
+    @contextmanager
+    def collect(self, spans: Optional[List[Span]] = None) -> Iterator[List[Span]]:
+        """Gather the spans finished inside this block (including worker threads
+        started with contextvars.copy_context()), into `spans` if given: its
+        append() is called as each span finishes."""
+        spans = [] if spans is None else spans
+        token = _collectors.set(spans)
+        try:
+            yield spans
+        finally:
+            _collectors.reset(token)
+
+
+TRACER = Tracer()
+
+if os.environ.get("EXTRACTION_TRACE", "").lower() in ("1", "true", "yes"):
+    TRACER.configure(enabled=True, json_logs=True, registry=MetricsRegistry())
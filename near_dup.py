@@ -0,0 +1,331 @@
+# near_dup.py
+"""
+Near-duplicate detection over extracted PDF text.
+
+Resubmissions of the same resume with small edits (a new phone number, a
+reflowed layout) miss the exact-hash ResultCache and would each cost a full
+LLM call. This index finds them:
+
+- each document's text is cut into word 5-gram shingles and summarised by a
+  128-value MinHash signature (the share of equal values estimates the
+  Jaccard similarity of the shingle sets);
+- the signature is split into 16 bands of 8 rows, and each band is hashed
+  into an LSH bucket, so a lookup is 16 indexed point queries in SQLite no
+  matter how many documents are stored;
+- candidates sharing a bucket are ranked by signature similarity, and the
+  best one at or above the threshold is returned with its text and facts.
+
+extract_document then reuses that document's facts and asks the model only
+about the sentences that changed (see sentence_diff and stale_keys).
+
+The index is a single SQLite file in WAL mode, safe for the threads of one
+batch. Each document is stored with a tag for the setup that produced its
+facts (extract_document uses the prompt template's cache tag and the
+backend's cache namespace, as ResultCache keys do), and find() only returns
+documents with the caller's tag, so changing the prompt, model or backend
+never reuses facts from the old setup.
+"""
+import hashlib
+import logging
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from collections import Counter
+from dataclasses import dataclass
+from typing import Iterable, List, NamedTuple, Optional, Set, Tuple
+
+import numpy as np
+
+from normalize import DATE_KEYS, parse_date_to_natural
+from span_index import SpanIndex
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INDEX_PATH = ".near_dup_index.sqlite"
+DEFAULT_THRESHOLD = 0.8
+NUM_PERM = 128
+BANDS = 16
+SHINGLE_WORDS = 5
+MAX_CANDIDATES = 8
+
+_SHINGLE_MIX = np.uint64(0x100000001B3)  # FNV prime; combines word hashes into shingle hashes
+_WORD = re.compile(r'\w+')
+_NON_ALNUM = re.compile(r'[\W_]+')
+_ALNUM = re.compile(r'[^\W_]+')
+
+
+# --- MINHASH ---
+def _permutations(num_perm: int, seed: int) -> Tuple[np.ndarray, np.ndarray]:
+    # multiply-shift hashing: (a * x + b) mod 2**64, top 32 bits; a must be odd
+    rng = np.random.default_rng(seed)
+    a = rng.integers(0, 2 ** 63, size=num_perm, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+    b = rng.integers(0, 2 ** 63, size=num_perm, dtype=np.uint64)
+    return a[:, None], b[:, None]
+
+
+def shingle_hashes(text: str, size: int = SHINGLE_WORDS) -> np.ndarray:
+    """Distinct 64-bit hashes of the text's word `size`-grams (one gram for shorter texts)."""
+    words = _WORD.findall(text.lower())
+    if not words:
+        return np.empty(0, dtype=np.uint64)
+    word_hashes = np.fromiter((zlib.crc32(w.encode("utf-8")) for w in words), dtype=np.uint64, count=len(words))
+    size = min(size, len(words))
+    count = len(words) - size + 1
+    grams = np.zeros(count, dtype=np.uint64)
+    for offset in range(size):
+        # wraps mod 2**64, which is what we want
+        grams = grams * _SHINGLE_MIX + word_hashes[offset:offset + count]
+    return np.unique(grams)
+
+
+class MinHasher:
+    def __init__(self, num_perm: int = NUM_PERM, seed: int = 1, shingle_words: int = SHINGLE_WORDS):
+        self.num_perm = num_perm
+        self.shingle_words = shingle_words
+        self._a, self._b = _permutations(num_perm, seed)
+
+    def signature(self, text: str) -> Optional[np.ndarray]:
+        """uint32 MinHash signature of the text's shingles; None for text without words."""
+        grams = shingle_hashes(text, self.shingle_words)
+        if not len(grams):
+            return None
+        return ((self._a * grams[None, :] + self._b) >> np.uint64(32)).min(axis=1).astype(np.uint32)
+
+
+def similarity(a: np.ndarray, b: np.ndarray) -> float:
+    """Estimated Jaccard similarity of two signatures."""
+    return float(np.count_nonzero(a == b)) / len(a)
+
+
+def band_buckets(signature: np.ndarray, bands: int = BANDS) -> List[int]:
+    """One signed 64-bit bucket id per band (band number included, so bands never collide)."""
+    out = []
+    for band, rows in enumerate(np.split(signature, bands)):
+        digest = hashlib.blake2b(rows.tobytes(), digest_size=8, salt=band.to_bytes(2, "big")).digest()
+        out.append(int.from_bytes(digest, "big", signed=True))
+    return out
+
+
+# --- INDEX ---
+@dataclass
+class NearDuplicate:
+    doc_id: int
+    similarity: float
+    text: str
+    facts_json: str
+
+
+@dataclass
+class IndexStats:
+    lookups: int = 0
+    matches: int = 0
+    added: int = 0
+
+
+class NearDuplicateIndex:
+    """
+    Persistent MinHash/LSH index of processed documents. find() returns the
+    most similar stored document with the same tag at or above `threshold`;
+    add() stores a document with its facts (serialised by the caller, e.g.
+    model_dump_json) and tag.
+    """
+
+    def __init__(self, path: str = DEFAULT_INDEX_PATH, threshold: float = DEFAULT_THRESHOLD,
+                 num_perm: int = NUM_PERM, bands: int = BANDS, seed: int = 1):
+        if num_perm % bands:
+            raise ValueError(f"num_perm ({num_perm}) must be a multiple of bands ({bands})")
+        self.path = path
+        self.threshold = threshold
+        self.bands = bands
+        self.hasher = MinHasher(num_perm, seed)
+        self.stats = IndexStats()
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT NOT NULL);
+            CREATE TABLE IF NOT EXISTS documents (
+                id INTEGER PRIMARY KEY,
+                text_hash TEXT NOT NULL UNIQUE,
+                signature BLOB NOT NULL,
+                text BLOB NOT NULL,
+                facts BLOB NOT NULL,
+                created REAL NOT NULL,
+                tag TEXT NOT NULL DEFAULT ''
+            );
+            CREATE TABLE IF NOT EXISTS buckets (bucket INTEGER NOT NULL, doc_id INTEGER NOT NULL);
+            CREATE INDEX IF NOT EXISTS buckets_by_bucket ON buckets (bucket);
+        """)
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(documents)")}
+        if "tag" not in columns:
+            # indexes from before tags: their untagged documents match no lookup
+            self._db.execute("ALTER TABLE documents ADD COLUMN tag TEXT NOT NULL DEFAULT ''")
+        self._check_layout(f"multiply-shift/{num_perm}/{bands}/{seed}/{SHINGLE_WORDS}")
+
+    def _check_layout(self, layout: str) -> None:
+        # signatures from a different permutation set are not comparable
+        row = self._db.execute("SELECT value FROM meta WHERE name = 'layout'").fetchone()
+        if row is None:
+            self._db.execute("INSERT INTO meta VALUES ('layout', ?)", (layout,))
+        elif row[0] != layout:
+            raise ValueError(f"{self.path} was built with MinHash layout {row[0]}, not {layout}")
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+    @staticmethod
+    def _text_hash(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def find(self, text: str, tag: str = "") -> Optional[NearDuplicate]:
+        """The most similar stored document with this tag at or above the threshold, or None."""
+        signature = self.hasher.signature(text)
+        with self._lock:
+            self.stats.lookups += 1
+            if signature is None:
+                return None
+            row = self._db.execute("SELECT id FROM documents WHERE text_hash = ? AND tag = ?",
+                                   (self._text_hash(text), tag)).fetchone()
+            if row is not None:
+                best, best_score = row[0], 1.0
+            else:
+                buckets = band_buckets(signature, self.bands)
+                hits = Counter(doc_id for (doc_id,) in self._db.execute(
+                    "SELECT doc_id FROM buckets JOIN documents ON documents.id = buckets.doc_id "
+                    f"WHERE bucket IN ({','.join('?' * len(buckets))}) AND tag = ?", (*buckets, tag)))
+                best, best_score = None, 0.0
+                for doc_id, _ in hits.most_common(MAX_CANDIDATES):
+                    stored = self._db.execute("SELECT signature FROM documents WHERE id = ?", (doc_id,)).fetchone()
+                    score = similarity(signature, np.frombuffer(stored[0], dtype=np.uint32))
+                    if score > best_score:
+                        best, best_score = doc_id, score
+                if best is None or best_score < self.threshold:
+                    return None
+            stored_text, facts = self._db.execute(
+                "SELECT text, facts FROM documents WHERE id = ?", (best,)).fetchone()
+            self.stats.matches += 1
+        return NearDuplicate(doc_id=best, similarity=best_score,
+                             text=zlib.decompress(stored_text).decode("utf-8"),
+                             facts_json=zlib.decompress(facts).decode("utf-8"))
+
+    def add(self, text: str, facts_json: str, tag: str = "") -> Optional[int]:
+        """
+        Store a processed document; an identical text replaces the stored
+        facts and tag. None for empty text.
+        """
+        signature = self.hasher.signature(text)
+        if signature is None:
+            return None
+        text_hash = self._text_hash(text)
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._db.execute("SELECT id FROM documents WHERE text_hash = ?", (text_hash,)).fetchone()
+                if row is not None:
+                    doc_id = row[0]
+                    self._db.execute("UPDATE documents SET facts = ?, tag = ? WHERE id = ?",
+                                     (zlib.compress(facts_json.encode("utf-8")), tag, doc_id))
+                else:
+                    doc_id = self._db.execute(
+                        "INSERT INTO documents (text_hash, signature, text, facts, created, tag) "
+                        "VALUES (?, ?, ?, ?, ?, ?)",
+                        (text_hash, signature.tobytes(), zlib.compress(text.encode("utf-8")),
+                         zlib.compress(facts_json.encode("utf-8")), time.time(), tag)).lastrowid
+                    self._db.executemany("INSERT INTO buckets VALUES (?, ?)",
+                                         [(bucket, doc_id) for bucket in band_buckets(signature, self.bands)])
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self.stats.added += 1
+        return doc_id
+
+
+# --- DIFF ---
+def _norm(text: str) -> str:
+    return _NON_ALNUM.sub("", text.lower())
+
+
+def sentence_diff(old_text: str, new_text: str) -> Tuple[List[str], List[str], List[str]]:
+    """(added, removed, kept) sentences between two versions of a document, in reading order."""
+    old = [s.text for s in SpanIndex.build(old_text).sentences]
+    new = [s.text for s in SpanIndex.build(new_text).sentences]
+    old_norm = {_norm(s) for s in old}
+    new_norm = {_norm(s) for s in new}
+    added = [s for s in new if _norm(s) not in old_norm]
+    kept = [s for s in new if _norm(s) in old_norm]
+    removed = [s for s in old if _norm(s) not in new_norm]
+    return added, removed, kept
+
+
+class _Sentence(NamedTuple):
+    """A sentence prepared for value lookups: its _norm text, its words, and
+    where in the _norm text each of its words starts and ends."""
+    norm: str
+    words: Set[str]
+    starts: Set[int]
+    ends: Set[int]
+
+
+def _prepare(sentence: str) -> _Sentence:
+    lower = sentence.lower()
+    parts, starts, ends, pos = [], set(), set(), 0
+    for part in _ALNUM.findall(lower):
+        starts.add(pos)
+        pos += len(part)
+        ends.add(pos)
+        parts.append(part)
+    return _Sentence("".join(parts), set(_WORD.findall(lower)), starts, ends)
+
+
+def _states(value_norm: str, sentence: _Sentence) -> bool:
+    """Whether value_norm occurs in the sentence as whole words: "9.2" is in "cgpa of 9.2" and
+    "350000" in "350,000 INR", but neither "9.2" nor "2021" is in "920 out of 1000" or "20210"."""
+    start = sentence.norm.find(value_norm)
+    while start >= 0:
+        if start in sentence.starts and start + len(value_norm) in sentence.ends:
+            return True
+        start = sentence.norm.find(value_norm, start + 1)
+    return False
+
+
+def _supports(fact, sentence: _Sentence) -> bool:
+    value = str(fact.value or "").strip()
+    if not value:
+        context = _norm(fact.context or "")
+        return bool(context) and (sentence.norm in context or context in sentence.norm)
+    value_norm = _norm(value)
+    if len(value_norm) > 1 and _states(value_norm, sentence):
+        return True
+    if fact.key in DATE_KEYS:
+        # ISO values against prose dates: day, month name and year all present
+        words = set(_WORD.findall(parse_date_to_natural(value).lower()))
+        return bool(words) and words <= sentence.words
+    return False
+
+
+def supports(fact, sentence: str) -> bool:
+    """Whether a sentence states the fact's value as whole words (or, for valueless facts, holds its context)."""
+    return _supports(fact, _prepare(sentence))
+
+
+def stale_keys(facts: Iterable, removed: List[str], kept: List[str]) -> Set[str]:
+    """
+    Keys of reused facts whose supporting text is gone: stated in a removed
+    sentence and in none of the sentences the new version kept.
+    """
+    removed_p, kept_p = [_prepare(s) for s in removed], [_prepare(s) for s in kept]
+    stale = set()
+    for fact in facts:
+        if (any(_supports(fact, s) for s in removed_p)
+                and not any(_supports(fact, s) for s in kept_p)):
+            stale.add(fact.key)
+    return stale
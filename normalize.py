@@ -0,0 +1,297 @@
+# normalize.py
+"""
+Value normalisation: dates, scores and per-key cleaning.
+
+Everything the cleaners need is built once at import: date formats are
+precompiled regexes that mirror what datetime.strptime accepts (tried in the
+same order, without raising on every miss), month names are a fixed table,
+and each key's branch is looked up in a key -> field-type map instead of
+re-testing substrings on every call. The public functions are wrapped in
+bounded LRU caches because the same dates, currencies and degree names come
+back over and over in large batches.
+
+Output is identical to the original per-call implementations.
+"""
+import re
+from datetime import datetime
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+MONTH_NAMES = ["January", "February", "March", "April", "May", "June", "July",
+               "August", "September", "October", "November", "December"]
+_MONTH_NUMBERS: Dict[str, int] = {m.lower(): i for i, m in enumerate(MONTH_NAMES, start=1)}
+_MONTH_ABBR_NUMBERS: Dict[str, int] = {m[:3].lower(): i for i, m in enumerate(MONTH_NAMES, start=1)}
+
+# --- DATE PATTERNS (same directives and order as the original strptime formats) ---
+_Y = r'(?P<Y>\d\d\d\d)'
+_M = r'(?P<m>1[0-2]|0[1-9]|[1-9])'
+_D = r'(?P<d>3[0-1]|[1-2]\d|0[1-9]|[1-9]| [1-9])'
+_B = '(?P<B>' + '|'.join(sorted(_MONTH_NUMBERS, key=len, reverse=True)) + ')'
+_BABBR = '(?P<b>' + '|'.join(_MONTH_ABBR_NUMBERS) + ')'
+
+_DATE_FORMATS = [
+    f'{_Y}-{_M}-{_D}',             # %Y-%m-%d
+    f'{_D}-{_M}-{_Y}',             # %d-%m-%Y
+    f'{_D}/{_M}/{_Y}',             # %d/%m/%Y
+    f'{_Y}/{_M}/{_D}',             # %Y/%m/%d
+    fr'{_D}\s+{_B}\s+{_Y}',        # %d %B %Y
+    fr'{_B}\s+{_D},\s+{_Y}',       # %B %d, %Y
+    fr'{_D}\s+{_BABBR}\s+{_Y}',    # %d %b %Y
+    fr'{_BABBR}\s+{_D},\s+{_Y}',   # %b %d, %Y
+    fr'{_D}\.{_M}\.{_Y}',          # %d.%m.%Y
+    fr'{_Y}\.{_M}\.{_D}',          # %Y.%m.%d
+    f'{_M}/{_D}/{_Y}',             # %m/%d/%Y
+    f'{_M}-{_D}-{_Y}',             # %m-%d-%Y
+]
+_DATE_REGEXES = [re.compile(p, re.IGNORECASE) for p in _DATE_FORMATS]
+
+_ISO_PREFIX = re.compile(r'\d{4}[-/]\d{1,2}[-/]\d{1,2}')
+_DIGIT_RUNS = re.compile(r'\d+')
+_NON_DIGITS = re.compile(r'\D')
+
+# --- NUMBER PATTERNS ---
+_SCORE_SEPARATORS = re.compile(r'[,\s]+')
+_PLAIN_DECIMAL = re.compile(r'[+-]?\d+(\.\d*)?|[+-]?\.\d+', re.ASCII)
+_NUMBER_LIKE = re.compile(r'\d+(,\d+)*(\.\d+)?(%?)')
+_PLAIN_INT = re.compile(r'\d+')
+_FRACTION = re.compile(r'0\.\d+')
+
+
+def _natural(dt: datetime) -> str:
+    return f"{dt.day} {MONTH_NAMES[dt.month - 1]} {dt.year}"
+
+
+def _match_format(s: str) -> Optional[datetime]:
+    for regex in _DATE_REGEXES:
+        m = regex.match(s)
+        # strptime rejects trailing characters rather than backtracking
+        if m is None or m.end() != len(s):
+            continue
+        parts = m.groupdict()
+        if parts.get('m'):
+            month = int(parts['m'])
+        elif parts.get('B'):
+            month = _MONTH_NUMBERS[parts['B'].lower()]
+        else:
+            month = _MONTH_ABBR_NUMBERS[parts['b'].lower()]
+        try:
+            return datetime(int(parts['Y']), month, int(parts['d']))
+        except ValueError:
+            continue
+    return None
+
+
+def _from_components(s: str) -> Optional[datetime]:
+    """Heuristic: first three digit runs as year-month-day or day-month-year."""
+    parts = _DIGIT_RUNS.findall(s)
+    if len(parts) < 3:
+        return None
+    if len(parts[0]) == 4:
+        y, m, d = parts[0], parts[1], parts[2]
+    else:
+        d, m, y = parts[0], parts[1], parts[2]
+        # if y is 2-digit assume 19xx/20xx
+        if len(y) == 2:
+            y = "19" + y if int(y) > 30 else "20" + y
+    try:
+        return datetime(int(y), int(m), int(d))
+    except (ValueError, OverflowError):
+        return None
+
+
+def _from_month_word(s: str) -> Optional[datetime]:
+    """Verbose dates like "March 15 1989": month name plus nearby day and year."""
+    words = s.replace(',', '').split()
+    try:
+        for i, w in enumerate(words):
+            month = _MONTH_NUMBERS.get(w.strip().lower())
+            if month is None:
+                continue
+            day = None
+            year = None
+            # day could be previous or next token
+            if i > 0:
+                maybe = _NON_DIGITS.sub('', words[i - 1])
+                if maybe.isdigit():
+                    day = maybe
+            if i + 1 < len(words):
+                maybe = _NON_DIGITS.sub('', words[i + 1])
+                if maybe.isdigit():
+                    year = maybe
+            if not day:
+                for tok in words:
+                    if tok.isdigit() and 1 <= int(tok) <= 31:
+                        day = tok
+                        break
+            if not year:
+                for tok in words[::-1]:
+                    if tok.isdigit() and len(tok) == 4:
+                        year = tok
+                        break
+            if day and year:
+                return datetime(int(year), month, int(day))
+    except (ValueError, OverflowError):
+        # a bad candidate ends the search, as before
+        pass
+    return None
+
+
+# --- PUBLIC HELPERS ---
+@lru_cache(maxsize=65536)
+def parse_date_to_natural(value: str) -> str:
+    """
+    Convert an incoming date (ISO or many common variants) into the format:
+    '15 March 1989'  (Day MonthName Year)
+    If parsing fails, return the original string (trimmed).
+    """
+    if not value or not str(value).strip():
+        return ""
+    s = str(value).strip()
+    # remove time portion if present
+    s = s.split("T")[0] if "T" in s else s
+    s = s.split()[0] if " " in s and _ISO_PREFIX.match(s) else s
+
+    dt = _match_format(s) or _from_components(s) or _from_month_word(s)
+    return _natural(dt) if dt is not None else s
+
+
+def _to_float(s: str) -> Optional[float]:
+    if _PLAIN_DECIMAL.fullmatch(s):
+        return float(s)
+    # float() also takes forms like '1e3', 'inf' or '1_000'
+    try:
+        return float(s)
+    except ValueError:
+        return None
+
+
+def _percent(num: float) -> str:
+    # keep one decimal if fraction part exists
+    return f"{int(num)}%" if num % 1 == 0 else f"{round(num, 1)}%"
+
+
+@lru_cache(maxsize=65536)
+def format_score_as_percentage(value: str) -> str:
+    """
+    Convert scores to percentage string:
+    - if input like "0.925" -> "92.5%"
+    - if input like "92.5" -> "92.5%"
+    - if input already "92.5%" or "92%" -> normalize to one decimal if needed
+    - if input is empty -> ""
+    """
+    if not value:
+        return ""
+    s = str(value).strip()
+    # remove commas and stray spaces
+    s_clean = _SCORE_SEPARATORS.sub('', s)
+    if '%' in s_clean:
+        num = _to_float(s_clean.replace('%', ''))
+        return s if num is None else _percent(num)
+    num = _to_float(s_clean)
+    if num is not None:
+        # value between 0 and 1 (like 0.925)
+        if 0 < num <= 1:
+            return _percent(num * 100)
+        # already in 1-100 range
+        if 1 < num <= 1000:
+            return _percent(num)
+    return s
+
+
+# --- KEY DISPATCH ---
+DATE_KEYS = {'Date of Birth', 'Joining Date of first professional role', 'Current Joining Date', 'Previous Joining Date'}
+_NUMERIC_INDICATORS = ['salary', 'cgpa', 'score', 'year', 'date', 'joining', 'age']
+
+# (key substring, old, new) replacements applied to text values of matching keys
+_KEY_REPLACEMENTS = [
+    ('Designation of first professional role', 'JuniorDeveloper', 'Junior Developer'),
+    ('Current Designation', 'SeniorDataEngineer', 'Senior Data Engineer'),
+    ('Current Organization', 'ResseAnalytics', 'Resse Analytics'),
+]
+
+
+@lru_cache(maxsize=None)
+def field_type(key: str) -> str:
+    """Which cleaning branch a key takes: date, score, age, cgpa, numeric or text."""
+    if key in DATE_KEYS:
+        return "date"
+    lowered = key.lower()
+    if 'score' in lowered:
+        return "score"
+    if any(ind in lowered for ind in _NUMERIC_INDICATORS):
+        if key == 'Age':
+            return "age"
+        if 'CGPA' in key:
+            return "cgpa"
+        return "numeric"
+    return "text"
+
+
+@lru_cache(maxsize=None)
+def _text_replacements(key: str) -> List[Tuple[str, str]]:
+    return [(old, new) for part, old, new in _KEY_REPLACEMENTS if part in key]
+
+
+def _format_cgpa(v: str) -> str:
+    num = _to_float(v)
+    if num is None:
+        return v
+    # show as minimal representation
+    if num.is_integer():
+        return str(int(num))
+    text = str(num)
+    return text.rstrip('0').rstrip('.') if '.' in text else text
+
+
+def _clean_text(tv: str, key: str) -> str:
+    # textual normalization heuristics
+    if 'B.Tech' in tv and 'Computer Science' in tv:
+        tv = 'B.Tech (Computer Science)'
+    if 'M.Tech' in tv and 'Data Science' in tv:
+        tv = 'M.Tech (Data Science)'
+    if key == 'Previous Organization' and 'LakeCorp Solutions' in tv:
+        tv = 'LakeCorp'
+    if key == 'High School' and 'St. Xavier' in tv:
+        if 'Jaipur' not in tv:
+            tv += ', Jaipur'
+        tv = tv.replace('St.Xavier', "St. Xavier's School")
+    for old, new in _text_replacements(key):
+        tv = tv.replace(old, new)
+    if '12th overall board score' in key and _FRACTION.fullmatch(tv):
+        # convert e.g., '0.925' to '92.5%'
+        return format_score_as_percentage(tv)
+    return tv
+
+
+@lru_cache(maxsize=262144)
+def clean_value(value: str, key: str) -> str:
+    """
+    Cleaner that:
+    - Leaves textual values mostly untouched
+    - Standardizes certain known strings
+    - Normalizes numeric-ish fields (removes thousand separators)
+    - Converts CGPA/score fields to appropriate formats when requested
+    - Converts dates to natural English format for display keys
+    """
+    if value is None:
+        return ""
+    value = str(value).strip()
+    if value == "":
+        return ""
+
+    kind = field_type(key)
+    if kind == "date":
+        return parse_date_to_natural(value)
+    if kind == "score":
+        return format_score_as_percentage(value)
+    if kind == "text" and not _NUMBER_LIKE.fullmatch(value.replace(' ', '')):
+        return _clean_text(value, key)
+
+    # numeric: remove thousand separators but keep decimals
+    v = value.replace(',', '').strip()
+    if kind == "age":
+        # plain integer ages get a unit
+        return f"{v} years" if _PLAIN_INT.fullmatch(v) else v
+    if kind == "cgpa":
+        return _format_cgpa(v)
+    return v
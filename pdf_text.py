@@ -0,0 +1,145 @@
+# pdf_text.py
+"""
+Streaming PDF text extraction.
+
+Pages are produced one at a time by a generator and joined in a single pass,
+so extraction is linear in the number of pages. Documents are opened without
+copying them into Python memory where possible (by path, or through a
+memoryview over an upload buffer / mmap), and long documents are split into
+page ranges that are extracted in parallel worker processes.
+"""
+import io
+import mmap
+import os
+from bisect import bisect_right
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Iterator, List, Optional, Tuple, Union
+
+import fitz  # PyMuPDF
+
+PdfSource = Union[str, os.PathLike, bytes, bytearray, memoryview, mmap.mmap, io.IOBase]
+
+# Below this many pages, process start-up costs more than it saves.
+PARALLEL_PAGE_THRESHOLD = 32
+
+
+@dataclass(frozen=True)
+class PageSpan:
+    number: int  # 0-based page index
+    start: int   # offset of the page's first character in the joined text
+    end: int     # offset one past its last character
+
+
+@dataclass
+class ExtractedText:
+    text: str
+    pages: List[PageSpan] = field(default_factory=list)
+
+    def page_at(self, offset: int) -> int:
+        """0-based page number containing the character at offset."""
+        idx = bisect_right(self.pages, offset, key=lambda p: p.start) - 1
+        if idx < 0 or offset >= len(self.text):
+            raise IndexError(f"offset {offset} outside extracted text")
+        return self.pages[idx].number
+
+    def page_text(self, number: int) -> str:
+        span = self.pages[number]
+        return self.text[span.start:span.end]
+
+
+def _as_stream(source: PdfSource):
+    """Return something fitz can open as a stream without copying, or None for paths."""
+    if isinstance(source, (str, os.PathLike)):
+        return None
+    if isinstance(source, (bytes, memoryview)):
+        return source
+    if isinstance(source, (bytearray, mmap.mmap)):
+        return memoryview(source)
+    if hasattr(source, "getbuffer"):
+        # BytesIO / Streamlit UploadedFile: view the existing buffer
+        return source.getbuffer()
+    if hasattr(source, "fileno"):
+        try:
+            return memoryview(mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ))
+        except (OSError, ValueError, io.UnsupportedOperation):
+            pass
+    # defensive: ensure we reset file pointer
+    source.seek(0)
+    return source.read()
+
+
+def open_document(source: PdfSource) -> fitz.Document:
+    stream = _as_stream(source)
+    if stream is None:
+        return fitz.open(os.fspath(source), filetype="pdf")
+    return fitz.open(stream=stream, filetype="pdf")
+
+
+def iter_page_texts(source: PdfSource, start: int = 0, stop: Optional[int] = None) -> Iterator[str]:
+    """Yield the text of pages [start, stop) one page at a time."""
+    doc = source if isinstance(source, fitz.Document) else open_document(source)
+    try:
+        stop = doc.page_count if stop is None else min(stop, doc.page_count)
+        for number in range(start, stop):
+            yield doc.load_page(number).get_text()
+    finally:
+        if doc is not source:
+            doc.close()
+
+
+def _extract_range(source: PdfSource, start: int, stop: int) -> List[str]:
+    # top-level so it can be shipped to worker processes
+    return list(iter_page_texts(source, start, stop))
+
+
+def _page_ranges(page_count: int, parts: int) -> List[Tuple[int, int]]:
+    size = -(-page_count // parts)
+    return [(s, min(s + size, page_count)) for s in range(0, page_count, size)]
+
+
+def _portable(source: PdfSource) -> Union[str, bytes]:
+    """A picklable form of the source for worker processes."""
+    if isinstance(source, (str, os.PathLike)):
+        return os.fspath(source)
+    # only a file opened from disk is known to be named by its path: an
+    # upload's name is just the client's file name, whatever is in the CWD
+    raw = getattr(source, "raw", source)
+    if isinstance(raw, io.FileIO) and isinstance(raw.name, str):
+        return raw.name
+    return bytes(_as_stream(source))
+
+
+def extract_pages(source: PdfSource, workers: Optional[int] = None,
+                  parallel_threshold: int = PARALLEL_PAGE_THRESHOLD) -> ExtractedText:
+    """
+    Extract all pages and join them in one pass, recording where each page
+    starts and ends in the result.
+
+    Documents with at least `parallel_threshold` pages are split into one
+    contiguous page range per worker process (workers defaults to the CPU
+    count; pass workers=1 to stay in-process, e.g. when the caller already
+    parallelises across documents).
+    """
+    doc = open_document(source)
+    try:
+        page_count = doc.page_count
+        workers = workers or os.cpu_count() or 1
+        if workers > 1 and page_count >= parallel_threshold:
+            portable = _portable(source)
+            ranges = _page_ranges(page_count, workers)
+            with ProcessPoolExecutor(max_workers=len(ranges)) as pool:
+                chunks = pool.map(_extract_range, [portable] * len(ranges),
+                                  [s for s, _ in ranges], [e for _, e in ranges])
+                page_texts = [t for chunk in chunks for t in chunk]
+        else:
+            page_texts = list(iter_page_texts(doc))
+    finally:
+        doc.close()
+
+    pages = []
+    offset = 0
+    for number, page in enumerate(page_texts):
+        pages.append(PageSpan(number, offset, offset + len(page)))
+        offset += len(page)
+    return ExtractedText("".join(page_texts), pages)
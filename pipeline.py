@@ -0,0 +1,437 @@
+# pipeline.py
+"""
+UI-independent extraction pipeline.
+
+Everything the Streamlit page needs to turn a PDF into the 37-row schema lives
+here so that headless callers (batch runs, scripts) can reuse it without
+pulling in Streamlit.
+"""
+import openai
+from pydantic import BaseModel, Field
+from typing import Dict, List, Literal, Optional, Tuple, Type, Union
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
+import re
+
+from backends import DEFAULT_MODEL, ExtractionBackend, as_backend
+from instrumentation import TRACER
+from near_dup import NearDuplicate, sentence_diff, stale_keys
+from normalize import clean_value
+from pdf_text import extract_pages
+from prompts import EXTRACTION_PROMPT, PromptTemplate
+from rules import DEFAULT_MIN_CONFIDENCE, pre_extract, resolved
+from span_index import SpanIndex
+from token_budget import (DEFAULT_MAX_PROMPT_TOKENS, DEFAULT_OVERLAP_TOKENS, TokenReport,
+                          cached_tokens, chunk_text, count_tokens, merge_facts)
+
+MODEL_NAME = DEFAULT_MODEL
+
+# --- SCHEMA Match exactly as Expected Output.xlsx) ---
+ExpectedKeys = Literal[
+    "First Name", "Last Name", "Date of Birth", "Birth City", "Birth State",
+    "Age", "Blood Group", "Nationality",
+    "Joining Date of first professional role", "Designation of first professional role",
+    "Salary of first professional role", "Salary currency of first professional role",
+    "Current Organization", "Current Joining Date", "Current Designation",
+    "Current Salary", "Current Salary Currency",
+    "Previous Organization", "Previous Joining Date", "Previous end year",
+    "Previous Starting Designation",
+    "High School", "12th standard pass out year", "12th overall board score",
+    "Undergraduate degree", "Undergraduate college", "Undergraduate year", "Undergraduate CGPA",
+    "Graduation degree", "Graduation college", "Graduation year", "Graduation CGPA",
+    "Certifications 1", "Certifications 2", "Certifications 3", "Certifications 4",
+    "Technical Proficiency"
+]
+
+# Instead define the explicit ordered list of keys for use in code.
+KEY_ORDER = [
+    "First Name", "Last Name", "Date of Birth", "Birth City", "Birth State",
+    "Age", "Blood Group", "Nationality",
+    "Joining Date of first professional role", "Designation of first professional role",
+    "Salary of first professional role", "Salary currency of first professional role",
+    "Current Organization", "Current Joining Date", "Current Designation",
+    "Current Salary", "Current Salary Currency",
+    "Previous Organization", "Previous Joining Date", "Previous end year",
+    "Previous Starting Designation",
+    "High School", "12th standard pass out year", "12th overall board score",
+    "Undergraduate degree", "Undergraduate college", "Undergraduate year", "Undergraduate CGPA",
+    "Graduation degree", "Graduation college", "Graduation year", "Graduation CGPA",
+    "Certifications 1", "Certifications 2", "Certifications 3", "Certifications 4",
+    "Technical Proficiency"
+]
+
+class ExtractedFact(BaseModel):
+    key: ExpectedKeys = Field(..., description="Exact key from schema. Map semantically.")
+    value: str = Field(..., description="Raw value. Output ISO dates/names with spaces; numbers without commas where possible.")
+    context: Optional[str] = Field(None, description="EXACT comment phrase or full sentence verbatim as per examples. Use provided exact strings where matching.")
+
+class DocumentStructure(BaseModel):
+    facts: List[ExtractedFact]
+
+# Span mode: the model cites span IDs of the indexed source text instead of
+# copying the context; span_index.SpanIndex turns them back into the text.
+class SpanFact(BaseModel):
+    key: ExpectedKeys = Field(..., description="Exact key from schema. Map semantically.")
+    value: str = Field(..., description="Raw value. Output ISO dates/names with spaces; numbers without commas where possible.")
+    context_spans: List[str] = Field(default_factory=list, description="IDs of the SOURCE TEXT spans holding the comment, e.g. ['S3.1'] or ['S8', 'S9']. Empty for pure facts.")
+    context: Optional[str] = Field(None, description="Leave empty. Only if no span fits, a short verbatim quote.")
+
+class SpanDocument(BaseModel):
+    facts: List[SpanFact]
+
+# --- CORE LOGIC ---
+def extract_text_from_pdf(uploaded_file, workers: Optional[int] = None) -> str:
+    """
+    Text of every page, joined in order. Accepts a path, bytes or a file-like
+    upload; see pdf_text.extract_pages for per-page offsets.
+    """
+    with TRACER.stage("pdf_extract") as span:
+        extracted = extract_pages(uploaded_file, workers=workers)
+        span.set(pages=len(extracted.pages), bytes_out=len(extracted.text))
+    return extracted.text
+
+def ensure_full_coverage(facts: List[ExtractedFact], key_order: List[str]) -> List[ExtractedFact]:
+    """
+    Ensure we return one ExtractedFact per key in key_order.
+    If a key is missing, create an empty ExtractedFact for that key.
+    """
+    fact_dict = {f.key: f for f in facts}
+    all_facts = []
+    for key in key_order:
+        if key in fact_dict:
+            all_facts.append(fact_dict[key])
+        else:
+            # create an empty fact (Pydantic model) — using the exact Literal keys is important
+            all_facts.append(ExtractedFact(key=key, value="", context=""))
+    return all_facts
+
+def post_process_facts(facts: List[ExtractedFact], original_text: str) -> List[dict]:
+    with TRACER.stage("post_process") as span:
+        rows = _post_process_facts(facts, original_text)
+        span.set(facts_in=len(facts), rows_out=len(rows))
+    return rows
+
+def _post_process_facts(facts: List[ExtractedFact], original_text: str) -> List[dict]:
+    # Ensure all keys
+    facts = ensure_full_coverage(facts, KEY_ORDER)
+
+    rows = []
+    seen = set()
+
+    for fact in facts:
+        if fact.key in seen:
+            continue
+        seen.add(fact.key)
+        rows.append(fact_row(fact))
+
+    return rows
+
+def fact_row(fact: ExtractedFact) -> dict:
+    """One output row (#, Key, Value, Comments) for a single fact."""
+    # Clean value
+    cleaned_val = clean_value(fact.value, fact.key)
+
+    # Refine context if needed (fallback to text search)
+    ctx = fact.context or ""
+    if ctx:
+        ctx = ctx.strip()
+
+    if fact.key == 'Nationality' and ctx:
+        # Safe clean-up regex
+        ctx = re.sub(r'As an Indian national, his ', '', ctx)
+
+    # We remove the specific "Certifications" blocks that injected Vijay's data.
+
+    return {
+        "#": KEY_ORDER.index(fact.key) + 1,
+        "Key": fact.key,
+        "Value": cleaned_val,
+        "Comments": ctx or ""
+    }
+
+# --- PROMPT (see prompts.py: static prefix in the system message, source text after it) ---
+def _key_tuple(keys: Optional[List[str]]) -> Optional[Tuple[str, ...]]:
+    return tuple(keys) if keys is not None else None
+
+def build_messages(text_content: str, keys: Optional[List[str]] = None, spans: Optional[SpanIndex] = None,
+                   template: PromptTemplate = EXTRACTION_PROMPT) -> List[dict]:
+    """With a SpanIndex, the source text is shown with span IDs and the model is asked to cite them."""
+    source = text_content if spans is None else spans.render()
+    return template.messages(source, _key_tuple(keys), span_mode=spans is not None)
+
+def request_schema(keys: Optional[List[str]] = None,
+                   span_mode: bool = False) -> Tuple[Optional[List[str]], Type[BaseModel]]:
+    """
+    Keys in schema order, and the response model. The model is always the
+    full schema, so that it stays part of the shared prompt prefix; a partial
+    request names its keys in the user message and as_document drops the rest.
+    """
+    response_format = SpanDocument if span_mode else DocumentStructure
+    if keys is None:
+        return None, response_format
+    return [k for k in KEY_ORDER if k in set(keys)], response_format
+
+def cache_lookup(cache, text_content: str, keys: Optional[List[str]], response_format: Type[BaseModel],
+                 span_mode: bool = False, template: PromptTemplate = EXTRACTION_PROMPT,
+                 model: str = MODEL_NAME) -> Tuple[Optional[str], Optional[DocumentStructure]]:
+    """(cache key, cached result) for a request; both None without a cache. `model` is the backend's cache namespace."""
+    if cache is None:
+        return None, None
+    with TRACER.stage("cache_lookup") as span:
+        # the template's versioned tag stands in for the prompt text
+        cache_key = cache.make_key(text_content, template.cache_tag(_key_tuple(keys), span_mode),
+                                   model, response_format)
+        cached = cache.get(cache_key, DocumentStructure)
+        span.set(cache_hit=cached is not None)
+    return cache_key, cached
+
+def prepare_prompt(text_content: str, keys: Optional[List[str]],
+                   token_report: Optional[TokenReport] = None, spans: Optional[SpanIndex] = None,
+                   template: PromptTemplate = EXTRACTION_PROMPT) -> List[dict]:
+    """Messages for the request, with their token estimate recorded."""
+    with TRACER.stage("prompt_build") as span:
+        messages = build_messages(text_content, keys, spans, template)
+        if token_report is not None or TRACER.active:
+            # the static prefix is counted once per mode; only the document part is new
+            static = template.prefix_tokens(spans is not None, MODEL_NAME)
+            estimate = static + count_tokens(messages[-1]["content"], MODEL_NAME)
+            span.set(bytes_in=len(text_content), bytes_out=sum(len(m["content"]) for m in messages),
+                     estimated_tokens=estimate, static_tokens=static)
+            if token_report is not None:
+                token_report.add("prompt_build", prompt=estimate)
+    return messages
+
+def resolve_span_fact(fact: BaseModel, spans: SpanIndex) -> ExtractedFact:
+    """ExtractedFact whose context is the source text of the cited spans."""
+    return ExtractedFact(key=fact.key, value=fact.value,
+                         context=spans.resolve_context(fact.context_spans, fact.context))
+
+def as_document(parsed: Optional[BaseModel], keys: Optional[List[str]],
+                spans: Optional[SpanIndex] = None) -> Optional[DocumentStructure]:
+    """
+    Convert a span-mode response back to a DocumentStructure, keeping only
+    the facts of `keys` (all of them when keys is None).
+    """
+    if parsed is None or (keys is None and spans is None):
+        return parsed
+    with TRACER.stage("validate") as span:
+        facts = parsed.facts
+        if spans is not None:
+            facts = [resolve_span_fact(f, spans) for f in facts]
+        if keys is not None:
+            wanted = set(keys)
+            facts = [f for f in facts if f.key in wanted]
+        parsed = DocumentStructure(facts=facts)
+        span.set(facts=len(parsed.facts))
+    return parsed
+
+def process_with_ai(text_content: str, api_key: Optional[str] = None,
+                    client: Union[ExtractionBackend, openai.OpenAI, None] = None, cache=None,
+                    keys: Optional[List[str]] = None, token_report: Optional[TokenReport] = None,
+                    stage: str = "llm", span_mode: bool = False,
+                    template: PromptTemplate = EXTRACTION_PROMPT) -> Optional[DocumentStructure]:
+    """
+    Requests a structured DocumentStructure response from a backend.
+    Caller must supply a valid OpenAI API key, or an already configured
+    client: an ExtractionBackend (see backends.py) or an OpenAI-style client,
+    which is used as an OpenAIBackend (batch runs share one across workers).
+    If keys is given, only those schema keys are requested (named in the
+    user message; the system prompt and schema stay the same) and returned.
+    `template` is the prompt (prompts.get_template), EXTRACTION_PROMPT by
+    default.
+    If a ResultCache is given, a cached result for the same text/prompt/
+    model/schema is returned without any network call.
+    Prompt estimates and API usage (including prompt tokens served from the
+    provider's prefix cache) are recorded in token_report under
+    'prompt_build' and `stage` respectively.
+    With span_mode, the model cites span IDs of a SpanIndex over the text and
+    each context is rebuilt verbatim from the source.
+    API errors are raised to the caller.
+    """
+    keys, response_format = request_schema(keys, span_mode)
+    backend = as_backend(client, api_key)
+
+    cache_key, cached = cache_lookup(cache, text_content, keys, response_format, span_mode, template,
+                                     model=backend.cache_namespace)
+    if cached is not None:
+        return cached
+
+    spans = SpanIndex.build(text_content) if span_mode else None
+    messages = prepare_prompt(text_content, keys, token_report, spans, template)
+
+    # the backend validates the JSON into response_format, so the "llm" span
+    # covers request, response and schema parsing
+    with TRACER.stage("llm", part=stage, backend=backend.name) as span:
+        completion = backend.extract(messages, response_format)
+        usage = completion.usage
+        span.set(bytes_in=sum(len(m["content"]) for m in messages),
+                 bytes_out=len(completion.content),
+                 prompt_tokens=getattr(usage, "prompt_tokens", 0) or 0,
+                 completion_tokens=getattr(usage, "completion_tokens", 0) or 0,
+                 cached_tokens=cached_tokens(usage))
+    if token_report is not None:
+        token_report.add_usage(stage, usage)
+    parsed = as_document(completion.parsed, keys, spans)
+    if cache is not None and parsed is not None:
+        cache.put(cache_key, parsed)
+    return parsed
+
+def extract_rule_facts(text_content: str, use_rules: bool = True,
+                       min_confidence: float = DEFAULT_MIN_CONFIDENCE) -> List[ExtractedFact]:
+    """Facts resolved by rules.pre_extract at or above min_confidence (empty context)."""
+    if not use_rules:
+        return []
+    with TRACER.stage("rules") as span:
+        matches = resolved(pre_extract(text_content), min_confidence)
+        span.set(facts=len(matches))
+    return [ExtractedFact(key=k, value=m.value, context="") for k, m in matches.items()]
+
+def keys_to_ask(wanted: List[str], rule_facts: List[ExtractedFact],
+                template: PromptTemplate = EXTRACTION_PROMPT) -> List[str]:
+    """
+    Keys of `wanted` the LLM is asked for: those the rules did not resolve,
+    and rule keys that take a comment. Rules find values, not comments, so a
+    rule key is only left out when its example in `template` has none.
+    """
+    resolved_keys = {f.key for f in rule_facts}
+    commentless = template.commentless_keys()
+    return [k for k in wanted if k not in resolved_keys or k not in commentless]
+
+def apply_rule_facts(facts: Dict[str, ExtractedFact], rule_facts: List[ExtractedFact]) -> None:
+    """Rule values replace those in `facts` (by key); the comment already there is kept."""
+    for fact in rule_facts:
+        previous = facts.get(fact.key)
+        facts[fact.key] = fact if previous is None else fact.model_copy(update={"context": previous.context})
+
+def split_for_prompt(text_content: str, keys: Optional[List[str]],
+                     max_prompt_tokens: int = DEFAULT_MAX_PROMPT_TOKENS,
+                     overlap_tokens: int = DEFAULT_OVERLAP_TOKENS, span_mode: bool = False,
+                     template: PromptTemplate = EXTRACTION_PROMPT) -> List[str]:
+    """The text as one chunk, or as several if the prompt would exceed max_prompt_tokens."""
+    # everything in the prompt except the source text is fixed for this key set
+    key_tuple = _key_tuple(keys)
+    static_tokens = (template.prefix_tokens(span_mode, MODEL_NAME)
+                     + count_tokens(template.user_message("", key_tuple), MODEL_NAME))
+    if span_mode:
+        # span IDs add a few tokens per sentence; keep a margin for them
+        max_prompt_tokens = int(max_prompt_tokens * 0.9)
+    return chunk_text(text_content, max(max_prompt_tokens - static_tokens, overlap_tokens * 2),
+                      MODEL_NAME, overlap_tokens)
+
+def extract_document(text_content: str, api_key: Optional[str] = None,
+                     client: Union[ExtractionBackend, openai.OpenAI, None] = None, cache=None,
+                     use_rules: bool = True,
+                     min_confidence: float = DEFAULT_MIN_CONFIDENCE, offline: bool = False,
+                     max_prompt_tokens: int = DEFAULT_MAX_PROMPT_TOKENS,
+                     overlap_tokens: int = DEFAULT_OVERLAP_TOKENS, chunk_workers: int = 4,
+                     token_report: Optional[TokenReport] = None,
+                     span_mode: bool = False, near_dup=None,
+                     keys: Optional[List[str]] = None,
+                     template: PromptTemplate = EXTRACTION_PROMPT) -> Optional[DocumentStructure]:
+    """
+    Rules first, LLM for the rest.
+    Keys resolved by rules.pre_extract at or above min_confidence get their
+    value deterministically; the LLM is asked for the others, and for the
+    comment of rule keys whose example has one (see keys_to_ask).
+    No API call is made when nothing is left to ask, or when offline=True
+    (rule facts then have empty comments and unresolved keys are left for
+    ensure_full_coverage).
+    If the prompt would exceed max_prompt_tokens, the text is split into
+    overlapping chunks that are extracted in parallel and merged.
+    span_mode asks the model for span IDs instead of context text (see
+    process_with_ai).
+    With a near_dup index (near_dup.NearDuplicateIndex), a document close to
+    one already processed reuses that document's facts and only the changed
+    sentences go to the model (see reuse_near_duplicate). Every document
+    extracted with the model is added to the index, tagged with the template
+    and backend so that only the same setup reuses its facts. The index only
+    holds whole documents, so it is neither searched nor added to when keys
+    limits the extraction.
+    keys restricts the extraction to those schema keys; template is the
+    prompt to use (see prompts.py).
+    """
+    client = as_backend(client, api_key)
+    options = dict(cache=cache, use_rules=use_rules, min_confidence=min_confidence, offline=offline,
+                   max_prompt_tokens=max_prompt_tokens, overlap_tokens=overlap_tokens,
+                   chunk_workers=chunk_workers, token_report=token_report, span_mode=span_mode, keys=keys,
+                   template=template)
+    # the same setup as a result-cache key: prompt template (and mode) and backend
+    setup = f"{template.cache_tag(None, span_mode)}|{client.cache_namespace}"
+    if keys is not None:
+        near_dup = None
+    match = near_dup.find(text_content, setup) if near_dup is not None else None
+    if match is not None:
+        parsed = reuse_near_duplicate(text_content, match, client, **options)
+    else:
+        parsed = _extract_document(text_content, client, **options)
+    if near_dup is not None and parsed is not None and not offline:
+        near_dup.add(text_content, parsed.model_dump_json(), setup)
+    return parsed
+
+def reuse_near_duplicate(text_content: str, match: NearDuplicate, client: ExtractionBackend,
+                         **options) -> Optional[DocumentStructure]:
+    """
+    Facts for a near-duplicate of an indexed document: its facts, minus those
+    whose supporting sentence was removed, plus whatever the model finds in
+    the added sentences alone (all keys asked, non-empty answers win). Rule
+    facts are then recomputed on the full text. Offline, stale facts are
+    only dropped.
+    """
+    with TRACER.stage("near_dup", similarity=round(match.similarity, 3)) as span:
+        previous = DocumentStructure.model_validate_json(match.facts_json).facts
+        added, removed, kept = sentence_diff(match.text, text_content)
+        stale = stale_keys(previous, removed, kept)
+        span.set(added=len(added), removed=len(removed), stale=len(stale))
+    TRACER.incr("near_dup_reuses")
+    facts = {f.key: f for f in previous if f.key not in stale}
+
+    if added and not options["offline"]:
+        changed = _extract_document("\n".join(added), client, **{**options, "use_rules": False, "keys": None})
+        if changed is None:
+            return None
+        for fact in changed.facts:
+            if fact.value.strip() or (fact.context or "").strip():
+                facts[fact.key] = fact
+    apply_rule_facts(facts, extract_rule_facts(text_content, options["use_rules"], options["min_confidence"]))
+    return DocumentStructure(facts=[facts[k] for k in KEY_ORDER if k in facts])
+
+def _extract_document(text_content: str, client: ExtractionBackend, cache=None, use_rules: bool = True,
+                      min_confidence: float = DEFAULT_MIN_CONFIDENCE, offline: bool = False,
+                      max_prompt_tokens: int = DEFAULT_MAX_PROMPT_TOKENS,
+                      overlap_tokens: int = DEFAULT_OVERLAP_TOKENS, chunk_workers: int = 4,
+                      token_report: Optional[TokenReport] = None,
+                      span_mode: bool = False, keys: Optional[List[str]] = None,
+                      template: PromptTemplate = EXTRACTION_PROMPT) -> Optional[DocumentStructure]:
+    wanted = KEY_ORDER if keys is None else [k for k in KEY_ORDER if k in set(keys)]
+    rule_facts = [f for f in extract_rule_facts(text_content, use_rules, min_confidence) if f.key in wanted]
+    missing = keys_to_ask(wanted, rule_facts, template)
+    if not missing or offline:
+        return DocumentStructure(facts=rule_facts)
+
+    keys = None if len(missing) == len(KEY_ORDER) else missing
+    chunks = split_for_prompt(text_content, keys, max_prompt_tokens, overlap_tokens, span_mode, template)
+
+    if len(chunks) == 1:
+        parsed = process_with_ai(text_content, client=client, cache=cache, keys=keys,
+                                 token_report=token_report, span_mode=span_mode, template=template)
+        if parsed is None:
+            return None
+        llm_facts = parsed.facts
+    else:
+        def _extract_chunk(i):
+            return process_with_ai(chunks[i], client=client, cache=cache, keys=keys,
+                                   token_report=token_report, stage=f"llm:chunk-{i + 1}",
+                                   span_mode=span_mode, template=template)
+
+        # run each chunk in a copy of this thread's context so trace spans keep
+        # their document tag and reach the caller's collector
+        contexts = [contextvars.copy_context() for _ in chunks]
+        with ThreadPoolExecutor(max_workers=min(chunk_workers, len(chunks))) as pool:
+            results = list(pool.map(lambda i: contexts[i].run(_extract_chunk, i), range(len(chunks))))
+        if all(r is None for r in results):
+            return None
+        llm_facts = merge_facts([r.facts if r else [] for r in results])
+
+    facts = {f.key: f for f in llm_facts if f.key in missing}
+    apply_rule_facts(facts, rule_facts)
+    return DocumentStructure(facts=[facts[k] for k in wanted if k in facts])
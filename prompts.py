@@ -0,0 +1,221 @@
+# prompts.py
+"""
+Versioned prompt templates for the extraction request.
+
+A request is laid out static-first:
+
+    system: instructions, few-shot examples (and span rules in span mode)
+    user:   the SOURCE TEXT block, then the extraction request
+
+Everything that does not depend on the document comes before the document,
+so consecutive requests share one long identical prefix and the provider's
+automatic prompt caching (OpenAI caches prefixes of 1024+ tokens) can serve
+it at the discounted rate. The source text used to sit between the
+instructions and the examples, which made every prompt unique after its
+first few hundred tokens.
+
+The system message is the same for every request in a mode: the full
+few-shot block and a fixed response schema, whichever keys are asked for.
+A partial request (rule-assisted, incremental) names its keys only at the
+end of the user message, so documents that need different keys still share
+the prefix. The prefix is rendered once per mode and memoised together with
+its token count. Each template has a version; cache_tag() pairs it with a
+fingerprint of the rendered text, and ResultCache keys are built from that
+tag, so results are never served for an edited template even if the version
+bump is forgotten.
+"""
+import hashlib
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+from token_budget import count_tokens
+
+Keys = Optional[Tuple[str, ...]]
+
+# --- PROMPT TEXT ---
+# Prompt with examples strictly marked as "EXAMPLES" to prevent hallucination
+EXAMPLES = """
+    --- EXAMPLES FOR FORMATTING ONLY (DO NOT EXTRACT CONTENT FROM HERE) ---
+    - Key: 'First Name', Value: 'Vijay', Context: ''
+    - Key: 'Last Name', Value: 'Kumar', Context: ''
+    - Key: 'Date of Birth', Value: '1989-03-15', Context: ''
+    - Key: 'Birth City', Value: 'Jaipur', Context: 'Born and raised in the Pink City of India, his birthplace provides valuable regional profiling context'
+    - Key: 'Birth State', Value: 'Rajasthan', Context: 'Born and raised in the Pink City of India, his birthplace provides valuable regional profiling context'
+    - Key: 'Age', Value: '35', Context: 'As on year 2024. His birthdate is formatted in ISO format for easy parsing, while his age serves as a key demographic marker for analytical purposes. '
+    - Key: 'Blood Group', Value: 'O+', Context: 'Emergency contact purposes. '
+    - Key: 'Nationality', Value: 'Indian', Context: 'Citizenship status is important for understanding his work authorization and visa requirements across different employment opportunities. '
+    - Key: 'Joining Date of first professional role', Value: '2012-07-01', Context: ''
+    - Key: 'Designation of first professional role', Value: 'Junior Developer', Context: ''
+    - Key: 'Salary of first professional role', Value: '350000', Context: ''
+    - Key: 'Salary currency of first professional role', Value: 'INR', Context: ''
+    - Key: 'Current Organization', Value: 'Resse Analytics', Context: ''
+    - Key: 'Current Joining Date', Value: '2021-06-15', Context: ''
+    - Key: 'Current Designation', Value: 'Senior Data Engineer', Context: ''
+    - Key: 'Current Salary', Value: '2800000', Context: 'This salary progression from his starting compensation to his current peak salary of 2,800,000 INR represents a substantial eight- fold increase over his twelve-year career span. '
+    - Key: 'Current Salary Currency', Value: 'INR', Context: ''
+    - Key: 'Previous Organization', Value: 'LakeCorp', Context: ''
+    - Key: 'Previous Joining Date', Value: '2018-02-01', Context: ''
+    - Key: 'Previous end year', Value: '2021', Context: ''
+    - Key: 'Previous Starting Designation', Value: 'Data Analyst ', Context: 'Promoted in 2019'
+    - Key: 'High School', Value: 'St. Xavier's School, Jaipur', Context: ''
+    - Key: '12th standard pass out year', Value: '2007', Context: 'His core subjects included Mathematics, Physics, Chemistry, and Computer Science, demonstrating his early aptitude for technical disciplines. '
+    - Key: '12th overall board score', Value: '0.925', Context: 'Outstanding achievement'
+    - Key: 'Undergraduate degree', Value: 'B.Tech (Computer Science)', Context: ''
+    - Key: 'Undergraduate college', Value: 'IIT Delhi', Context: ''
+    - Key: 'Undergraduate year', Value: '2011', Context: 'Graduating with honors and ranking 15th among 120 students in his class. '
+    - Key: 'Undergraduate CGPA', Value: '8.7', Context: 'On a 10-point scale, '
+    - Key: 'Graduation degree', Value: 'M.Tech (Data Science)', Context: ''
+    - Key: 'Graduation college', Value: 'IIT Bombay', Context: 'Continued academic excellence at IIT Bombay'
+    - Key: 'Graduation year', Value: '2013', Context: ''
+    - Key: 'Graduation CGPA', Value: '9.2', Context: 'Considered exceptional and scoring 95 out of 100 for his final year thesis project. '
+    - Key: 'Certifications 1', Value: 'AWS Solutions Architect ', Context: 'Vijay's commitment to continuous learning is evident through his impressive certification scores. He passed the AWS Solutions Architect exam in 2019 with a score of 920 out of 1000'
+    - Key: 'Certifications 2', Value: 'Azure Data Engineer', Context: 'Pursued in the year 2020 with 875 points. '
+    - Key: 'Certifications 3', Value: 'Project Management Professional certification', Context: 'Obtained in 2021, was achieved with an "Above Target" rating from PMI, These certifications complement his practical experience and demonstrate his expertise across multiple technology platforms. '
+    - Key: 'Certifications 4', Value: 'SAFe Agilist certification', Context: 'Earned him an outstanding 98% score. Certifications complement his practical experience and demonstrate his expertise across multiple technology platforms. '
+    - Key: 'Technical Proficiency', Value: '', Context: 'In terms of technical proficiency, Vijay rates himself highly across various skills, with SQL expertise at a perfect 10 out of 10, reflecting his daily usage since 2012. His Python proficiency scores 9 out of 10, backed by over seven years of practical experience, while his machine learning capabilities rate 8 out of 10, representing five years of hands-on implementation. His cloud platform expertise, including AWS and Azure certifications, also rates 9 out of 10 with more than four years of experience, and his data visualization skills in Power BI and Tableau score 8 out of 10, establishing him as an expert in the field. \t'
+    """
+
+INSTRUCTIONS = """
+    You are an Expert Extraction Agent. Extract 100% of content from the provided text into EXACT schema keys. 
+    
+    CRITICAL INSTRUCTION:
+    - The examples provided below are for FORMATTING REFERENCE ONLY. 
+    - DO NOT use the content (Values/Contexts) from the examples for the final output. 
+    - ONLY extract data found in the 'SOURCE TEXT' given in the user message.
+    - If a specific piece of information (e.g., Certifications) is NOT present in the SOURCE TEXT, leave the Value and Context empty. DO NOT HALLUCINATE or copy from examples.
+
+    CHAIN-OF-THOUGHT RULES:
+    1. Atomic split: Names, locations, salaries/currencies separate.
+    2. Values: Dates ISO (e.g., '2012-07-01'), numbers no commas/spaces (e.g., '350000'), preserve spaces in titles (e.g., 'Junior Developer'), degrees as 'B.Tech (Computer Science)', scores as raw (e.g., '92.5').
+    3. Contexts: Extract full verbatim relevant sentence/chain from the SOURCE TEXT. Empty '' for pure facts.
+    4. Coverage: All sections: Personal, Professional (first/current/prev), Academic, Certs, Technical.
+    5. No hallucination: Only text from SOURCE TEXT.
+
+    {examples}
+
+    Respond ONLY with parsed facts in schema order.
+    """
+
+SPAN_INSTRUCTIONS = """
+    SPAN REFERENCES:
+    - The SOURCE TEXT is split into numbered spans: [S4] is sentence 4, [S4.2] its second clause.
+    - Do NOT copy context text. Put the IDs of the spans that hold each fact's context into context_spans, in reading order, and leave context empty.
+    - Cite the smallest spans that cover the context. The example Contexts show which passages to cite.
+    """
+
+SOURCE_BLOCK = """--- SOURCE TEXT START ---
+{text}
+--- SOURCE TEXT END ---
+
+"""
+
+FULL_REQUEST = "Extract data from the SOURCE TEXT above."
+_EXAMPLE_LINE = re.compile(r"- Key: '(?P<key>[^']+)', Value: .*, Context: '(?P<context>.*)'$")
+
+PARTIAL_REQUEST = ("Extract data from the SOURCE TEXT above. Only these keys are needed, "
+                   "all others are already resolved: {keys}")
+
+
+# --- TEMPLATES ---
+@dataclass(frozen=True)
+class PromptTemplate:
+    """
+    One version of the extraction prompt. `instructions` holds an
+    {examples} placeholder for the few-shot block; `source_block` frames the
+    document text in the user message.
+    """
+    name: str
+    version: str
+    instructions: str
+    examples: str
+    span_instructions: str
+    source_block: str = SOURCE_BLOCK
+    full_request: str = FULL_REQUEST
+    partial_request: str = PARTIAL_REQUEST
+
+    def commentless_keys(self) -> frozenset:
+        """Keys whose example carries no comment (Context: '')."""
+        return _commentless_keys(self)
+
+    def system_prompt(self, span_mode: bool = False) -> str:
+        """The static prefix: identical for every request in the same mode, whatever its keys."""
+        return _system_prompt(self, span_mode)
+
+    def prefix_tokens(self, span_mode: bool, model: str) -> int:
+        return _prefix_tokens(self, span_mode, model)
+
+    def request(self, keys: Keys = None) -> str:
+        if keys is None:
+            return self.full_request
+        return self.partial_request.format(keys="; ".join(keys))
+
+    def user_message(self, source_text: str, keys: Keys = None) -> str:
+        """Document-specific part of the prompt: the source text, then what to extract from it."""
+        return self.source_block.format(text=source_text) + self.request(keys)
+
+    def messages(self, source_text: str, keys: Keys = None, span_mode: bool = False) -> List[dict]:
+        return [
+            {"role": "system", "content": self.system_prompt(span_mode)},
+            {"role": "user", "content": self.user_message(source_text, keys)},
+        ]
+
+    def cache_tag(self, keys: Keys = None, span_mode: bool = False) -> str:
+        """Stands in for the prompt in result-cache keys: name, version and content fingerprint."""
+        return _cache_tag(self, keys, span_mode)
+
+
+@lru_cache(maxsize=None)
+def _commentless_keys(template: PromptTemplate) -> frozenset:
+    matches = (_EXAMPLE_LINE.match(line.strip()) for line in template.examples.split("\n"))
+    return frozenset(m.group("key") for m in matches if m and not m.group("context").strip())
+
+
+@lru_cache(maxsize=256)
+def _system_prompt(template: PromptTemplate, span_mode: bool) -> str:
+    prompt = template.instructions.format(examples=template.examples)
+    return prompt + template.span_instructions if span_mode else prompt
+
+
+@lru_cache(maxsize=256)
+def _prefix_tokens(template: PromptTemplate, span_mode: bool, model: str) -> int:
+    return count_tokens(_system_prompt(template, span_mode), model)
+
+
+@lru_cache(maxsize=256)
+def _cache_tag(template: PromptTemplate, keys: Keys, span_mode: bool) -> str:
+    h = hashlib.sha256()
+    for part in (_system_prompt(template, span_mode), template.source_block, template.request(keys)):
+        h.update(part.encode("utf-8"))
+        h.update(b"\0")
+    return f"{template.name}@{template.version}:{h.hexdigest()[:16]}"
+
+
+# --- REGISTRY ---
+TEMPLATES: Dict[str, PromptTemplate] = {}
+
+
+def register_template(template: PromptTemplate) -> PromptTemplate:
+    """Make a template available by name; re-registering a name replaces it."""
+    TEMPLATES[template.name] = template
+    return template
+
+
+def get_template(name: str) -> PromptTemplate:
+    try:
+        return TEMPLATES[name]
+    except KeyError:
+        raise ValueError(f"Unknown prompt template {name!r}; known: {', '.join(sorted(TEMPLATES))}") from None
+
+
+# v1 put the source text inside the system prompt, between rules and examples;
+# v2 trimmed the examples to the requested keys
+EXTRACTION_PROMPT = register_template(PromptTemplate(
+    name="extraction",
+    version="3",
+    instructions=INSTRUCTIONS,
+    examples=EXAMPLES,
+    span_instructions=SPAN_INSTRUCTIONS,
+))
+DEFAULT_TEMPLATE = EXTRACTION_PROMPT.name
@@ -0,0 +1,157 @@
+# result_store.py
+"""
+Compact columnar results.
+
+A document's result is 37 ExtractedFact objects, topped up by
+ensure_full_coverage and turned into 37 dicts by post_process_facts. Over a
+batch of thousands of documents that is a lot of small objects alive at
+once. Here facts are held as columns instead:
+
+- keys are int8 codes into KEY_ORDER;
+- documents, values and contexts are interned: each distinct string is
+  stored once and the columns hold int32 codes into the pool;
+- post-processing runs once per batch of documents and once per distinct
+  (key, string) pair, with the vectorised cleaners of columnar.py; the rows
+  are dictionary-encoded Arrow columns built straight from the codes.
+
+The writers in export.py stream those batches to Parquet (one row group at a
+time), CSV or Excel and start a fresh buffer after each, so memory stays
+flat however many documents are appended. read_results and to_pandas hand
+the rows to pandas as Arrow-backed columns, without copying the data.
+"""
+import logging
+from array import array
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from columnar import OUTPUT_COLUMNS, clean_comments, clean_values
+from instrumentation import TRACER
+from pipeline import KEY_ORDER
+
+logger = logging.getLogger(__name__)
+
+KEY_CODES: Dict[str, int] = {k: i for i, k in enumerate(KEY_ORDER)}
+KEY_DICTIONARY = pa.array(KEY_ORDER, pa.string())
+_KEY_NAMES = np.array(KEY_ORDER, dtype=object)
+
+_STRINGS = pa.dictionary(pa.int32(), pa.string())
+RESULT_SCHEMA = pa.schema([
+    ("Document", _STRINGS),
+    ("#", pa.int8()),
+    ("Key", pa.dictionary(pa.int8(), pa.string())),
+    ("Value", _STRINGS),
+    ("Comments", _STRINGS),
+])
+
+
+class StringPool:
+    """Interns strings as int32 codes; each distinct string is kept once."""
+
+    def __init__(self):
+        self._codes: Dict[str, int] = {}
+        self.strings: List[str] = []
+
+    def __len__(self) -> int:
+        return len(self.strings)
+
+    def __contains__(self, value: Optional[str]) -> bool:
+        return (value or "") in self._codes
+
+    def code(self, value: Optional[str]) -> int:
+        value = value or ""
+        code = self._codes.get(value)
+        if code is None:
+            code = self._codes[value] = len(self.strings)
+            self.strings.append(value)
+        return code
+
+
+class FactColumns:
+    """Facts of many documents as integer columns over string pools."""
+
+    def __init__(self):
+        self.documents = StringPool()
+        self.strings = StringPool()  # values and contexts share one pool
+        self._document = array("i")
+        self._key = array("b")
+        self._value = array("i")
+        self._context = array("i")
+
+    def __len__(self) -> int:
+        return len(self._key)
+
+    def append(self, document: str, facts: Iterable) -> None:
+        """
+        Add a document's facts (anything with key/value/context attributes).
+        A document with no facts still gets its 37 empty rows. Rows are
+        grouped by document name, so a name can only be appended once.
+        """
+        if document in self.documents:
+            raise ValueError(f"document {document!r} was already appended")
+        doc = self.documents.code(document)
+        for fact in facts:
+            key = KEY_CODES.get(fact.key)
+            if key is None:
+                continue
+            self._document.append(doc)
+            self._key.append(key)
+            self._value.append(self.strings.code(fact.value))
+            self._context.append(self.strings.code(fact.context))
+
+    def to_table(self) -> pa.Table:
+        """
+        Post-processed rows (37 per document, as post_process_facts) as a
+        RESULT_SCHEMA table. Values and comments are cleaned once per
+        distinct (key, string) pair, not once per row.
+        """
+        with TRACER.stage("post_process", columnar=True) as span:
+            documents, width = len(self.documents), len(KEY_ORDER)
+            # ensure_full_coverage on the code grid: missing keys are "", the last fact for a key wins
+            empty = self.strings.code("")
+            slots = np.frombuffer(self._document, dtype=np.int32) * width + np.frombuffer(self._key, dtype=np.int8)
+            # NumPy does not say which write wins for repeated indices: keep each slot's last fact explicitly
+            last = len(slots) - 1 - np.unique(slots[::-1], return_index=True)[1]
+            values = np.full(documents * width, empty, dtype=np.int32)
+            contexts = values.copy()
+            values[slots[last]] = np.frombuffer(self._value, dtype=np.int32)[last]
+            contexts[slots[last]] = np.frombuffer(self._context, dtype=np.int32)[last]
+            keys = np.tile(np.arange(width, dtype=np.int8), documents)
+
+            table = pa.Table.from_arrays([
+                pa.DictionaryArray.from_arrays(
+                    pa.array(np.repeat(np.arange(documents, dtype=np.int32), width)),
+                    pa.array(self.documents.strings, pa.string())),
+                pa.array(keys + 1, pa.int8()),
+                pa.DictionaryArray.from_arrays(pa.array(keys), KEY_DICTIONARY),
+                self._cleaned(keys, values, clean_values),
+                self._cleaned(keys, contexts, clean_comments),
+            ], schema=RESULT_SCHEMA)
+            span.set(facts_in=len(self), rows_out=table.num_rows)
+        return table
+
+    def _cleaned(self, keys: np.ndarray, codes: np.ndarray, clean) -> pa.DictionaryArray:
+        pool = len(self.strings)
+        pairs, inverse = np.unique(keys.astype(np.int64) * pool + codes, return_inverse=True)
+        strings = np.array(self.strings.strings, dtype=object)[pairs % pool]
+        cleaned = clean(pd.Series(strings), pd.Series(_KEY_NAMES[pairs // pool]))
+        return pa.DictionaryArray.from_arrays(pa.array(inverse.astype(np.int32)), pa.array(cleaned, pa.string()))
+
+
+def to_pandas(table: pa.Table) -> pd.DataFrame:
+    """A frame whose columns are views of the table's Arrow buffers (no copy)."""
+    return table.to_pandas(types_mapper=pd.ArrowDtype)
+
+
+# --- PARQUET ---
+def read_results(path: str, documents: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    Rows of a Parquet export (export.ParquetExportWriter), optionally only
+    those of `documents`, as Arrow-backed pandas.
+    """
+    filters = [("Document", "in", documents)] if documents is not None else None
+    table = pq.read_table(path, filters=filters)
+    return to_pandas(table.select(OUTPUT_COLUMNS))
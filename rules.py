@@ -0,0 +1,224 @@
+# rules.py
+"""
+Deterministic rule-based pre-extractor.
+
+Fields with a fixed surface form (labelled names, dates of birth, blood
+groups, nationalities, salary currencies, CGPAs, 12th standard year/score,
+age) are matched with compiled regexes and small lexicons before the LLM is
+called. Each match carries a confidence score and the verbatim span it was
+read from; only matches at or above the caller's threshold are trusted, and
+the LLM is asked for the remaining keys only.
+
+Values are produced in the same raw form the LLM is asked for (ISO dates,
+numbers without separators, raw scores) so they go through clean_value
+exactly like model output.
+"""
+import re
+from dataclasses import dataclass
+from datetime import date
+from typing import Callable, Dict, List, Optional, Tuple
+
+DEFAULT_MIN_CONFIDENCE = 0.9
+
+
+@dataclass(frozen=True)
+class RuleMatch:
+    key: str
+    value: str
+    confidence: float
+    span: Tuple[int, int]  # character offsets of the evidence in the source text
+    evidence: str          # verbatim source text the value was read from
+    rule: str
+
+
+# --- LEXICONS ---
+MONTHS = {m: i for i, m in enumerate(
+    ["january", "february", "march", "april", "may", "june", "july",
+     "august", "september", "october", "november", "december"], start=1)}
+MONTHS.update({m[:3]: i for m, i in list(MONTHS.items())})
+MONTHS["sept"] = 9
+
+DEMONYMS = {
+    "indian": "Indian", "american": "American", "british": "British", "canadian": "Canadian",
+    "australian": "Australian", "german": "German", "french": "French", "chinese": "Chinese",
+    "japanese": "Japanese", "singaporean": "Singaporean", "sri lankan": "Sri Lankan",
+    "nepalese": "Nepalese", "bangladeshi": "Bangladeshi", "pakistani": "Pakistani",
+}
+
+CURRENCIES = {
+    "INR": "INR", "RS": "INR", "RS.": "INR", "₹": "INR", "RUPEES": "INR",
+    "USD": "USD", "$": "USD", "EUR": "EUR", "€": "EUR", "GBP": "GBP", "£": "GBP",
+    "SGD": "SGD", "AED": "AED", "AUD": "AUD", "CAD": "CAD",
+}
+
+# --- PATTERNS (compiled once) ---
+_MONTH = r"(?P<mon>jan(?:uary)?|feb(?:ruary)?|mar(?:ch)?|apr(?:il)?|may|june?|july?|aug(?:ust)?|sep(?:t(?:ember)?)?|oct(?:ober)?|nov(?:ember)?|dec(?:ember)?)"
+_DATE_FORMS = [
+    # (pattern, confidence) - ambiguous all-numeric day/month orders are left to the LLM
+    (re.compile(r"(?P<y>(?:19|20)\d{2})-(?P<m>\d{2})-(?P<d>\d{2})\b"), 0.95),
+    (re.compile(_MONTH + r"\.?\s+(?P<d>\d{1,2})(?:st|nd|rd|th)?,?\s+(?P<y>(?:19|20)\d{2})\b", re.I), 0.9),
+    (re.compile(r"\b(?P<d>\d{1,2})(?:st|nd|rd|th)?[\s-]+" + _MONTH + r"\.?[\s,-]+(?P<y>(?:19|20)\d{2})\b", re.I), 0.9),
+]
+
+_NAME_LABEL = re.compile(
+    r"^\s*\|?\s*(?:full\s+)?name\s*(?:[:=|]\s*)+[\"“]?(?P<first>[A-Z][a-z]+)\s+(?P<last>[A-Z][a-z]+)[\"”]?\s*\|?\s*$",
+    re.I | re.M)
+_NAME_PROSE = re.compile(r"\A\s*(?P<first>[A-Z][a-z]+)\s+(?P<last>[A-Z][a-z]+)\s+(?:was\s+born|is\s+a|is\s+an)\b")
+_DOB_CUE = re.compile(r"\b(?:born\s+on|date\s+of\s+birth|d\.?o\.?b\.?|birth\s*date|birthdate|birth\s+details)\b", re.I)
+_BLOOD = re.compile(
+    r"\bblood\s*group\W{0,6}(?P<g>AB|A|B|O)\s?(?P<s>[+-]|positive|negative)"
+    r"|\b(?P<g2>AB|A|B|O)\s?(?P<s2>[+-])\s+blood\s+group", re.I)
+_NATIONALITY_LABEL = re.compile(r"\b(?:nationality|citizenship)\s*[:=|-]+\s*(?P<v>[A-Za-z][A-Za-z ]+?)\s*(?:[|\n.,]|$)", re.I)
+_NATIONAL_PROSE = re.compile(r"\b(?:an?|is)\s+(?P<v>[A-Z][a-z]+(?: [A-Z][a-z]+)?)\s+(?:national|citizen)\b")
+_AMOUNT = r"\d[\d,\s]*\d"
+_CURRENCY_AMOUNT = re.compile(
+    r"(?P<c1>\b(?:INR|USD|EUR|GBP|SGD|AED|AUD|CAD|Rs|Rupees)\b\.?|[₹$€£])\s?" + _AMOUNT
+    + r"|" + _AMOUNT + r"\s?(?P<c2>\b(?:INR|USD|EUR|GBP|SGD|AED|AUD|CAD|Rupees)\b)", re.I)
+_CGPA = re.compile(r"\bcgpa\b\W{0,8}?(?:of\s+)?[\"“]?(?P<v>\d{1,2}(?:\s*\.\s*\d{1,2})?)[\"”]?", re.I)
+_UG_MARK = re.compile(r"\b(?:UG|under\s*grad\w*|bachelor\w*)\b|\bB\.?\s?(?:Tech|Sc|E|Com|A)\b", re.I)
+_PG_MARK = re.compile(r"\b(?:PG|post\s*grad\w*|master\w*)\b|\bM\.?\s?(?:Tech|Sc|E|S|BA|Com|A)\b|\bMBA\b", re.I)
+_TWELFTH_YEAR = re.compile(r"\b12th\b[^\n.%]{0,60}?\b(?P<y>(?:19|20)\d{2})\b", re.I)
+_TWELFTH_SCORE = re.compile(r"\b12th\b.{0,120}?(?P<v>\d{2}(?:\.\d+)?)\s*(?:%|percent\b)", re.I | re.S)
+_AGE = re.compile(r"\b(?P<v>\d{2})\s+years?\s+old\b", re.I)
+
+
+# --- RULES ---
+def _iso_date(m: re.Match) -> Optional[str]:
+    groups = m.groupdict()
+    month = int(groups["m"]) if groups.get("m") else MONTHS.get(groups["mon"].lower().rstrip("."))
+    try:
+        return date(int(groups["y"]), month, int(groups["d"])).isoformat()
+    except (TypeError, ValueError):
+        return None
+
+
+def _rule_names(text: str) -> List[RuleMatch]:
+    for pattern, confidence, rule in ((_NAME_LABEL, 0.95, "name_label"), (_NAME_PROSE, 0.9, "name_prose")):
+        m = pattern.search(text)
+        if m:
+            return [
+                RuleMatch("First Name", m.group("first"), confidence, m.span("first"), m.group(0).strip(), rule),
+                RuleMatch("Last Name", m.group("last"), confidence, m.span("last"), m.group(0).strip(), rule),
+            ]
+    return []
+
+
+def _rule_dob(text: str) -> List[RuleMatch]:
+    found: Dict[str, Tuple[float, re.Match, int]] = {}
+    for cue in _DOB_CUE.finditer(text):
+        window_start = cue.end()
+        window = text[window_start:window_start + 60]
+        for pattern, confidence in _DATE_FORMS:
+            m = pattern.search(window)
+            if not m:
+                continue
+            iso = _iso_date(m)
+            if iso and (iso not in found or found[iso][0] < confidence):
+                found[iso] = (confidence, m, window_start)
+            break
+    if not found:
+        return []
+    if len(found) > 1:
+        # conflicting birth dates: let the model decide
+        return []
+    iso, (confidence, m, offset) = next(iter(found.items()))
+    return [RuleMatch("Date of Birth", iso, confidence, (offset + m.start(), offset + m.end()), m.group(0), "dob")]
+
+
+def _rule_blood_group(text: str) -> List[RuleMatch]:
+    m = _BLOOD.search(text)
+    if not m:
+        return []
+    group = (m.group("g") or m.group("g2")).upper()
+    sign = (m.group("s") or m.group("s2")).lower()
+    sign = {"positive": "+", "negative": "-"}.get(sign, sign)
+    return [RuleMatch("Blood Group", group + sign, 0.95, m.span(), m.group(0), "blood_group")]
+
+
+def _rule_nationality(text: str) -> List[RuleMatch]:
+    for pattern, confidence, rule in ((_NATIONALITY_LABEL, 0.95, "nationality_label"),
+                                      (_NATIONAL_PROSE, 0.9, "nationality_prose")):
+        for m in pattern.finditer(text):
+            value = DEMONYMS.get(m.group("v").strip().lower())
+            if value:
+                return [RuleMatch("Nationality", value, confidence, m.span(), m.group(0).strip(), rule)]
+    return []
+
+
+def _rule_currency(text: str) -> List[RuleMatch]:
+    mentions = [m for m in _CURRENCY_AMOUNT.finditer(text)]
+    codes = {CURRENCIES.get((m.group("c1") or m.group("c2")).upper()) for m in mentions}
+    if len(codes) != 1 or None in codes:
+        return []
+    code = codes.pop()
+    # one currency across every salary mention; a single mention is too thin to
+    # attribute to both the first and the current role
+    confidence = 0.9 if len(mentions) >= 2 else 0.75
+    first = mentions[0]
+    return [
+        RuleMatch(key, code, confidence, first.span(), first.group(0), "currency")
+        for key in ("Salary currency of first professional role", "Current Salary Currency")
+    ]
+
+
+def _nearest_marker(text: str, end: int) -> Optional[str]:
+    window = text[max(0, end - 250):end]
+    last_ug = max((m.end() for m in _UG_MARK.finditer(window)), default=-1)
+    last_pg = max((m.end() for m in _PG_MARK.finditer(window)), default=-1)
+    if last_ug == last_pg == -1:
+        return None
+    return "ug" if last_ug > last_pg else "pg"
+
+
+def _rule_cgpa(text: str) -> List[RuleMatch]:
+    keys = {"ug": "Undergraduate CGPA", "pg": "Graduation CGPA"}
+    found: Dict[str, List[RuleMatch]] = {"ug": [], "pg": []}
+    for m in _CGPA.finditer(text):
+        value = re.sub(r"\s+", "", m.group("v"))
+        if not 0 < float(value) <= 10:
+            continue
+        level = _nearest_marker(text, m.start())
+        if level:
+            found[level].append(RuleMatch(keys[level], value, 0.9, m.span("v"), m.group(0), "cgpa"))
+    # two different CGPAs attributed to the same degree means the attribution is unreliable
+    return [ms[0] for ms in found.values() if len({x.value for x in ms}) == 1]
+
+
+def _rule_twelfth(text: str) -> List[RuleMatch]:
+    out = []
+    m = _TWELFTH_YEAR.search(text)
+    if m:
+        out.append(RuleMatch("12th standard pass out year", m.group("y"), 0.9, m.span("y"), m.group(0), "12th_year"))
+    m = _TWELFTH_SCORE.search(text)
+    if m:
+        out.append(RuleMatch("12th overall board score", m.group("v"), 0.9, m.span("v"), m.group(0), "12th_score"))
+    return out
+
+
+def _rule_age(text: str) -> List[RuleMatch]:
+    ages = {m.group("v"): m for m in _AGE.finditer(text)}
+    if len(ages) != 1:
+        return []
+    value, m = next(iter(ages.items()))
+    return [RuleMatch("Age", value, 0.9, m.span("v"), m.group(0), "age")]
+
+
+RULES: List[Callable[[str], List[RuleMatch]]] = [
+    _rule_names, _rule_dob, _rule_blood_group, _rule_nationality,
+    _rule_currency, _rule_cgpa, _rule_twelfth, _rule_age,
+]
+
+
+def pre_extract(text: str) -> Dict[str, RuleMatch]:
+    """Run every rule over text; returns the best match per key."""
+    best: Dict[str, RuleMatch] = {}
+    for rule in RULES:
+        for match in rule(text):
+            if match.key not in best or match.confidence > best[match.key].confidence:
+                best[match.key] = match
+    return best
+
+
+def resolved(matches: Dict[str, RuleMatch], min_confidence: float = DEFAULT_MIN_CONFIDENCE) -> Dict[str, RuleMatch]:
+    """Matches trusted enough to skip the LLM for their key."""
+    return {k: m for k, m in matches.items() if m.confidence >= min_confidence}
@@ -0,0 +1,647 @@
+# service.py
+"""
+Long-running extraction service.
+
+The Streamlit page and batch.py run one request or one directory and exit.
+This service keeps going: PDFs are submitted over HTTP, queued in a SQLite
+job store and worked off by a pool of worker processes.
+
+    python service.py --workers 4 --port 8090
+    curl --data-binary @resume.pdf "http://127.0.0.1:8090/jobs?name=resume.pdf"
+    curl http://127.0.0.1:8090/jobs/1
+    curl http://127.0.0.1:8090/jobs/1/result
+    curl http://127.0.0.1:8090/metrics
+
+Each job goes through the pipeline's stages, and the output of every stage
+is checkpointed in the job row before the next one starts:
+
+    queued -> text (PDF text) -> llm (facts) -> post (rows) -> exported (file)
+
+A worker holds a job under a lease. If it dies, the lease runs out and
+another worker resumes the job from its last checkpoint, so an answered
+LLM call is never paid for twice.
+
+Backpressure: when the provider answers 429, the worker records a throttle
+window in the store. All workers stop claiming jobs until it passes, and
+the job is requeued without counting an attempt. While throttled, or when
+`max_queued` jobs are waiting, new submissions get 429 with a Retry-After
+estimated from the current throughput. Clients slow down instead of piling
+up work the rate limit cannot serve.
+
+GET /metrics reports queue depth by status, throughput over the last
+minute, the throttle window and live workers.
+
+Each job's result is exported through export.open_writer, the same
+streaming writers batch.py uses. A finished job keeps only its rows and its
+exported file; both are deleted `retention` seconds after it finished, so
+the store and the output directory do not grow without bound.
+"""
+import argparse
+import contextlib
+import json
+import logging
+import multiprocessing
+import os
+import random
+import re
+import signal
+import sqlite3
+import sys
+import threading
+import time
+from dataclasses import asdict, dataclass
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+import openai
+
+from backends import BACKENDS, DEFAULT_MODEL, make_backend
+from batch import RETRYABLE_ERRORS, _retry_after_seconds
+from cache import DEFAULT_CACHE_DIR, ResultCache
+from export import WRITERS, open_writer
+from pipeline import DocumentStructure, extract_document, extract_text_from_pdf, post_process_facts
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DB_PATH = ".jobs.sqlite"
+DEFAULT_OUT_DIR = "service_output"
+DEFAULT_PORT = 8090
+DEFAULT_LEASE = 300.0
+DEFAULT_MAX_QUEUED = 1000
+MAX_ATTEMPTS = 5
+THROUGHPUT_WINDOW = 60.0
+POLL_INTERVAL = 0.5
+DEFAULT_RETENTION = 7 * 24 * 3600.0
+PURGE_INTERVAL = 60.0
+# the 429 error code of an account out of credit, as opposed to one being throttled
+QUOTA_EXHAUSTED = "insufficient_quota"
+EXPORT_FORMATS = tuple(suffix.lstrip(".") for suffix in WRITERS)
+
+# checkpoint order; a job's stage is the last one whose output is stored
+STAGES = ("queued", "text", "llm", "post", "exported")
+STATUSES = ("queued", "running", "done", "failed")
+
+
+@dataclass
+class Job:
+    id: int
+    name: str
+    status: str
+    stage: str
+    attempts: int
+    error: Optional[str]
+    output: Optional[str]
+    created: float
+    updated: float
+
+
+@dataclass
+class Admission:
+    accepted: bool
+    retry_after: float = 0.0
+    reason: str = ""
+
+
+# --- JOB STORE ---
+class JobStore:
+    """
+    Jobs and their stage checkpoints in one SQLite file (WAL mode), shared by
+    the HTTP process and the workers. Every process opens its own JobStore.
+    """
+
+    _JOB_COLUMNS = "id, name, status, stage, attempts, error, output, created, updated"
+
+    def __init__(self, path: str = DEFAULT_DB_PATH, lease: float = DEFAULT_LEASE):
+        self.path = path
+        self.lease = lease
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value REAL NOT NULL);
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY,
+                name TEXT NOT NULL,
+                status TEXT NOT NULL,
+                stage TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                worker TEXT,
+                lease_until REAL,
+                not_before REAL NOT NULL DEFAULT 0,
+                pdf BLOB,
+                text TEXT,
+                facts TEXT,
+                rows TEXT,
+                output TEXT,
+                created REAL NOT NULL,
+                updated REAL NOT NULL,
+                finished REAL
+            );
+            CREATE INDEX IF NOT EXISTS jobs_by_status ON jobs (status, not_before);
+            CREATE INDEX IF NOT EXISTS jobs_by_finished ON jobs (finished);
+        """)
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+    def _write(self, sql: str, params=()) -> sqlite3.Cursor:
+        with self._lock:
+            return self._db.execute(sql, params)
+
+    def _read(self, sql: str, params=()) -> list:
+        with self._lock:
+            return self._db.execute(sql, params).fetchall()
+
+    # submission and status
+    def submit(self, name: str, pdf: bytes) -> int:
+        now = time.time()
+        return self._write("INSERT INTO jobs (name, status, stage, pdf, created, updated) "
+                           "VALUES (?, 'queued', 'queued', ?, ?, ?)", (name, pdf, now, now)).lastrowid
+
+    def get(self, job_id: int) -> Optional[Job]:
+        rows = self._read(f"SELECT {self._JOB_COLUMNS} FROM jobs WHERE id = ?", (job_id,))
+        return Job(*rows[0]) if rows else None
+
+    def artifact(self, job_id: int, column: str):
+        """A stored stage output: pdf, text, facts or rows."""
+        if column not in ("pdf", "text", "facts", "rows"):
+            raise ValueError(f"Unknown artifact {column!r}")
+        rows = self._read(f"SELECT {column} FROM jobs WHERE id = ?", (job_id,))
+        return rows[0][0] if rows else None
+
+    def depth(self) -> Dict[str, int]:
+        counts = dict.fromkeys(STATUSES, 0)
+        counts.update(self._read("SELECT status, COUNT(*) FROM jobs GROUP BY status"))
+        return counts
+
+    def throughput(self, window: float = THROUGHPUT_WINDOW) -> float:
+        """Jobs finished per second over the last `window` seconds."""
+        (done,), = self._read("SELECT COUNT(*) FROM jobs WHERE finished >= ?", (time.time() - window,))
+        return done / window
+
+    # upstream throttling, shared by all workers
+    def throttle(self, seconds: float) -> None:
+        until = time.time() + seconds
+        self._write("INSERT INTO meta VALUES ('throttled_until', ?) "
+                    "ON CONFLICT (name) DO UPDATE SET value = MAX(value, excluded.value)", (until,))
+
+    def throttled_for(self) -> float:
+        rows = self._read("SELECT value FROM meta WHERE name = 'throttled_until'")
+        return max(0.0, rows[0][0] - time.time()) if rows else 0.0
+
+    def admit(self, max_queued: int, workers: int) -> Admission:
+        """
+        Whether to accept another job. Refused when max_queued jobs are
+        waiting, or while the provider throttles us and the workers already
+        have a job each waiting.
+        """
+        queued = self.depth()["queued"]
+        throttled = self.throttled_for()
+        rate = self.throughput()
+        if queued >= max_queued:
+            return Admission(False, queued / rate if rate else 5.0, "queue full")
+        if throttled and queued >= workers:
+            return Admission(False, max(throttled, queued / rate if rate else 0.0), "upstream rate limited")
+        return Admission(True)
+
+    # worker side
+    def claim(self, worker: str, max_attempts: int = MAX_ATTEMPTS) -> Optional[Job]:
+        """
+        Lease the oldest runnable job: queued, or running under an expired
+        lease (its worker died). Taking a job over counts as an attempt, so a
+        PDF that kills every worker is failed after max_attempts.
+        """
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                while True:
+                    row = self._db.execute(
+                        "SELECT id, status, attempts FROM jobs WHERE (status = 'queued' AND not_before <= ?) "
+                        "OR (status = 'running' AND lease_until < ?) ORDER BY id LIMIT 1", (now, now)).fetchone()
+                    if row is None:
+                        break
+                    job_id, status, attempts = row
+                    if status == "running":
+                        attempts += 1
+                    if status == "queued" or attempts < max_attempts:
+                        self._db.execute("UPDATE jobs SET status = 'running', worker = ?, lease_until = ?, "
+                                         "attempts = ?, updated = ? WHERE id = ?",
+                                         (worker, now + self.lease, attempts, now, job_id))
+                        break
+                    self._db.execute("UPDATE jobs SET status = 'failed', attempts = ?, error = ?, worker = NULL, "
+                                     "lease_until = NULL, updated = ?, finished = ? WHERE id = ?",
+                                     (attempts, f"Worker lost (lease expired) after {attempts} attempts",
+                                      now, now, job_id))
+                    logger.warning("Job %d failed: its worker was lost %d times", job_id, attempts)
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        return self.get(row[0]) if row is not None else None
+
+    def renew(self, job_id: int, worker: str) -> bool:
+        """Extend the lease of a job this worker still holds."""
+        now = time.time()
+        return self._write("UPDATE jobs SET lease_until = ? WHERE id = ? AND worker = ? AND status = 'running'",
+                           (now + self.lease, job_id, worker)).rowcount == 1
+
+    def checkpoint(self, job_id: int, worker: str, stage: str, **outputs) -> bool:
+        """
+        Store a stage's output and renew the lease. False if the lease was
+        lost (another worker took the job over), in which case nothing is written.
+        """
+        if stage not in STAGES or not set(outputs) <= {"text", "facts", "rows", "output"}:
+            raise ValueError(f"Bad checkpoint {stage!r} {sorted(outputs)}")
+        now = time.time()
+        assignments = "".join(f", {column} = ?" for column in outputs)
+        done = stage == STAGES[-1]
+        cursor = self._write(
+            f"UPDATE jobs SET stage = ?, lease_until = ?, updated = ?{assignments}"
+            # a finished job keeps only its rows and output
+            + (", status = 'done', finished = ?, pdf = NULL, text = NULL, facts = NULL, error = NULL"
+               if done else "")
+            + " WHERE id = ? AND worker = ? AND status = 'running'",
+            (stage, now + self.lease, now, *outputs.values(), *((now,) if done else ()), job_id, worker))
+        return cursor.rowcount == 1
+
+    def release(self, job_id: int, worker: str, error: str, delay: float = 0.0,
+                count_attempt: bool = True, max_attempts: int = MAX_ATTEMPTS) -> str:
+        """Put a job back in the queue after `delay` seconds, or fail it after max_attempts. Returns the status."""
+        now = time.time()
+        with self._lock:
+            row = self._db.execute("SELECT attempts FROM jobs WHERE id = ? AND worker = ?",
+                                   (job_id, worker)).fetchone()
+            if row is None:
+                return "lost"
+            attempts = row[0] + (1 if count_attempt else 0)
+            status = "failed" if attempts >= max_attempts else "queued"
+            self._db.execute("UPDATE jobs SET status = ?, attempts = ?, error = ?, worker = NULL, "
+                             "lease_until = NULL, not_before = ?, updated = ?, finished = ? WHERE id = ?",
+                             (status, attempts, error, now + delay, now, now if status == "failed" else None,
+                              job_id))
+        return status
+
+    def purge(self, retention: float) -> List[Optional[str]]:
+        """
+        Delete jobs that finished (done or failed) more than `retention`
+        seconds ago. Returns their output files (None for failed jobs), for
+        the caller to remove.
+        """
+        cutoff = time.time() - retention
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                outputs = [row[0] for row in self._db.execute(
+                    "SELECT output FROM jobs WHERE finished < ?", (cutoff,))]
+                self._db.execute("DELETE FROM jobs WHERE finished < ?", (cutoff,))
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        return outputs
+
+
+class _Purger:
+    """Purges expired jobs and their exported files every PURGE_INTERVAL seconds."""
+
+    def __init__(self, store: JobStore, retention: float):
+        self._store, self._retention = store, retention
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self) -> None:
+        while not self._done.wait(PURGE_INTERVAL):
+            try:
+                purge_expired(self._store, self._retention)
+            except Exception:
+                logger.exception("Purging expired jobs failed")
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._done.set()
+        self._thread.join()
+
+
+def purge_expired(store: JobStore, retention: float) -> int:
+    """Delete jobs finished more than `retention` seconds ago, with their exported files."""
+    outputs = store.purge(retention)
+    for output in outputs:
+        if output:
+            Path(output).unlink(missing_ok=True)
+    if outputs:
+        logger.info("Purged %d finished jobs older than %.0fs", len(outputs), retention)
+    return len(outputs)
+
+
+# --- WORKERS ---
+@dataclass
+class WorkerConfig:
+    db_path: str = DEFAULT_DB_PATH
+    out_dir: str = DEFAULT_OUT_DIR
+    lease: float = DEFAULT_LEASE
+    cache_dir: Optional[str] = DEFAULT_CACHE_DIR
+    backend: str = "openai"
+    api_key: Optional[str] = None
+    base_url: Optional[str] = None
+    model: str = DEFAULT_MODEL
+    use_rules: bool = True
+    span_mode: bool = False
+    max_attempts: int = MAX_ATTEMPTS
+    export_format: str = "xlsx"
+
+
+def run_job(store: JobStore, job: Job, worker: str, client, cache, config: WorkerConfig) -> bool:
+    """
+    Take a job from its last checkpoint to "exported". Returns False if the
+    lease was lost on the way.
+    """
+    stage = STAGES.index(job.stage)
+    if stage < STAGES.index("text"):
+        text = extract_text_from_pdf(store.artifact(job.id, "pdf"), workers=1)
+        if not store.checkpoint(job.id, worker, "text", text=text):
+            return False
+    if stage < STAGES.index("llm"):
+        parsed = extract_document(store.artifact(job.id, "text"), client=client, cache=cache,
+                                  use_rules=config.use_rules, chunk_workers=1, span_mode=config.span_mode)
+        if parsed is None:
+            raise RuntimeError("Model returned no parsed output")
+        if not store.checkpoint(job.id, worker, "llm", facts=parsed.model_dump_json()):
+            return False
+    if stage < STAGES.index("post"):
+        facts = DocumentStructure.model_validate_json(store.artifact(job.id, "facts")).facts
+        rows = post_process_facts(facts, store.artifact(job.id, "text"))
+        if not store.checkpoint(job.id, worker, "post", rows=json.dumps(rows)):
+            return False
+    out_path = str(Path(config.out_dir) / f"{job.id:08d}.{config.export_format}")
+    facts = DocumentStructure.model_validate_json(store.artifact(job.id, "facts")).facts
+    # a workbook gets the app's Output.xlsx columns, on a sheet named after the document
+    with open_writer(out_path, layout="sheets" if config.export_format == "xlsx" else "long") as writer:
+        writer.append(job.name, facts)
+    return store.checkpoint(job.id, worker, "exported", output=out_path)
+
+
+class _Heartbeat:
+    """Renews a job's lease every third of the lease while the job runs, so only dead workers lose jobs."""
+
+    def __init__(self, store: JobStore, job_id: int, worker: str):
+        self._store, self._job_id, self._worker = store, job_id, worker
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self) -> None:
+        while not self._done.wait(self._store.lease / 3):
+            if not self._store.renew(self._job_id, self._worker):
+                return
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._done.set()
+        self._thread.join()
+
+
+def worker_main(worker: str, config: WorkerConfig, stop) -> None:
+    """Process entry point: claim and run jobs until `stop.value` (a shared RawValue flag) is set."""
+    logging.basicConfig(level=logging.INFO, format=f"%(asctime)s %(levelname)s [{worker}] %(message)s")
+    store = JobStore(config.db_path, config.lease)
+    Path(config.out_dir).mkdir(parents=True, exist_ok=True)
+    cache = ResultCache(config.cache_dir) if config.cache_dir else None
+    # one request at a time per process; retries are the queue's job
+    client = make_backend(config.backend, api_key=config.api_key, model=config.model, base_url=config.base_url,
+                          concurrency=1, max_retries=0)
+    parent = multiprocessing.parent_process()
+    while not stop.value and (parent is None or parent.is_alive()):
+        throttled = store.throttled_for()
+        if throttled:
+            time.sleep(min(throttled, POLL_INTERVAL))
+            continue
+        job = store.claim(worker, config.max_attempts)
+        if job is None:
+            time.sleep(POLL_INTERVAL)
+            continue
+        start = time.perf_counter()
+        logger.info("Job %d (%s) from stage %s", job.id, job.name, job.stage)
+        try:
+            with _Heartbeat(store, job.id, worker):
+                finished = run_job(store, job, worker, client, cache, config)
+            if finished:
+                logger.info("Job %d done in %.1fs", job.id, time.perf_counter() - start)
+            else:
+                logger.warning("Job %d: lease lost, left to its new worker", job.id)
+        except Exception as e:
+            if isinstance(e, openai.RateLimitError) and e.code != QUOTA_EXHAUSTED:
+                delay = _retry_after_seconds(e) or 1.0 + random.random()
+                store.throttle(delay)
+                store.release(job.id, worker, f"{type(e).__name__}: {e}", delay, count_attempt=False)
+                logger.warning("Job %d: rate limited, all workers pause %.1fs", job.id, delay)
+                continue
+            # an exhausted quota is a 429 too, but waiting does not clear it: count it like any other error
+            delay = min(60.0, 2.0 ** job.attempts) if isinstance(e, RETRYABLE_ERRORS) else 0.0
+            status = store.release(job.id, worker, f"{type(e).__name__}: {e}", delay,
+                                   max_attempts=config.max_attempts)
+            logger.warning("Job %d %s after %s: %s", job.id, status, type(e).__name__, e)
+    store.close()
+
+
+class WorkerPool:
+    """Worker processes, restarted by a supervisor thread when one dies."""
+
+    def __init__(self, size: int, config: WorkerConfig):
+        self.size = size
+        self.config = config
+        self._context = multiprocessing.get_context("spawn")
+        # a lock-free flag: an Event's lock stays held forever if a worker is killed inside wait()
+        self._stop = self._context.RawValue("b", 0)
+        self._stopping = threading.Event()
+        self._processes: List[multiprocessing.Process] = []
+        self._supervisor: Optional[threading.Thread] = None
+
+    def _spawn(self, index: int) -> multiprocessing.Process:
+        process = self._context.Process(target=worker_main, args=(f"worker-{index}", self.config, self._stop),
+                                        name=f"worker-{index}", daemon=True)
+        process.start()
+        return process
+
+    def start(self) -> None:
+        self._processes = [self._spawn(i) for i in range(self.size)]
+        self._supervisor = threading.Thread(target=self._supervise, daemon=True)
+        self._supervisor.start()
+
+    def _supervise(self) -> None:
+        while not self._stopping.wait(1.0):
+            for i, process in enumerate(self._processes):
+                if not process.is_alive():
+                    logger.warning("%s exited with %s; restarting", process.name, process.exitcode)
+                    self._processes[i] = self._spawn(i)
+
+    def alive(self) -> int:
+        return sum(p.is_alive() for p in self._processes)
+
+    def stop(self, timeout: float = 30.0) -> None:
+        self._stopping.set()
+        self._stop.value = 1
+        for process in self._processes:
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+
+
+# --- HTTP ---
+_JOB_PATH = re.compile(r'^/jobs/(\d+)(/result)?$')
+
+
+def make_handler(store: JobStore, pool: Optional[WorkerPool], max_queued: int, max_upload: int):
+    workers = pool.size if pool is not None else 1
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, fmt, *args):
+            logger.debug("%s " + fmt, self.address_string(), *args)
+
+        def _json(self, status: int, body, headers: Optional[Dict[str, str]] = None) -> None:
+            data = json.dumps(body, default=str).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_POST(self):
+            url = urlparse(self.path)
+            if url.path != "/jobs":
+                return self._json(HTTPStatus.NOT_FOUND, {"error": "not found"})
+            length = int(self.headers.get("Content-Length") or 0)
+            if not length or length > max_upload:
+                self.close_connection = True
+                return self._json(HTTPStatus.REQUEST_ENTITY_TOO_LARGE if length else HTTPStatus.BAD_REQUEST,
+                                  {"error": f"send a PDF body of 1..{max_upload} bytes"})
+            pdf = self.rfile.read(length)
+            if not pdf.startswith(b"%PDF"):
+                return self._json(HTTPStatus.BAD_REQUEST, {"error": "body is not a PDF"})
+            admission = store.admit(max_queued, workers)
+            if not admission.accepted:
+                retry_after = max(1, round(admission.retry_after))
+                return self._json(HTTPStatus.TOO_MANY_REQUESTS,
+                                  {"error": admission.reason, "retry_after": retry_after},
+                                  {"Retry-After": str(retry_after)})
+            name = parse_qs(url.query).get("name", [self.headers.get("X-Filename") or "upload.pdf"])[0]
+            job_id = store.submit(name, pdf)
+            self._json(HTTPStatus.ACCEPTED, {"id": job_id, "status": "queued"},
+                       {"Location": f"/jobs/{job_id}"})
+
+        def do_GET(self):
+            path = urlparse(self.path).path
+            if path == "/metrics":
+                return self._json(HTTPStatus.OK, service_metrics(store, pool))
+            if path == "/healthz":
+                return self._json(HTTPStatus.OK, {"ok": True})
+            match = _JOB_PATH.match(path)
+            job = store.get(int(match.group(1))) if match else None
+            if job is None:
+                return self._json(HTTPStatus.NOT_FOUND, {"error": "no such job"})
+            if not match.group(2):
+                return self._json(HTTPStatus.OK, asdict(job))
+            if job.status != "done":
+                return self._json(HTTPStatus.CONFLICT, {"error": f"job is {job.status}", "stage": job.stage})
+            self._json(HTTPStatus.OK, json.loads(store.artifact(job.id, "rows")))
+
+    return Handler
+
+
+def service_metrics(store: JobStore, pool: Optional[WorkerPool] = None) -> dict:
+    return {
+        "queue": store.depth(),
+        "throughput_per_min": round(store.throughput() * 60, 2),
+        "throttled_for": round(store.throttled_for(), 2),
+        "workers_alive": pool.alive() if pool is not None else 0,
+    }
+
+
+def _interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Extraction service: HTTP job queue with worker processes.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--db", default=DEFAULT_DB_PATH, help=f"Job store (default: {DEFAULT_DB_PATH})")
+    parser.add_argument("--out-dir", default=DEFAULT_OUT_DIR,
+                        help=f"Where finished jobs are exported (default: {DEFAULT_OUT_DIR})")
+    parser.add_argument("-w", "--workers", type=int, default=4, help="Worker processes (default: 4)")
+    parser.add_argument("--max-queued", type=int, default=DEFAULT_MAX_QUEUED,
+                        help=f"Refuse submissions beyond this many waiting jobs (default: {DEFAULT_MAX_QUEUED})")
+    parser.add_argument("--max-upload-mb", type=float, default=20.0, help="Largest accepted PDF (default: 20)")
+    parser.add_argument("--lease", type=float, default=DEFAULT_LEASE,
+                        help=f"Seconds before a silent worker's job is resumed elsewhere (default: {DEFAULT_LEASE:g})")
+    parser.add_argument("--export-format", choices=EXPORT_FORMATS, default="xlsx",
+                        help="File format of each job's export (default: xlsx)")
+    parser.add_argument("--retention-hours", type=float, default=DEFAULT_RETENTION / 3600,
+                        help=f"Delete finished jobs and their exports after this long; 0 keeps them "
+                             f"(default: {DEFAULT_RETENTION / 3600:g})")
+    parser.add_argument("--max-attempts", type=int, default=MAX_ATTEMPTS,
+                        help=f"Failures before a job is given up (default: {MAX_ATTEMPTS})")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR,
+                        help=f"Result cache directory (default: {DEFAULT_CACHE_DIR})")
+    parser.add_argument("--no-cache", action="store_true", help="Always call the API, ignoring cached results")
+    parser.add_argument("--no-rules", action="store_true",
+                        help="Send every key to the LLM instead of resolving easy fields by rule first")
+    parser.add_argument("--span-mode", action="store_true",
+                        help="Have the model cite sentence/clause IDs for comments instead of copying text")
+    parser.add_argument("--api-key", default=os.environ.get("OPENAI_API_KEY"),
+                        help="OpenAI API key (default: $OPENAI_API_KEY)")
+    parser.add_argument("--backend", choices=BACKENDS, default="openai",
+                        help="Extraction backend: OpenAI, or the local stand-in server (default: openai)")
+    parser.add_argument("--base-url", default=None,
+                        help="Override the backend's API base URL (e.g. another OpenAI-compatible server)")
+    parser.add_argument("--model", default=DEFAULT_MODEL, help=f"Model name (default: {DEFAULT_MODEL})")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    if not args.api_key and args.backend == "openai":
+        parser.error("an OpenAI API key is required (--api-key or OPENAI_API_KEY)")
+
+    config = WorkerConfig(db_path=args.db, out_dir=args.out_dir, lease=args.lease,
+                          cache_dir=None if args.no_cache else args.cache_dir, backend=args.backend,
+                          api_key=args.api_key, base_url=args.base_url, model=args.model,
+                          use_rules=not args.no_rules, span_mode=args.span_mode, max_attempts=args.max_attempts,
+                          export_format=args.export_format)
+    # SIGTERM stops like Ctrl-C: workers finish their current job, then exit
+    signal.signal(signal.SIGTERM, _interrupt)
+    store = JobStore(args.db, args.lease)
+    pool = WorkerPool(args.workers, config)
+    pool.start()
+    server = ThreadingHTTPServer((args.host, args.port),
+                                 make_handler(store, pool, args.max_queued, int(args.max_upload_mb * 1024 * 1024)))
+    logger.info("Extraction service on http://%s:%d with %d workers; %s", args.host, args.port, args.workers,
+                json.dumps(service_metrics(store)["queue"]))
+    retention = args.retention_hours * 3600
+    try:
+        with _Purger(store, retention) if retention > 0 else contextlib.nullcontext():
+            server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        pool.stop()
+        store.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
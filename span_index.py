@@ -0,0 +1,234 @@
+# span_index.py
+"""
+Sentence/clause index over extracted document text.
+
+The source text is split into sentences, and long sentences into clauses at
+", and" / ", while" style joins (or, for long sentences running over
+several lines, as table-like text does, at line breaks). Every piece gets a stable ID (S4 for the
+fourth sentence, S4.2 for its second clause) and character offsets into the
+original text. In span mode the prompt shows the text with these IDs and the
+model answers a fact's context with span IDs instead of copying sentences,
+which saves most of the output tokens. The resolver rebuilds the Comments
+text from the source itself, so it can only ever be verbatim.
+
+Quotes the model still writes out are matched back to the closest run of
+spans with RapidFuzz, which again yields source text rather than the quote.
+"""
+import logging
+import re
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from rapidfuzz import fuzz, process, utils
+
+logger = logging.getLogger(__name__)
+
+# a sentence ends at . ! ? (plus closing quotes/brackets) followed by
+# whitespace, or at a blank line
+_SENTENCE_END = re.compile(r'[.!?]["\'”’)\]]*(?=\s)|\n[ \t]*\n')
+# titles and abbreviations whose period does not end a sentence
+_ABBREVIATIONS = {"st", "mr", "mrs", "ms", "dr", "prof", "jr", "sr", "no", "inc", "ltd", "co", "vs",
+                  "etc", "e.g", "i.e", "approx", "dept", "univ"}
+# a closing bracket or quote after the mark still belongs to the sentence: "(CKA!! )"
+_CLOSING = tuple(")]}\"'”’")
+_LAST_WORD = re.compile(r'([\w.]+)[.!?]["\'”’)\]]*$')
+# clause joins inside a sentence; the comma stays with the earlier clause's gap
+_CLAUSE_JOIN = re.compile(r'[,;]\s+(?=(?:and|but|while|whereas|where|which|with|making|achieving|'
+                          r'earning|including|reflecting|representing|establishing)\b)')
+# table-like text has few sentence ends; a long sentence over several lines is split by line instead
+_LONG_SENTENCE = 200
+_LINE_BREAK = re.compile(r'[ \t]*\n\s*')
+_SPAN_ID = re.compile(r'S\d+(?:\.\d+)?')
+
+DEFAULT_MIN_QUOTE_SCORE = 80.0
+
+
+def _squash(text: str) -> str:
+    """PDF text breaks lines mid-sentence; comments use single spaces."""
+    return " ".join(text.split())
+
+
+@dataclass
+class TextSpan:
+    id: str
+    start: int
+    end: int
+    text: str
+
+
+@dataclass
+class SpanIndex:
+    text: str
+    sentences: List[TextSpan] = field(default_factory=list)
+    clauses: Dict[str, List[TextSpan]] = field(default_factory=dict)
+    _by_id: Dict[str, TextSpan] = field(default_factory=dict, repr=False)
+
+    @classmethod
+    def build(cls, text: str) -> "SpanIndex":
+        index = cls(text=text)
+        for number, (start, end) in enumerate(_sentence_bounds(text), start=1):
+            sentence = TextSpan(f"S{number}", start, end, _squash(text[start:end]))
+            index.sentences.append(sentence)
+            index._by_id[sentence.id] = sentence
+            parts = _clause_bounds(text, start, end)
+            if len(parts) > 1:
+                index.clauses[sentence.id] = []
+                for i, (s, e) in enumerate(parts, start=1):
+                    clause = TextSpan(f"{sentence.id}.{i}", s, e, _squash(text[s:e]))
+                    index.clauses[sentence.id].append(clause)
+                    index._by_id[clause.id] = clause
+        return index
+
+    def __len__(self) -> int:
+        return len(self.sentences)
+
+    def get(self, span_id: str) -> Optional[TextSpan]:
+        return self._by_id.get(span_id.strip().strip("[]"))
+
+    def units(self) -> List[TextSpan]:
+        """Finest-grained spans in reading order (clauses where a sentence has them)."""
+        out = []
+        for sentence in self.sentences:
+            out.extend(self.clauses.get(sentence.id, [sentence]))
+        return out
+
+    def render(self) -> str:
+        """The text for the prompt: one sentence per line, every span prefixed by its ID."""
+        lines = []
+        for sentence in self.sentences:
+            parts = self.clauses.get(sentence.id)
+            if not parts:
+                lines.append(f"[{sentence.id}] {sentence.text}")
+                continue
+            # keep the joining punctuation between clauses visible
+            line = f"[{parts[0].id}] {parts[0].text}"
+            for prev, clause in zip(parts, parts[1:]):
+                line += f"{_squash(self.text[prev.end:clause.start])} [{clause.id}] {clause.text}"
+            lines.append(line)
+        return "\n".join(lines)
+
+    # --- RESOLUTION ---
+    def resolve(self, span_ids: Iterable[str]) -> str:
+        """
+        Verbatim source text for span IDs. Adjacent spans are joined through
+        the original text between them; separate runs are joined by a space.
+        """
+        spans = []
+        for span_id in span_ids:
+            for token in _SPAN_ID.findall(span_id or ""):
+                span = self.get(token)
+                if span is None:
+                    logger.debug("Unknown span id %r", token)
+                else:
+                    spans.append(span)
+        if not spans:
+            return ""
+        spans.sort(key=lambda s: (s.start, -s.end))
+        runs: List[Tuple[int, int]] = []
+        for span in spans:
+            if runs and _joinable(self.text[runs[-1][1]:span.start]):
+                runs[-1] = (runs[-1][0], max(runs[-1][1], span.end))
+            else:
+                runs.append((span.start, span.end))
+        return " ".join(_squash(self.text[s:e]) for s, e in runs)
+
+    def match_quote(self, quote: str, min_score: float = DEFAULT_MIN_QUOTE_SCORE) -> str:
+        """
+        Map a free-text quote to the run of adjacent spans that matches it
+        best and return that source text; "" when nothing scores min_score.
+        """
+        quote = _squash(quote or "")
+        units = self.units()
+        if not quote or not units:
+            return ""
+        texts = [u.text for u in units]
+        best = process.extractOne(quote, texts, scorer=fuzz.partial_ratio, processor=utils.default_process,
+                                  score_cutoff=min_score)
+        if best is None:
+            logger.debug("No source span matches quote %r", quote[:80])
+            return ""
+        lo = hi = best[2]
+        score = fuzz.ratio(quote, texts[lo], processor=utils.default_process)
+        # grow the run while that brings it closer to the whole quote
+        while True:
+            candidates = []
+            if lo > 0:
+                candidates.append((lo - 1, hi))
+            if hi + 1 < len(units):
+                candidates.append((lo, hi + 1))
+            scored = [(fuzz.ratio(quote, self._run_text(units, a, b), processor=utils.default_process), a, b)
+                      for a, b in candidates]
+            if not scored or max(scored)[0] <= score:
+                break
+            score, lo, hi = max(scored)
+        return _trim_to_quote(quote, self._run_text(units, lo, hi))
+
+    def _run_text(self, units: List[TextSpan], lo: int, hi: int) -> str:
+        return _squash(self.text[units[lo].start:units[hi].end])
+
+    def resolve_context(self, span_ids: Optional[Iterable[str]], quote: Optional[str] = None,
+                        min_score: float = DEFAULT_MIN_QUOTE_SCORE) -> str:
+        """Comments text for a fact: its span IDs, else its quote matched to the source."""
+        text = self.resolve(span_ids or [])
+        if text:
+            return text
+        return self.match_quote(quote, min_score) if quote and quote.strip() else ""
+
+
+def _trim_to_quote(quote: str, text: str) -> str:
+    """The part of text the quote aligns with, widened to whole words."""
+    if len(text) <= len(quote):
+        return text
+    aligned = fuzz.partial_ratio_alignment(quote, text)
+    start, end = aligned.dest_start, aligned.dest_end
+    while start > 0 and not text[start - 1].isspace():
+        start -= 1
+    while end < len(text) and not text[end].isspace():
+        end += 1
+    return text[start:end].strip()
+
+
+def _joinable(gap: str) -> bool:
+    return not gap.strip(" \t\r\n,;")
+
+
+def _sentence_bounds(text: str) -> List[Tuple[int, int]]:
+    bounds = []
+    start = 0
+    for m in _SENTENCE_END.finditer(text):
+        end = m.end() if m.group().startswith(tuple(".!?")) else m.start()
+        if text[m.start()] == ".":
+            word = _LAST_WORD.search(text, max(start, m.start() - 12), m.end())
+            if word and word.group(1).lower() in _ABBREVIATIONS:
+                continue
+        rest = text[m.end():m.end() + 40].lstrip()
+        if not m.group().startswith("\n"):
+            if rest[:1].islower() or rest[:1] in _CLOSING:
+                continue
+            # a number spaced around its decimal point, as in "cgpa ~ 7 . 9"
+            if text[m.start()] == "." and text[:m.start()].rstrip()[-1:].isdigit() and rest[:1].isdigit():
+                continue
+        _append_trimmed(bounds, text, start, end)
+        start = m.end()
+    _append_trimmed(bounds, text, start, len(text))
+    return bounds
+
+
+def _clause_bounds(text: str, start: int, end: int) -> List[Tuple[int, int]]:
+    parts = []
+    pos = start
+    joins = _LINE_BREAK if end - start > _LONG_SENTENCE and "\n" in text[start:end] else _CLAUSE_JOIN
+    for m in joins.finditer(text, start, end):
+        _append_trimmed(parts, text, pos, m.start())
+        pos = m.end()
+    _append_trimmed(parts, text, pos, end)
+    return parts
+
+
+def _append_trimmed(bounds: List[Tuple[int, int]], text: str, start: int, end: int) -> None:
+    while start < end and text[start].isspace():
+        start += 1
+    while end > start and text[end - 1].isspace():
+        end -= 1
+    if end > start:
+        bounds.append((start, end))
@@ -0,0 +1,227 @@
+# streaming.py
+"""
+Async, streaming extraction.
+
+process_with_ai waits for the whole structured response before anything can
+be shown. This module makes the same request through the streaming
+structured-output API and yields each ExtractedFact as soon as the model has
+finished writing it, so the UI can fill the preview row by row instead of
+waiting out the full GPT-4o latency.
+
+A fact in the streamed JSON is complete once the model has started the next
+one; the last fact is released when the response is done. Rule-resolved
+facts and cached results are yielded before any network call.
+
+Everything runs on asyncio, so one event loop can serve several documents
+at once over a shared AsyncOpenAI client (see extract_documents_async).
+Functions take the client as is (asked for backends.DEFAULT_MODEL) or as a
+backends.AsyncOpenAIBackend, which chooses the model (make_async_backend).
+"""
+import asyncio
+import logging
+import time
+from typing import AsyncIterator, List, Optional, Sequence, Union
+
+import httpx
+import openai
+from pydantic import ValidationError
+
+from backends import BACKENDS, DEFAULT_MODEL, LOCAL_BASE_URL, AsyncOpenAIBackend, as_async_backend
+from instrumentation import TRACER
+from pipeline import (KEY_ORDER, DocumentStructure, ExtractedFact, SpanFact, as_document,
+                      cache_lookup, extract_rule_facts, keys_to_ask, prepare_prompt, request_schema,
+                      resolve_span_fact, split_for_prompt)
+from prompts import EXTRACTION_PROMPT, PromptTemplate
+from rules import DEFAULT_MIN_CONFIDENCE
+from span_index import SpanIndex
+from token_budget import (DEFAULT_MAX_PROMPT_TOKENS, DEFAULT_OVERLAP_TOKENS, TokenReport, cached_tokens,
+                          merge_facts)
+
+logger = logging.getLogger(__name__)
+
+AsyncClient = Union[AsyncOpenAIBackend, openai.AsyncOpenAI]
+
+
+def make_async_client(api_key: Optional[str], concurrency: int = 8,
+                      base_url: Optional[str] = None) -> openai.AsyncOpenAI:
+    """
+    One async client per event loop, its HTTP pool sized to the requests in
+    flight. base_url points it at an OpenAI-compatible server instead, e.g.
+    backends.LOCAL_BASE_URL for the stand-in.
+    """
+    http_client = openai.DefaultAsyncHttpxClient(
+        limits=httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    )
+    return openai.AsyncOpenAI(api_key=api_key, base_url=base_url, http_client=http_client)
+
+
+def make_async_backend(name: str = "openai", api_key: Optional[str] = None, model: str = DEFAULT_MODEL,
+                       base_url: Optional[str] = None, concurrency: int = 8) -> AsyncOpenAIBackend:
+    """Streaming backend by name, as backends.make_backend."""
+    if name == "local":
+        # the stand-in ignores the key, but the SDK insists on one
+        api_key, base_url = api_key or "local", base_url or LOCAL_BASE_URL
+    elif name != "openai":
+        raise ValueError(f"Unknown backend {name!r}; choose from {', '.join(BACKENDS)}")
+    return AsyncOpenAIBackend(make_async_client(api_key, concurrency, base_url), model=model, name=name)
+
+
+def _as_fact(item, spans: Optional[SpanIndex] = None) -> Optional[ExtractedFact]:
+    try:
+        if spans is not None:
+            return resolve_span_fact(SpanFact.model_validate(item), spans)
+        return ExtractedFact.model_validate(item)
+    except ValidationError as e:
+        logger.warning("Skipping malformed streamed fact %r: %s", item, e)
+        return None
+
+
+# --- SINGLE REQUEST ---
+async def stream_llm_facts(text_content: str, client: AsyncClient, cache=None,
+                           keys: Optional[List[str]] = None,
+                           token_report: Optional[TokenReport] = None,
+                           stage: str = "llm", span_mode: bool = False,
+                           template: PromptTemplate = EXTRACTION_PROMPT) -> AsyncIterator[ExtractedFact]:
+    """
+    Streaming counterpart of process_with_ai: same prompt, schema and cache
+    key, but facts are yielded one at a time while the response arrives.
+    The complete result is cached once the stream ends. API errors, and a
+    response with no parsed output (e.g. a refusal), are raised.
+    """
+    keys, response_format = request_schema(keys, span_mode)
+    backend = as_async_backend(client)
+
+    cache_key, cached = cache_lookup(cache, text_content, keys, response_format, span_mode, template,
+                                     model=backend.cache_namespace)
+    if cached is not None:
+        for fact in cached.facts:
+            yield fact
+        return
+
+    spans = SpanIndex.build(text_content) if span_mode else None
+    messages = prepare_prompt(text_content, keys, token_report, spans, template)
+    wanted = None if keys is None else set(keys)
+
+    emitted = yielded = 0
+    with TRACER.stage("llm", part=stage, streamed=True) as span:
+        start = time.perf_counter()
+        async with backend.stream(messages, response_format) as stream:
+            async for event in stream:
+                if event.type != "content.delta" or not isinstance(event.parsed, dict):
+                    continue
+                # event.parsed is the partial JSON so far; every fact but the
+                # last one has been written in full
+                items = event.parsed.get("facts") or []
+                while emitted < len(items) - 1:
+                    fact = _as_fact(items[emitted], spans)
+                    emitted += 1
+                    if fact is not None and (wanted is None or fact.key in wanted):
+                        if not yielded:
+                            span.set(first_fact_ms=(time.perf_counter() - start) * 1000)
+                        yielded += 1
+                        yield fact
+            completion = await stream.get_final_completion()
+        usage = completion.usage
+        span.set(bytes_in=sum(len(m["content"]) for m in messages),
+                 bytes_out=len(completion.choices[0].message.content or ""),
+                 prompt_tokens=getattr(usage, "prompt_tokens", 0) or 0,
+                 completion_tokens=getattr(usage, "completion_tokens", 0) or 0,
+                 cached_tokens=cached_tokens(usage))
+    if token_report is not None:
+        token_report.add_usage(stage, usage)
+
+    # the whole response (every key, in the order it was streamed), then only the requested keys
+    parsed = as_document(completion.choices[0].message.parsed, None, spans)
+    if parsed is None:
+        raise RuntimeError("Model returned no parsed output")
+    for fact in parsed.facts[emitted:]:
+        if wanted is None or fact.key in wanted:
+            yield fact
+    parsed = as_document(parsed, keys)
+    if cache is not None:
+        cache.put(cache_key, parsed)
+
+
+async def _collect_llm_facts(text_content: str, client: AsyncOpenAIBackend, **kwargs) -> List[ExtractedFact]:
+    return [fact async for fact in stream_llm_facts(text_content, client, **kwargs)]
+
+
+# --- DOCUMENT ---
+async def stream_document(text_content: str, client: Optional[AsyncClient] = None,
+                          cache=None, use_rules: bool = True,
+                          min_confidence: float = DEFAULT_MIN_CONFIDENCE, offline: bool = False,
+                          max_prompt_tokens: int = DEFAULT_MAX_PROMPT_TOKENS,
+                          overlap_tokens: int = DEFAULT_OVERLAP_TOKENS, chunk_workers: int = 4,
+                          token_report: Optional[TokenReport] = None,
+                          span_mode: bool = False,
+                          template: PromptTemplate = EXTRACTION_PROMPT) -> AsyncIterator[ExtractedFact]:
+    """
+    Streaming counterpart of extract_document. Rule facts come first, then
+    the LLM's facts for the remaining keys as they are written (a rule key
+    asked for its comment comes again with the rule's value). Documents
+    that need chunking are extracted chunk-parallel and yielded after the
+    merge, since a key's winner is only known once every chunk has answered.
+    A key may be yielded more than once; as in ensure_full_coverage, the
+    last value wins.
+    """
+    rule_facts = extract_rule_facts(text_content, use_rules, min_confidence)
+    for fact in rule_facts:
+        yield fact
+
+    missing = keys_to_ask(KEY_ORDER, rule_facts, template)
+    if not missing or offline:
+        return
+    if client is None:
+        raise ValueError("an AsyncOpenAI client is required unless offline=True")
+    client = as_async_backend(client)
+
+    keys = None if len(missing) == len(KEY_ORDER) else missing
+    rules = {f.key: f for f in rule_facts}
+
+    def _with_rule_value(fact: ExtractedFact) -> ExtractedFact:
+        # the model only supplies the comment of a rule-resolved key
+        rule = rules.get(fact.key)
+        return fact if rule is None else rule.model_copy(update={"context": fact.context})
+
+    chunks = split_for_prompt(text_content, keys, max_prompt_tokens, overlap_tokens, span_mode, template)
+    options = dict(cache=cache, keys=keys, token_report=token_report, span_mode=span_mode, template=template)
+
+    if len(chunks) == 1:
+        async for fact in stream_llm_facts(text_content, client, **options):
+            if fact.key in missing:
+                yield _with_rule_value(fact)
+        return
+
+    limit = asyncio.Semaphore(chunk_workers)
+
+    async def _chunk(i: int) -> List[ExtractedFact]:
+        async with limit:
+            return await _collect_llm_facts(chunks[i], client, stage=f"llm:chunk-{i + 1}", **options)
+
+    results = await asyncio.gather(*(_chunk(i) for i in range(len(chunks))))
+    for fact in merge_facts(results):
+        if fact.key in missing:
+            yield _with_rule_value(fact)
+
+
+async def extract_document_async(text_content: str, client: Optional[AsyncClient] = None,
+                                 **options) -> DocumentStructure:
+    """Collect stream_document into a DocumentStructure (same options)."""
+    return DocumentStructure(facts=[fact async for fact in stream_document(text_content, client, **options)])
+
+
+async def extract_documents_async(texts: Sequence[str], client: Optional[AsyncClient] = None,
+                                  concurrency: int = 8,
+                                  **options) -> List[Union[DocumentStructure, BaseException]]:
+    """
+    Extract several documents concurrently on one event loop, at most
+    `concurrency` at a time. Results are in input order; a document that
+    failed has its exception in place of the result.
+    """
+    limit = asyncio.Semaphore(concurrency)
+
+    async def _one(text: str) -> DocumentStructure:
+        async with limit:
+            return await extract_document_async(text, client, **options)
+
+    return await asyncio.gather(*(_one(t) for t in texts), return_exceptions=True)
@@ -0,0 +1,198 @@
+# token_budget.py
+"""
+Token accounting and chunking for long documents.
+
+Prompts are measured with tiktoken before they are sent. A document whose
+prompt would exceed the budget is split into overlapping chunks on paragraph
+boundaries; each chunk is extracted separately and the per-chunk facts are
+merged back into one fact per key.
+"""
+import logging
+import threading
+from collections import Counter
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Dict, List, Optional, Sequence
+
+import tiktoken
+
+logger = logging.getLogger(__name__)
+
+# Input budget per request. gpt-4o accepts far more, but cost and latency grow
+# with the prompt and extraction quality drops on very long inputs.
+DEFAULT_MAX_PROMPT_TOKENS = 16_000
+DEFAULT_OVERLAP_TOKENS = 200
+
+# Used when the tokenizer files cannot be loaded (tiktoken downloads them on
+# first use); close enough for budgeting English prose.
+CHARS_PER_TOKEN = 4
+
+
+@lru_cache(maxsize=None)
+def get_encoding(model: str) -> Optional[tiktoken.Encoding]:
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        logger.warning("tiktoken encoding unavailable (%s); estimating %d chars/token", e, CHARS_PER_TOKEN)
+        return None
+
+
+def count_tokens(text: str, model: str) -> int:
+    enc = get_encoding(model)
+    if enc is None:
+        return -(-len(text) // CHARS_PER_TOKEN)
+    return len(enc.encode(text, disallowed_special=()))
+
+
+def _split_by_tokens(text: str, max_tokens: int, step: int, model: str) -> List[str]:
+    enc = get_encoding(model)
+    if enc is None:
+        size, stride = max_tokens * CHARS_PER_TOKEN, step * CHARS_PER_TOKEN
+        return [text[i:i + size] for i in range(0, len(text), stride)]
+    tokens = enc.encode(text, disallowed_special=())
+    return [enc.decode(tokens[i:i + max_tokens]) for i in range(0, len(tokens), step)]
+
+
+# --- REPORTING ---
+def cached_tokens(usage) -> int:
+    """Prompt tokens the API reports as served from its prompt cache (0 if not reported)."""
+    details = getattr(usage, "prompt_tokens_details", None)
+    return getattr(details, "cached_tokens", 0) or 0
+
+
+@dataclass
+class StageTokens:
+    prompt: int = 0
+    completion: int = 0
+    cached: int = 0
+    calls: int = 0
+
+
+@dataclass
+class TokenReport:
+    """
+    Token counts per pipeline stage. 'prompt_build' holds tiktoken estimates
+    of what was about to be sent; 'llm' stages hold the usage reported by the
+    API, including how many prompt tokens were served from the provider's
+    prompt cache. Safe to share between the threads of one chunked extraction.
+    """
+    stages: Dict[str, StageTokens] = field(default_factory=dict)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
+
+    def add(self, stage: str, prompt: int = 0, completion: int = 0, cached: int = 0) -> None:
+        with self._lock:
+            s = self.stages.setdefault(stage, StageTokens())
+            s.prompt += prompt
+            s.completion += completion
+            s.cached += cached
+            s.calls += 1
+
+    def add_usage(self, stage: str, usage) -> None:
+        if usage is not None:
+            self.add(stage, prompt=usage.prompt_tokens or 0, completion=usage.completion_tokens or 0,
+                     cached=cached_tokens(usage))
+
+    def total(self, prefix: str = "llm") -> StageTokens:
+        out = StageTokens()
+        for name, s in self.stages.items():
+            if name.startswith(prefix):
+                out.prompt += s.prompt
+                out.completion += s.completion
+                out.cached += s.cached
+                out.calls += s.calls
+        return out
+
+    def as_dict(self) -> Dict[str, dict]:
+        return {name: vars(s).copy() for name, s in self.stages.items()}
+
+
+# --- CHUNKING ---
+def _split_paragraphs(text: str) -> List[str]:
+    """Paragraphs keep their trailing newlines so joined chunks stay verbatim."""
+    parts = []
+    start = 0
+    while True:
+        idx = text.find("\n\n", start)
+        if idx == -1:
+            if start < len(text):
+                parts.append(text[start:])
+            return parts
+        end = idx + 2
+        while end < len(text) and text[end] == "\n":
+            end += 1
+        parts.append(text[start:end])
+        start = end
+
+
+def chunk_text(text: str, max_tokens: int, model: str,
+               overlap_tokens: int = DEFAULT_OVERLAP_TOKENS) -> List[str]:
+    """
+    Split text into chunks of at most max_tokens tokens. Chunks break on
+    paragraph (then line) boundaries, and each chunk repeats the last
+    ~overlap_tokens of the previous one so facts spanning a boundary are seen
+    whole at least once. Single oversized lines are cut on token boundaries.
+    """
+    if count_tokens(text, model) <= max_tokens:
+        return [text]
+
+    units = []
+    for para in _split_paragraphs(text):
+        if count_tokens(para, model) <= max_tokens:
+            units.append(para)
+            continue
+        for line in para.splitlines(keepends=True):
+            if count_tokens(line, model) <= max_tokens:
+                units.append(line)
+            else:
+                units.extend(_split_by_tokens(line, max_tokens, max(1, max_tokens - overlap_tokens), model))
+    sizes = [count_tokens(u, model) for u in units]
+
+    chunks = []
+    i = 0
+    while i < len(units):
+        j, used = i, 0
+        while j < len(units) and used + sizes[j] <= max_tokens:
+            used += sizes[j]
+            j += 1
+        j = max(j, i + 1)
+        chunks.append("".join(units[i:j]))
+        if j >= len(units):
+            break
+        # step back over trailing units to build the overlap, always making progress
+        back, k = 0, j
+        while k - 1 > i and back + sizes[k - 1] <= overlap_tokens:
+            k -= 1
+            back += sizes[k]
+        i = k
+    return chunks
+
+
+# --- MERGING ---
+def merge_facts(chunk_facts: Sequence[Sequence]) -> List:
+    """
+    Merge per-chunk fact lists (in chunk order) into one fact per key.
+
+    Conflict resolution per key:
+    1. non-empty values beat empty ones;
+    2. the value reported by the most chunks wins (overlaps repeat facts);
+    3. ties go to the candidate with a context, then to the earliest chunk.
+    """
+    candidates: Dict[str, list] = {}
+    for chunk_idx, facts in enumerate(chunk_facts):
+        for fact in facts:
+            candidates.setdefault(fact.key, []).append((chunk_idx, fact))
+
+    merged = []
+    for key, cands in candidates.items():
+        votes = Counter((f.value or "").strip() for _, f in cands if (f.value or "").strip())
+
+        def score(item):
+            chunk_idx, f = item
+            value = (f.value or "").strip()
+            return (bool(value), votes[value] if value else 0, bool((f.context or "").strip()), -chunk_idx)
+
+        merged.append(max(cands, key=score)[1])
+    return merged